@@ -0,0 +1,251 @@
+#!/home/ruifrvaz/.venvs/rag/bin/python3
+"""
+Step 10: Embedding Backend Benchmark
+Purpose: Compare query embedding latency, throughput and retrieval agreement of torch fp32, ONNX and ONNX int8
+Usage: ./10_embedding_backends.py [--backends torch onnx-int8] [--corpus-size 1000] [--repeat 20]
+
+Process:
+  1. Load chunk texts from Step 1 (chunks_latest.json, first --corpus-size chunks)
+  2. Per backend (torch first - it is the fp32 reference):
+     - Load time (ONNX export / int8 quantization happen once and are cached)
+     - Single-query latency: each test query encoded alone (batch 1, like the
+       RAG proxy under light load), --repeat times
+     - Throughput: corpus chunks encoded in batches of --batch-size
+  3. Agreement with fp32 on the corpus: per-chunk cosine (min / 1st percentile / mean)
+  4. Retrieval agreement: test queries searched (exact cosine) against the
+     fp32 corpus embeddings - the index the collection holds - with the
+     backend's query vectors; overlap of their top-k with fp32's top-k
+  5. Save results to test_results/ folder (JSON format)
+
+Interpretation:
+  - Speedup = torch mean query latency / backend mean query latency
+  - Top-k overlap 1.0 = identical retrieved chunks, i.e. no retrieval regression
+  - Min cosine below the RAG proxy's --min-agreement (default 0.97) means the
+    proxy would refuse this backend for a collection built with fp32
+
+Output:
+  - test_results/embedding_backends_YYYYMMDD_HHMMSS.json (timestamped)
+  - test_results/embedding_backends_latest.json (always latest)
+
+Dependencies:
+  - sentence-transformers[onnx]: Embedding backends (optimum + onnxruntime for ONNX)
+
+Requirements:
+  - Chunks exist: setup/1_ingest.py
+
+Note: Uses RAG virtual environment at ~/.venvs/rag
+"""
+
+import argparse
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+from datetime import datetime
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from utils.embedders import (
+    EMBEDDING_BACKENDS, EMBEDDING_MODEL, MIN_AGREEMENT, cosine_agreement, load_embedding_model
+)
+
+# Directories
+CHUNKS_DIR = Path(__file__).parent.parent / "chunks"
+TEST_RESULTS_DIR = Path(__file__).parent / "test_results"
+TEST_RESULTS_DIR.mkdir(exist_ok=True)
+
+# Writing-assistant style queries (what the RAG proxy embeds per request)
+TEST_QUERIES = [
+    "What are Elena's personality traits?",
+    "Describe the Arcturian homeworld atmosphere",
+    "How does the FTL drive work?",
+    "What does the bridge of the Prometheus look like?",
+    "What happened in the battle at the outer colonies?",
+    "Continue the scene where Elena confronts the admiral",
+    "What languages do the Arcturians speak?",
+    "Summarize the political structure of the Federation",
+]
+
+
+def load_corpus(chunks_file, corpus_size):
+    """First corpus_size chunk texts from Step 1"""
+    with open(chunks_file, 'r', encoding='utf-8') as f:
+        chunks = json.load(f)['chunks']
+    texts = [chunk['content'] for chunk in chunks[:corpus_size]]
+    print(f"[OK] Loaded {len(texts)} chunks from {chunks_file.name}")
+    return texts
+
+
+def measure_backend(backend, corpus, repeat, batch_size):
+    """Load time, single-query latency, corpus throughput and embeddings for one backend"""
+    print(f"\n[{backend}] Loading...")
+    start = time.perf_counter()
+    embedder = load_embedding_model(EMBEDDING_MODEL, backend)
+    load_s = time.perf_counter() - start
+
+    # Warm-up (lazy initialization, thread pools)
+    embedder.encode(TEST_QUERIES[:2], convert_to_numpy=True)
+
+    latencies = []
+    for _ in range(repeat):
+        for query in TEST_QUERIES:
+            start = time.perf_counter()
+            embedder.encode([query], convert_to_numpy=True)
+            latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+
+    start = time.perf_counter()
+    corpus_embeddings = embedder.encode(corpus, batch_size=batch_size, convert_to_numpy=True)
+    throughput_s = time.perf_counter() - start
+    query_embeddings = embedder.encode(TEST_QUERIES, convert_to_numpy=True)
+
+    result = {
+        "backend": backend,
+        "load_s": load_s,
+        "query_mean_ms": statistics.mean(latencies),
+        "query_p50_ms": latencies[len(latencies) // 2],
+        "query_p95_ms": latencies[int(0.95 * (len(latencies) - 1))],
+        "chunks_per_s": len(corpus) / throughput_s
+    }
+    print(f"[{backend}] load {load_s:.1f}s, query mean {result['query_mean_ms']:.1f} ms "
+          f"(p95 {result['query_p95_ms']:.1f}), {result['chunks_per_s']:.1f} chunks/s")
+    return result, corpus_embeddings, query_embeddings
+
+
+def top_k_ids(index, query_embeddings, top_k):
+    """Exact cosine top-k rows per query"""
+    index = index / np.linalg.norm(index, axis=1, keepdims=True)
+    queries = query_embeddings / np.linalg.norm(query_embeddings, axis=1, keepdims=True)
+    scores = queries @ index.T
+    return [set(np.argsort(-row)[:top_k].tolist()) for row in scores]
+
+
+def save_results(results):
+    """Save benchmark results to JSON file"""
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    results_file = TEST_RESULTS_DIR / f"embedding_backends_{timestamp}.json"
+
+    with open(results_file, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+
+    latest_file = TEST_RESULTS_DIR / "embedding_backends_latest.json"
+    with open(latest_file, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+
+    print(f"\n[SAVE] Results saved to: {results_file}")
+    print(f"[SAVE] Latest results: {latest_file}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare embedding backends: latency, throughput, agreement")
+    parser.add_argument(
+        "--backends",
+        type=str,
+        nargs="+",
+        choices=EMBEDDING_BACKENDS,
+        default=EMBEDDING_BACKENDS,
+        help=f"Backends to compare; torch is always run as the fp32 reference (default: {' '.join(EMBEDDING_BACKENDS)})"
+    )
+    parser.add_argument(
+        "--chunks-file",
+        type=str,
+        default=str(CHUNKS_DIR / "chunks_latest.json"),
+        help="Chunks JSON file (default: chunks_latest.json)"
+    )
+    parser.add_argument(
+        "--corpus-size",
+        type=int,
+        default=1000,
+        help="Chunks used for throughput, agreement and retrieval (default: 1000)"
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=20,
+        help="Timed passes over the test queries per backend (default: 20)"
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=32,
+        help="Batch size for corpus throughput (default: 32, same as Step 2)"
+    )
+    parser.add_argument(
+        "--top-k",
+        type=int,
+        default=5,
+        help="Retrieval depth for top-k overlap (default: 5)"
+    )
+
+    args = parser.parse_args()
+    backends = ["torch"] + [b for b in dict.fromkeys(args.backends) if b != "torch"]
+
+    print("━" * 80)
+    print("Step 10: Embedding Backend Benchmark")
+    print("━" * 80)
+    print(f"Timestamp: {datetime.now()}")
+    print(f"Embedding model: {EMBEDDING_MODEL}")
+    print(f"Backends: {', '.join(backends)}")
+    print("")
+
+    chunks_file = Path(args.chunks_file)
+    if not chunks_file.exists():
+        print(f"[ERROR] Chunks file not found: {chunks_file}")
+        print(f"[INFO] Run setup/1_ingest.py first")
+        return
+    corpus = load_corpus(chunks_file, args.corpus_size)
+
+    results = []
+    reference = None
+    for backend in backends:
+        try:
+            result, corpus_embeddings, query_embeddings = measure_backend(
+                backend, corpus, args.repeat, args.batch_size
+            )
+        except ImportError as e:
+            print(f"[WARN] {backend} unavailable ({e}) - pip install \"sentence-transformers[onnx]\"")
+            continue
+        if reference is None:
+            reference = (corpus_embeddings, top_k_ids(corpus_embeddings, query_embeddings, args.top_k))
+        fp32_corpus, fp32_top_k = reference
+        result["agreement"] = cosine_agreement(corpus_embeddings, fp32_corpus)
+        overlaps = [len(found & expected) / args.top_k
+                    for found, expected in zip(top_k_ids(fp32_corpus, query_embeddings, args.top_k), fp32_top_k)]
+        result["top_k_overlap"] = statistics.mean(overlaps)
+        results.append(result)
+
+    if not results:
+        return
+    torch_ms = results[0]["query_mean_ms"]
+    print("\n" + "━" * 80)
+    print(f"Comparison (single-query latency, {args.corpus_size} chunks, top-{args.top_k})")
+    print("━" * 80)
+    print(f"{'Backend':<11} {'Query (ms)':>10} {'p95 (ms)':>9} {'Speedup':>8} {'Chunks/s':>9} "
+          f"{'Min cos':>8} {'Mean cos':>9} {'Top-k overlap':>14}")
+    for r in results:
+        print(f"{r['backend']:<11} {r['query_mean_ms']:>10.1f} {r['query_p95_ms']:>9.1f} "
+              f"{torch_ms / r['query_mean_ms']:>7.1f}x {r['chunks_per_s']:>9.1f} "
+              f"{r['agreement']['min']:>8.4f} {r['agreement']['mean']:>9.4f} {r['top_k_overlap']:>14.3f}")
+        if r["agreement"]["min"] < MIN_AGREEMENT:
+            print(f"[WARN] {r['backend']}: min cosine below {MIN_AGREEMENT} - the RAG proxy would refuse it")
+
+    save_results({
+        "timestamp": datetime.now().isoformat(),
+        "embedding_model": EMBEDDING_MODEL,
+        "corpus_size": len(corpus),
+        "repeat": args.repeat,
+        "batch_size": args.batch_size,
+        "top_k": args.top_k,
+        "results": results
+    })
+
+    print("\n" + "━" * 80)
+    print("[COMPLETE] Embedding backend benchmark complete!")
+    print("━" * 80)
+    print("")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,15 +2,24 @@
 """
 Step 3: Test Retrieval Quality
 Purpose: Run test queries and validate retrieval accuracy
-Usage: ./3_test_retrieval.py [--collection my_docs] [--interactive]
+Usage: ./3_test_retrieval.py [--collection my_docs] [--interactive] [--backend exact]
 
 Process:
   1. Load ChromaDB collection from Step 2
-  2. Initialize same embedding model (bge-large-en-v1.5)
+  2. Initialize same embedding model (bge-large-en-v1.5) and verify it against
+     the collection's embedding fingerprint (stops on a model/dimension mismatch
+     or if stored chunk embeddings are not reproduced)
   3. Run test queries or interactive mode
-  4. Display results with similarity scores
+  4. Display results with similarity scores and search latency
   5. Save test results to test_results/ folder (JSON format)
 
+Search backends (--backend):
+  - chroma: ChromaDB collection query (HNSW + SQLite)
+  - exact:  In-memory matrix, exact top-k
+  - mmap:   Exact top-k over the memory-mapped embedding store (Step 2)
+  With exact/mmap, Chroma is also queried for each test query so latency
+  and top-k agreement are reported side by side
+
 Output:
   - test_results/retrieval_test_YYYYMMDD_HHMMSS.json (timestamped)
   - test_results/retrieval_test_latest.json (always latest)
@@ -24,20 +33,27 @@ Note: Uses RAG virtual environment at ~/.venvs/rag
 
 import argparse
 import json
+import statistics
+import sys
 from pathlib import Path
 from datetime import datetime
-from sentence_transformers import SentenceTransformer
 import chromadb
 from chromadb.config import Settings
 
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from utils.aliases import resolve_alias
+from utils.embedders import (
+    EMBEDDING_BACKENDS, EMBEDDING_MODEL, AgreementError, FingerprintError, embedding_fingerprint,
+    load_embedding_model, verify_fingerprint
+)
+from utils.vector_index import BACKENDS, load_index, timed_query
+
 # Directories
 CHROMA_DIR = Path(__file__).parent.parent / "chroma_db"
+STORE_DIR = Path(__file__).parent.parent / "embeddings"
 TEST_RESULTS_DIR = Path(__file__).parent / "test_results"
 TEST_RESULTS_DIR.mkdir(exist_ok=True)
 
-# Embedding model (must match Step 2)
-EMBEDDING_MODEL = "BAAI/bge-large-en-v1.5"
-
 
 def load_vector_store(persist_dir, collection_name):
     """Load ChromaDB client and collection"""
@@ -56,7 +72,7 @@ def load_vector_store(persist_dir, collection_name):
     )
     
     try:
-        collection = client.get_collection(name=collection_name)
+        collection = client.get_collection(name=resolve_alias(persist_dir, collection_name))
         count = collection.count()
         print(f"[OK] Collection loaded - {count} chunks")
         return client, collection
@@ -66,16 +82,35 @@ def load_vector_store(persist_dir, collection_name):
         return client, None
 
 
-def create_embedder():
-    """Load embedding model (must match Step 2)"""
-    print(f"\n[EMBED] Loading model: {EMBEDDING_MODEL}")
-    embedder = SentenceTransformer(EMBEDDING_MODEL)
+def create_embedder(backend="torch"):
+    """Load embedding model on the given backend"""
+    print(f"\n[EMBED] Loading model: {EMBEDDING_MODEL} ({backend})")
+    embedder = load_embedding_model(EMBEDDING_MODEL, backend)
     print(f"[OK] Model loaded")
     return embedder
 
 
-def test_retrieval(collection, embedder, query, top_k=5):
-    """Test retrieval with a query and return results"""
+def verify_embedder(collection, embedder, backend):
+    """Check the query embedder against the collection's embedding fingerprint (report or None)"""
+    try:
+        report = verify_fingerprint(collection, embedder, embedding_fingerprint(embedder, EMBEDDING_MODEL, backend))
+    except (FingerprintError, AgreementError) as e:
+        print(f"[ERROR] {e}")
+        return None
+    if report["status"] == "match":
+        print(f"[OK] Embedding fingerprint matches: {report['stored']}")
+    elif report["status"] == "unverified":
+        print(f"[WARN] Embedded with {report['stored']}, queries use {report['query']} - "
+              f"unverified: {report['reason']}")
+    else:
+        agreement = report["agreement"]
+        print(f"[OK] Embeddings agree with {report['stored']}: min cosine {agreement['min']:.4f} "
+              f"over {agreement['texts']} chunks")
+    return report
+
+
+def test_retrieval(index, embedder, query, top_k=5, reference=None):
+    """Test retrieval with a query and return results with search timings"""
     print(f"\n{'─' * 80}")
     print(f"Query: {query}")
     print(f"{'─' * 80}")
@@ -84,10 +119,19 @@ def test_retrieval(collection, embedder, query, top_k=5):
     query_embedding = embedder.encode([query])[0]
     
     # Search
-    results = collection.query(
-        query_embeddings=[query_embedding.tolist()],
-        n_results=top_k
-    )
+    results, search_ms = timed_query(index, query_embedding, top_k)
+    timing = {"search_ms": search_ms}
+    
+    # Same query on the reference backend (Chroma) for side-by-side comparison
+    if reference is not None:
+        reference_results, reference_ms = timed_query(reference, query_embedding, top_k)
+        overlap = len(set(results['ids'][0]) & set(reference_results['ids'][0]))
+        timing["reference_search_ms"] = reference_ms
+        timing["reference_overlap"] = overlap
+        print(f"[TIME] Search: {search_ms:.2f} ms | chroma: {reference_ms:.2f} ms "
+              f"| top-{top_k} agreement: {overlap}/{len(results['ids'][0])}")
+    else:
+        print(f"[TIME] Search: {search_ms:.2f} ms")
     
     # Display results
     if not results['documents'][0]:
@@ -117,10 +161,10 @@ def test_retrieval(collection, embedder, query, top_k=5):
             "full_content": doc
         })
     
-    return retrieved_results
+    return {"results": retrieved_results, **timing}
 
 
-def run_test_queries(collection, embedder, top_k=5):
+def run_test_queries(collection, embedder, top_k=5, index=None, backend="chroma", embedding_backend="torch"):
     """Run a set of test queries and log results"""
     # Define test queries based on science fiction worldbuilding content
     test_queries = [
@@ -140,17 +184,27 @@ def run_test_queries(collection, embedder, top_k=5):
         "timestamp": datetime.now().isoformat(),
         "collection": collection.name,
         "embedding_model": EMBEDDING_MODEL,
+        "embedding_backend": embedding_backend,
+        "backend": backend,
         "top_k": top_k,
         "total_queries": len(test_queries),
         "queries": []
     }
     
+    index = index if index is not None else collection
+    reference = collection if index is not collection else None
+    
+    # Warm-up query (first search pays one-time initialization costs)
+    timed_query(index, embedder.encode([test_queries[0]])[0], top_k)
+    if reference is not None:
+        timed_query(reference, embedder.encode([test_queries[0]])[0], top_k)
+    
     for query in test_queries:
-        results = test_retrieval(collection, embedder, query, top_k)
-        if results:
+        retrieval = test_retrieval(index, embedder, query, top_k, reference)
+        if retrieval:
             test_results["queries"].append({
                 "query": query,
-                "results": results
+                **retrieval
             })
     
     print("\n" + "━" * 80)
@@ -199,12 +253,23 @@ def print_test_statistics(test_results):
         print(f"   Worst (max): {max_distance:.4f}")
         print(f"   Total retrievals: {len(all_distances)}")
     
+    search_times = [q["search_ms"] for q in test_results["queries"]]
+    reference_times = [q["reference_search_ms"] for q in test_results["queries"] if "reference_search_ms" in q]
+    backend = test_results.get("backend", "chroma")
+    if search_times:
+        print(f"\nSearch Latency (median / max):")
+        print(f"   {backend:<8} {statistics.median(search_times):8.2f} ms / {max(search_times):8.2f} ms")
+        if reference_times:
+            print(f"   {'chroma':<8} {statistics.median(reference_times):8.2f} ms / {max(reference_times):8.2f} ms")
+            agreement = [q["reference_overlap"] for q in test_results["queries"]]
+            print(f"   Top-K agreement with chroma: {sum(agreement)}/{len(agreement) * test_results['top_k']}")
+    
     print(f"\nQueries tested: {test_results['total_queries']}")
     print(f"Collection: {test_results['collection']}")
     print(f"Top-K per query: {test_results['top_k']}")
 
 
-def interactive_mode(collection, embedder, top_k=5):
+def interactive_mode(index, embedder, top_k=5):
     """Interactive query mode"""
     print("\n" + "━" * 80)
     print("Interactive Mode - Enter queries (type 'quit' to exit)")
@@ -221,7 +286,7 @@ def interactive_mode(collection, embedder, top_k=5):
                 print("[INFO] Exiting interactive mode")
                 break
             
-            test_retrieval(collection, embedder, query, top_k)
+            test_retrieval(index, embedder, query, top_k)
             
         except KeyboardInterrupt:
             print("\n[INFO] Exiting interactive mode")
@@ -249,6 +314,27 @@ def main():
         action="store_true",
         help="Run in interactive mode"
     )
+    parser.add_argument(
+        "--backend",
+        type=str,
+        choices=BACKENDS,
+        default="chroma",
+        help="Search backend: chroma (HNSW), exact (in-memory matrix) or mmap (embedding store file) (default: chroma)"
+    )
+    parser.add_argument(
+        "--index-dtype",
+        type=str,
+        choices=["float32", "float16"],
+        default="float32",
+        help="Exact backend matrix dtype (default: float32)"
+    )
+    parser.add_argument(
+        "--embedding-backend",
+        type=str,
+        choices=EMBEDDING_BACKENDS,
+        default="torch",
+        help="Query embedding backend: torch (fp32), onnx, onnx-int8 (default: torch)"
+    )
     
     args = parser.parse_args()
     
@@ -259,6 +345,7 @@ def main():
     print(f"Embedding model: {EMBEDDING_MODEL}")
     print(f"Collection: {args.collection}")
     print(f"Top-K: {args.top_k}")
+    print(f"Backend: {args.backend}")
     print("")
     
     # Load vector store
@@ -267,15 +354,21 @@ def main():
     if not collection:
         return
     
+    # Load search backend
+    index = load_index(collection, args.backend, args.index_dtype, STORE_DIR)
+    
     # Load embedder
-    embedder = create_embedder()
+    embedder = create_embedder(args.embedding_backend)
+    if verify_embedder(collection, embedder, args.embedding_backend) is None:
+        return
     
     if args.interactive:
         # Interactive mode
-        interactive_mode(collection, embedder, args.top_k)
+        interactive_mode(index, embedder, args.top_k)
     else:
         # Run test queries and log results
-        test_results = run_test_queries(collection, embedder, args.top_k)
+        test_results = run_test_queries(collection, embedder, args.top_k, index, args.backend,
+                                        args.embedding_backend)
         
         # Print statistics
         print_test_statistics(test_results)
@@ -2,14 +2,16 @@
 """
 Step 4: RAG Query Pipeline
 Purpose: Complete RAG workflow - retrieve context and generate answers with vLLM
-Usage: ./4_query.py "Your question here" [--collection scifi_world] [--interactive]
+Usage: ./4_query.py "Your question here" [--collection scifi_world] [--interactive] [--backend exact] [--context-tokens 1000] [--mmr]
 
 Process:
   1. Check vLLM server availability (localhost:8000)
   2. Load ChromaDB collection from Step 2
-  3. Load embedding model (bge-large-en-v1.5)
-  4. Retrieve top-K relevant chunks using semantic search
-  5. Format chunks as context (max 4000 chars)
+  3. Load embedding model (bge-large-en-v1.5) and verify it against the
+     collection's embedding fingerprint (stops on a mismatch)
+  4. Retrieve top-K relevant chunks using semantic search (--backend chroma|exact|mmap),
+     optionally re-selected from --mmr-candidates with maximal marginal relevance (--mmr)
+  5. Format chunks as context within a token budget (per-chunk token counts from Step 2)
   6. Query vLLM with context + user question
   7. Display answer, sources, distances, and token usage
   8. Save query results to query_results/ folder (JSON format)
@@ -36,20 +38,31 @@ Note: Uses RAG virtual environment at ~/.venvs/rag
 import argparse
 import json
 import sys
+import time
 from pathlib import Path
 from datetime import datetime
-from sentence_transformers import SentenceTransformer
 import chromadb
 from chromadb.config import Settings
 from openai import OpenAI
 
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from utils.aliases import resolve_alias
+from utils.context import select_within_budget
+from utils.embedders import (
+    EMBEDDING_BACKENDS, EMBEDDING_MODEL, AgreementError, FingerprintError, embedding_fingerprint,
+    load_embedding_model, verify_fingerprint
+)
+from utils.mmr import MMR_CANDIDATES, MMR_LAMBDA, mmr_select, select_results
+from utils.vector_index import BACKENDS, backend_name, load_index, timed_query
+
 # Directories
 CHROMA_DIR = Path(__file__).parent.parent / "chroma_db"
+STORE_DIR = Path(__file__).parent.parent / "embeddings"
 QUERY_RESULTS_DIR = Path(__file__).parent / "query_results"
 QUERY_RESULTS_DIR.mkdir(exist_ok=True)
 
-# Embedding model (must match Step 2)
-EMBEDDING_MODEL = "BAAI/bge-large-en-v1.5"
+# Context token budget (~4000 chars)
+CONTEXT_TOKENS = 1000
 
 # vLLM server configuration
 VLLM_BASE_URL = "http://localhost:8000/v1"
@@ -89,7 +102,7 @@ def load_vector_store(persist_dir, collection_name):
     )
     
     try:
-        collection = client.get_collection(name=collection_name)
+        collection = client.get_collection(name=resolve_alias(persist_dir, collection_name))
         print(f"[OK] Collection loaded - {collection.count()} chunks")
         return client, collection
     except Exception as e:
@@ -97,58 +110,87 @@ def load_vector_store(persist_dir, collection_name):
         return client, None
 
 
-def create_embedder():
-    """Load embedding model (must match Step 2)"""
-    print(f"[EMBED] Loading model: {EMBEDDING_MODEL}")
-    embedder = SentenceTransformer(EMBEDDING_MODEL)
+def create_embedder(backend="torch"):
+    """Load embedding model on the given backend"""
+    print(f"[EMBED] Loading model: {EMBEDDING_MODEL} ({backend})")
+    embedder = load_embedding_model(EMBEDDING_MODEL, backend)
     print(f"[OK] Model loaded")
     return embedder
 
 
-def retrieve_chunks(collection, embedder, query, top_k=5):
-    """Retrieve most relevant chunks"""
+def verify_embedder(collection, embedder, backend):
+    """Check the query embedder against the collection's embedding fingerprint (report or None)"""
+    try:
+        report = verify_fingerprint(collection, embedder, embedding_fingerprint(embedder, EMBEDDING_MODEL, backend))
+    except (FingerprintError, AgreementError) as e:
+        print(f"[ERROR] {e}")
+        return None
+    if report["status"] == "match":
+        print(f"[OK] Embedding fingerprint matches: {report['stored']}")
+    elif report["status"] == "unverified":
+        print(f"[WARN] Embedded with {report['stored']}, queries use {report['query']} - "
+              f"unverified: {report['reason']}")
+    else:
+        agreement = report["agreement"]
+        print(f"[OK] Embeddings agree with {report['stored']}: min cosine {agreement['min']:.4f} "
+              f"over {agreement['texts']} chunks")
+    return report
+
+
+def retrieve_chunks(index, embedder, query, top_k=5, mmr_candidates=None, mmr_lambda=MMR_LAMBDA):
+    """Retrieve most relevant chunks (MMR re-selected from mmr_candidates if given)"""
     print(f"\n[RETRIEVE] Searching for relevant chunks...")
     print(f"   Query: {query}")
     print(f"   Top-K: {top_k}")
+    print(f"   Backend: {backend_name(index)}")
     
     # Generate query embedding
     query_embedding = embedder.encode([query])[0]
     
     # Search
-    results = collection.query(
-        query_embeddings=[query_embedding.tolist()],
-        n_results=top_k
-    )
+    mmr_ms = None
+    if mmr_candidates:
+        candidates, search_ms = timed_query(index, query_embedding, max(mmr_candidates, top_k), include_embeddings=True)
+        mmr_start = time.perf_counter()
+        rows = mmr_select(query_embedding, candidates['embeddings'][0], top_k, mmr_lambda)
+        results = select_results(candidates, rows)
+        mmr_ms = (time.perf_counter() - mmr_start) * 1000
+    else:
+        results, search_ms = timed_query(index, query_embedding, top_k)
     
     if not results['documents'][0]:
         print("[WARN] No results found")
         return None
     
-    print(f"[OK] Retrieved {len(results['documents'][0])} chunks")
+    print(f"[OK] Retrieved {len(results['documents'][0])} chunks in {search_ms:.2f} ms")
+    if mmr_ms is not None:
+        print(f"[OK] MMR selected {len(rows)} of {len(candidates['documents'][0])} candidates "
+              f"in {mmr_ms:.3f} ms (lambda {mmr_lambda})")
     
     return {
         "documents": results['documents'][0],
         "distances": results['distances'][0],
-        "metadatas": results['metadatas'][0]
+        "metadatas": results['metadatas'][0],
+        "backend": backend_name(index),
+        "search_ms": search_ms,
+        "mmr_ms": mmr_ms
     }
 
 
-def format_context(retrieved, max_length=4000):
-    """Format retrieved chunks into context string"""
-    context_parts = []
-    current_length = 0
+def format_context(retrieved, max_tokens=CONTEXT_TOKENS):
+    """Format retrieved chunks into context string (within a token budget)"""
+    selected, context_tokens = select_within_budget(
+        retrieved['documents'], retrieved['metadatas'], max_tokens
+    )
     
-    for i, (doc, metadata) in enumerate(zip(retrieved['documents'], retrieved['metadatas']), 1):
-        source = metadata.get('source', 'unknown')
-        chunk_text = f"[Source {i}: {source}]\n{doc}\n"
-        chunk_length = len(chunk_text)
-        
-        if current_length + chunk_length > max_length:
-            break
-        
-        context_parts.append(chunk_text)
-        current_length += chunk_length
+    context_parts = []
+    for i, row in enumerate(selected, 1):
+        source = retrieved['metadatas'][row].get('source', 'unknown')
+        context_parts.append(f"[Source {i}: {source}]\n{retrieved['documents'][row]}\n")
     
+    print(f"[CONTEXT] {len(selected)}/{len(retrieved['documents'])} chunks, "
+          f"{context_tokens} tokens (budget: {max_tokens})")
+    retrieved['context_tokens'] = context_tokens
     return "\n".join(context_parts)
 
 
@@ -203,6 +245,10 @@ def save_query_result(query, result, collection_name, model_name, retrieved):
         "collection": collection_name,
         "embedding_model": EMBEDDING_MODEL,
         "llm_model": model_name,
+        "backend": retrieved.get("backend", "chroma"),
+        "search_ms": retrieved.get("search_ms"),
+        "mmr_ms": retrieved.get("mmr_ms"),
+        "context_tokens": retrieved.get("context_tokens"),
         "query": query,
         "answer": result["answer"],
         "usage": result["usage"],
@@ -213,6 +259,7 @@ def save_query_result(query, result, collection_name, model_name, retrieved):
                 "source": metadata.get("source", "unknown"),
                 "chunk_index": metadata.get("chunk_index"),
                 "length": len(doc),
+                "tokens": metadata.get("tokens"),
                 "content": doc
             }
             for i, (doc, distance, metadata) in enumerate(zip(
@@ -236,7 +283,8 @@ def save_query_result(query, result, collection_name, model_name, retrieved):
     print(f"\n[SAVED] Query result: {timestamped_file.name}")
 
 
-def rag_query(query, collection, embedder, model_name, collection_name, top_k=5, temperature=0.7, max_tokens=500):
+def rag_query(query, index, embedder, model_name, collection_name, top_k=5, temperature=0.7, max_tokens=500,
+              context_tokens=CONTEXT_TOKENS, mmr_candidates=None, mmr_lambda=MMR_LAMBDA):
     """Complete RAG pipeline"""
     print("\n" + "━" * 80)
     print("RAG Query Pipeline")
@@ -245,14 +293,14 @@ def rag_query(query, collection, embedder, model_name, collection_name, top_k=5,
     print("")
     
     # 1. Retrieve
-    retrieved = retrieve_chunks(collection, embedder, query, top_k)
+    retrieved = retrieve_chunks(index, embedder, query, top_k, mmr_candidates, mmr_lambda)
     
     if not retrieved:
         print("[ERROR] No relevant context found")
         return None
     
     # 2. Format context
-    context = format_context(retrieved)
+    context = format_context(retrieved, context_tokens)
     
     # 3. Query LLM
     response = query_vllm(query, context, model_name, temperature, max_tokens)
@@ -332,11 +380,55 @@ def main():
         default=800,
         help="Max tokens in response (default: 800)"
     )
+    parser.add_argument(
+        "--context-tokens",
+        type=int,
+        default=CONTEXT_TOKENS,
+        help=f"Context token budget for retrieved chunks (default: {CONTEXT_TOKENS})"
+    )
+    parser.add_argument(
+        "--mmr",
+        action="store_true",
+        help="Re-select chunks with maximal marginal relevance (drops near-duplicate neighbours)"
+    )
+    parser.add_argument(
+        "--mmr-candidates",
+        type=int,
+        default=MMR_CANDIDATES,
+        help=f"Candidates fetched before MMR re-selection (default: {MMR_CANDIDATES})"
+    )
+    parser.add_argument(
+        "--mmr-lambda",
+        type=float,
+        default=MMR_LAMBDA,
+        help=f"MMR relevance/diversity trade-off, 1.0 = plain top-k (default: {MMR_LAMBDA})"
+    )
     parser.add_argument(
         "--interactive",
         action="store_true",
         help="Interactive query mode"
     )
+    parser.add_argument(
+        "--backend",
+        type=str,
+        choices=BACKENDS,
+        default="chroma",
+        help="Search backend: chroma (HNSW), exact (in-memory matrix) or mmap (embedding store file) (default: chroma)"
+    )
+    parser.add_argument(
+        "--index-dtype",
+        type=str,
+        choices=["float32", "float16"],
+        default="float32",
+        help="Exact backend matrix dtype (default: float32)"
+    )
+    parser.add_argument(
+        "--embedding-backend",
+        type=str,
+        choices=EMBEDDING_BACKENDS,
+        default="torch",
+        help="Query embedding backend: torch (fp32), onnx, onnx-int8 (default: torch)"
+    )
     
     args = parser.parse_args()
     
@@ -357,8 +449,13 @@ def main():
     if not collection:
         return
     
+    # Load search backend
+    index = load_index(collection, args.backend, args.index_dtype, STORE_DIR)
+    
     # Load embedder
-    embedder = create_embedder()
+    embedder = create_embedder(args.embedding_backend)
+    if verify_embedder(collection, embedder, args.embedding_backend) is None:
+        return
     
     # Query or interactive mode
     if args.interactive:
@@ -378,8 +475,9 @@ def main():
                     break
                 
                 rag_query(
-                    query, collection, embedder, model_name, args.collection,
-                    args.top_k, args.temperature, args.max_tokens
+                    query, index, embedder, model_name, args.collection,
+                    args.top_k, args.temperature, args.max_tokens, args.context_tokens,
+                    args.mmr_candidates if args.mmr else None, args.mmr_lambda
                 )
                 
             except KeyboardInterrupt:
@@ -391,8 +489,9 @@ def main():
     elif args.query:
         # Single query
         rag_query(
-            args.query, collection, embedder, model_name, args.collection,
-            args.top_k, args.temperature, args.max_tokens
+            args.query, index, embedder, model_name, args.collection,
+            args.top_k, args.temperature, args.max_tokens, args.context_tokens,
+            args.mmr_candidates if args.mmr else None, args.mmr_lambda
         )
         
         print("\n[TIP] Run with --interactive for multiple queries")
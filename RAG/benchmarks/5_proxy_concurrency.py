@@ -0,0 +1,291 @@
+#!/home/ruifrvaz/.venvs/rag/bin/python3
+"""
+Step 5: RAG Proxy Concurrency Benchmark
+Purpose: Compare aggregate throughput through the RAG proxy vs hitting vLLM directly
+Usage: ./5_proxy_concurrency.py [--concurrency 9] [--requests 18] [--max-tokens 200] [--no-context]
+
+Process:
+  1. Detect model served by vLLM (localhost:8000)
+  2. Fire N chat requests with C in flight at once against vLLM directly
+  3. Repeat the same load against the RAG proxy (localhost:8001)
+  4. Report wall time, aggregate tokens/sec, requests/sec and latency percentiles
+  5. Save results to test_results/ folder (JSON format)
+
+Interpretation:
+  - Overlap ratio = (sum of request latencies) / wall time
+    ~1.0 means requests were serialized; ~C means they fully overlapped
+  - Proxy/direct throughput ratio close to 1.0 means the proxy does not
+    limit vLLM's continuous batching (MAX_SEQS in serve_vllm.sh)
+  - By default only proxied requests carry RAG context, so their prompts are
+    longer (more prefill per request) and the ratio mixes proxy overhead with
+    the cost of the context itself; a ratio below 1.0 alone does not mean
+    the event loop is blocked
+  - --no-context sends max_context_tokens 0 to the proxy: it still embeds and
+    searches each query but injects no context, so both runs send identical
+    prompts and the ratio isolates the proxy's own overhead
+  - With proxy admission control (serve_rag_proxy.py --admission), overload
+    shows up as fast 429 rejections (reported separately, with Retry-After)
+    instead of growing latency for every request
+
+Output:
+  - test_results/proxy_concurrency_YYYYMMDD_HHMMSS.json (timestamped)
+  - test_results/proxy_concurrency_latest.json (always latest)
+
+Dependencies:
+  - httpx: Async HTTP client
+
+Requirements:
+  - vLLM server running: cd .. && ./serve_vllm.sh
+  - RAG proxy running: cd .. && ./serve_rag_proxy.sh
+
+Note: Uses RAG virtual environment at ~/.venvs/rag
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from pathlib import Path
+from datetime import datetime
+
+import httpx
+
+# Directories
+TEST_RESULTS_DIR = Path(__file__).parent / "test_results"
+TEST_RESULTS_DIR.mkdir(exist_ok=True)
+
+# Server configuration
+DIRECT_URL = "http://localhost:8000/v1"
+PROXY_URL = "http://localhost:8001/v1"
+
+# Prompts rotated across requests (worldbuilding queries exercise retrieval)
+PROMPTS = [
+    "Describe the Arcturian homeworld atmosphere in one paragraph.",
+    "What are Elena's personality traits? Answer briefly.",
+    "Explain how the FTL drive works in simple terms.",
+    "Write a short scene aboard the Prometheus bridge.",
+    "Summarize what happened in the previous chapter.",
+]
+
+
+def detect_model(base_url):
+    """Detect the model served by vLLM"""
+    try:
+        response = httpx.get(f"{base_url}/models", timeout=5.0)
+        model_name = response.json()["data"][0]["id"]
+        print(f"[OK] vLLM server running - Model: {model_name}")
+        return model_name
+    except Exception as e:
+        print(f"[ERROR] vLLM server not responding: {e}")
+        print(f"[INFO] Start server: cd .. && ./serve_vllm.sh")
+        return None
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+async def send_request(client, semaphore, base_url, model_name, prompt, max_tokens, extra=None):
+    """Send one chat completion (extra: additional request fields) and measure latency"""
+    async with semaphore:
+        start = time.perf_counter()
+        try:
+            response = await client.post(
+                f"{base_url}/chat/completions",
+                json={
+                    "model": model_name,
+                    "messages": [{"role": "user", "content": prompt}],
+                    "max_tokens": max_tokens,
+                    "temperature": 0.7,
+                    **(extra or {})
+                }
+            )
+            elapsed = time.perf_counter() - start
+            if response.status_code == 429:
+                return {
+                    "ok": False,
+                    "rejected": True,
+                    "latency": elapsed,
+                    "retry_after": response.headers.get("Retry-After"),
+                    "error": "429 Too Many Requests"
+                }
+            response.raise_for_status()
+            usage = response.json().get("usage", {})
+            return {
+                "ok": True,
+                "latency": elapsed,
+                "completion_tokens": usage.get("completion_tokens", 0)
+            }
+        except Exception as e:
+            return {"ok": False, "latency": time.perf_counter() - start, "error": str(e)}
+
+
+async def run_load(label, base_url, model_name, num_requests, concurrency, max_tokens, extra=None):
+    """Run concurrent load against one endpoint"""
+    print(f"\n[LOAD] {label}: {base_url}")
+    print(f"   Requests: {num_requests} (concurrency: {concurrency})")
+
+    semaphore = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(limits=limits, timeout=httpx.Timeout(600.0)) as client:
+        start = time.perf_counter()
+        results = await asyncio.gather(*[
+            send_request(client, semaphore, base_url, model_name, PROMPTS[i % len(PROMPTS)], max_tokens, extra)
+            for i in range(num_requests)
+        ])
+        wall_time = time.perf_counter() - start
+
+    successes = [r for r in results if r["ok"]]
+    rejected = [r for r in results if r.get("rejected")]
+    latencies = [r["latency"] for r in successes]
+    total_tokens = sum(r["completion_tokens"] for r in successes)
+
+    summary = {
+        "target": label,
+        "base_url": base_url,
+        "requests": num_requests,
+        "succeeded": len(successes),
+        "failed": num_requests - len(successes) - len(rejected),
+        "rejected": len(rejected),
+        "rejection_latency_p95_s": percentile([r["latency"] for r in rejected], 95),
+        "wall_time_s": wall_time,
+        "completion_tokens": total_tokens,
+        "tokens_per_sec": total_tokens / wall_time if wall_time else 0.0,
+        "requests_per_sec": len(successes) / wall_time if wall_time else 0.0,
+        "latency_p50_s": percentile(latencies, 50),
+        "latency_p95_s": percentile(latencies, 95),
+        "overlap_ratio": sum(latencies) / wall_time if wall_time else 0.0,
+        "errors": [r["error"] for r in results if not r["ok"] and not r.get("rejected")][:5]
+    }
+
+    print(f"[OK] {summary['succeeded']}/{num_requests} succeeded in {wall_time:.2f}s")
+    print(f"   Throughput: {summary['tokens_per_sec']:.1f} tok/s, {summary['requests_per_sec']:.2f} req/s")
+    print(f"   Latency: p50 {summary['latency_p50_s']:.2f}s, p95 {summary['latency_p95_s']:.2f}s")
+    print(f"   Overlap ratio: {summary['overlap_ratio']:.2f} (max {concurrency})")
+    if rejected:
+        print(f"   Rejected (429): {len(rejected)}, p95 {summary['rejection_latency_p95_s'] * 1000:.0f} ms, "
+              f"Retry-After {rejected[0]['retry_after']}s")
+    if summary["errors"]:
+        print(f"[WARN] First error: {summary['errors'][0]}")
+
+    return summary
+
+
+def save_results(results):
+    """Save benchmark results to JSON file"""
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    results_file = TEST_RESULTS_DIR / f"proxy_concurrency_{timestamp}.json"
+
+    with open(results_file, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+
+    latest_file = TEST_RESULTS_DIR / "proxy_concurrency_latest.json"
+    with open(latest_file, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+
+    print(f"\n[SAVE] Results saved to: {results_file}")
+    print(f"[SAVE] Latest results: {latest_file}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare RAG proxy vs direct vLLM throughput under concurrent load")
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=9,
+        help="Requests in flight at once (default: 9, matches MAX_SEQS)"
+    )
+    parser.add_argument(
+        "--requests",
+        type=int,
+        default=18,
+        help="Total requests per target (default: 18)"
+    )
+    parser.add_argument(
+        "--max-tokens",
+        type=int,
+        default=200,
+        help="Max tokens per response (default: 200)"
+    )
+    parser.add_argument(
+        "--direct-url",
+        type=str,
+        default=DIRECT_URL,
+        help=f"vLLM base URL (default: {DIRECT_URL})"
+    )
+    parser.add_argument(
+        "--proxy-url",
+        type=str,
+        default=PROXY_URL,
+        help=f"RAG proxy base URL (default: {PROXY_URL})"
+    )
+    parser.add_argument(
+        "--no-context",
+        action="store_true",
+        help="Proxy retrieves but injects no context (max_context_tokens 0), so both runs send identical prompts"
+    )
+
+    args = parser.parse_args()
+
+    print("━" * 80)
+    print("Step 5: RAG Proxy Concurrency Benchmark")
+    print("━" * 80)
+    print(f"Timestamp: {datetime.now()}")
+    print(f"Proxy context: {'none (identical prompts)' if args.no_context else 'retrieved (longer proxy prompts)'}")
+    print("")
+
+    model_name = detect_model(args.direct_url)
+    if not model_name:
+        return
+
+    direct = asyncio.run(run_load(
+        "direct", args.direct_url, model_name, args.requests, args.concurrency, args.max_tokens
+    ))
+    proxy = asyncio.run(run_load(
+        "proxy", args.proxy_url, model_name, args.requests, args.concurrency, args.max_tokens,
+        {"max_context_tokens": 0} if args.no_context else None
+    ))
+
+    throughput_ratio = proxy["tokens_per_sec"] / direct["tokens_per_sec"] if direct["tokens_per_sec"] else 0.0
+
+    print("\n" + "━" * 80)
+    print("Comparison")
+    print("━" * 80)
+    print(f"{'Target':<10} {'Wall (s)':>10} {'tok/s':>10} {'req/s':>8} {'p50 (s)':>9} {'p95 (s)':>9} {'Overlap':>8}")
+    for summary in (direct, proxy):
+        print(f"{summary['target']:<10} {summary['wall_time_s']:>10.2f} {summary['tokens_per_sec']:>10.1f} "
+              f"{summary['requests_per_sec']:>8.2f} {summary['latency_p50_s']:>9.2f} "
+              f"{summary['latency_p95_s']:>9.2f} {summary['overlap_ratio']:>8.2f}")
+    print(f"\nProxy/direct throughput ratio: {throughput_ratio:.2f}")
+    if not args.no_context:
+        print("[INFO] Proxied prompts include RAG context (longer prefill) - "
+              "run with --no-context to compare identical prompts")
+    if proxy["overlap_ratio"] < 1.5 and args.concurrency > 1:
+        print("[WARN] Proxy requests barely overlapped - check for event loop blocking")
+
+    save_results({
+        "timestamp": datetime.now().isoformat(),
+        "model": model_name,
+        "concurrency": args.concurrency,
+        "requests": args.requests,
+        "max_tokens": args.max_tokens,
+        "no_context": args.no_context,
+        "direct": direct,
+        "proxy": proxy,
+        "proxy_direct_throughput_ratio": throughput_ratio
+    })
+
+    print("\n" + "━" * 80)
+    print("[COMPLETE] Concurrency benchmark complete!")
+    print("━" * 80)
+    print("")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,292 @@
+#!/home/ruifrvaz/.venvs/rag/bin/python3
+"""
+Step 6: RAG Proxy Streaming Overhead Benchmark
+Purpose: Measure per-token latency added by the RAG proxy on streaming responses
+Usage: ./6_streaming_overhead.py [--runs 5] [--max-tokens 200] [--no-context]
+
+Process:
+  1. Detect model served by vLLM (localhost:8000)
+  2. Stream the same prompts from vLLM directly and through the RAG proxy (localhost:8001),
+     alternating targets so both see the same GPU conditions
+     (--no-context adds a third target: the proxy with max_context_tokens 0)
+  3. Record arrival time of every SSE event
+  4. Report time-to-first-token (TTFT) and inter-token latency (ITL) per target,
+     plus the proxy's Server-Timing breakdown (embed, search, assemble, upstream_ttfb)
+  5. Save results to test_results/ folder (JSON format)
+
+Interpretation:
+  - ITL overhead = proxy mean ITL - direct mean ITL (target: < 1 ms)
+  - TTFT overhead includes retrieval (embedding + vector search) and the
+    extra prefill of the injected context, so it is expected to be larger
+  - --no-context also streams through the proxy with max_context_tokens 0:
+    it still runs retrieval (the query embedding is usually an embedding cache
+    hit, since the RAG stream just embedded it) but injects nothing, so the
+    prompt matches the direct one and that TTFT overhead is the proxy's own
+
+Output:
+  - test_results/streaming_overhead_YYYYMMDD_HHMMSS.json (timestamped)
+  - test_results/streaming_overhead_latest.json (always latest)
+
+Dependencies:
+  - httpx: Async HTTP client
+
+Requirements:
+  - vLLM server running: cd .. && ./serve_vllm.sh
+  - RAG proxy running: cd .. && ./serve_rag_proxy.sh
+
+Note: Uses RAG virtual environment at ~/.venvs/rag
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from pathlib import Path
+from datetime import datetime
+
+import httpx
+
+# Directories
+TEST_RESULTS_DIR = Path(__file__).parent / "test_results"
+TEST_RESULTS_DIR.mkdir(exist_ok=True)
+
+# Server configuration
+DIRECT_URL = "http://localhost:8000/v1"
+PROXY_URL = "http://localhost:8001/v1"
+
+PROMPTS = [
+    "Write a short scene aboard the Prometheus bridge.",
+    "Describe the Arcturian homeworld atmosphere.",
+    "Continue the story: Elena stepped into the airlock.",
+]
+
+
+def parse_server_timing(header):
+    """Parse a Server-Timing header into {name: duration_ms}"""
+    entries = {}
+    for entry in header.split(","):
+        name, _, params = entry.strip().partition(";")
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "dur" and name:
+                entries[name] = float(value)
+    return entries
+
+
+def detect_model(base_url):
+    """Detect the model served by vLLM"""
+    try:
+        response = httpx.get(f"{base_url}/models", timeout=5.0)
+        model_name = response.json()["data"][0]["id"]
+        print(f"[OK] vLLM server running - Model: {model_name}")
+        return model_name
+    except Exception as e:
+        print(f"[ERROR] vLLM server not responding: {e}")
+        print(f"[INFO] Start server: cd .. && ./serve_vllm.sh")
+        return None
+
+
+async def stream_once(client, base_url, model_name, prompt, max_tokens, extra=None):
+    """Stream one completion (extra: additional request fields) and record SSE event arrival times"""
+    payload = {
+        "model": model_name,
+        "messages": [{"role": "user", "content": prompt}],
+        "max_tokens": max_tokens,
+        "temperature": 0.7,
+        "stream": True,
+        **(extra or {})
+    }
+
+    start = time.perf_counter()
+    arrivals = []
+    async with client.stream("POST", f"{base_url}/chat/completions", json=payload) as response:
+        response.raise_for_status()
+        server_timing = parse_server_timing(response.headers.get("server-timing", ""))
+        async for line in response.aiter_lines():
+            if line.startswith("data: ") and line != "data: [DONE]":
+                arrivals.append(time.perf_counter())
+
+    if not arrivals:
+        return None
+
+    gaps = [b - a for a, b in zip(arrivals, arrivals[1:])]
+    return {
+        "ttft_ms": (arrivals[0] - start) * 1000,
+        "itl_ms": [g * 1000 for g in gaps],
+        "events": len(arrivals),
+        "total_ms": (arrivals[-1] - start) * 1000,
+        "server_timing_ms": server_timing
+    }
+
+
+def summarize(label, runs):
+    """Aggregate TTFT and ITL across runs"""
+    ttfts = [r["ttft_ms"] for r in runs]
+    itls = [gap for r in runs for gap in r["itl_ms"]]
+    itls_sorted = sorted(itls)
+    stages = list(dict.fromkeys(name for r in runs for name in r["server_timing_ms"]))
+
+    return {
+        "target": label,
+        "runs": len(runs),
+        "events": sum(r["events"] for r in runs),
+        "ttft_mean_ms": statistics.mean(ttfts) if ttfts else 0.0,
+        "ttft_median_ms": statistics.median(ttfts) if ttfts else 0.0,
+        "itl_mean_ms": statistics.mean(itls) if itls else 0.0,
+        "itl_median_ms": statistics.median(itls) if itls else 0.0,
+        "itl_p95_ms": itls_sorted[int(0.95 * (len(itls_sorted) - 1))] if itls else 0.0,
+        "server_timing_mean_ms": {
+            name: statistics.mean(r["server_timing_ms"].get(name, 0.0) for r in runs) for name in stages
+        }
+    }
+
+
+async def run_benchmark(direct_url, proxy_url, model_name, num_runs, max_tokens, no_context=False):
+    """Alternate direct and proxy streams (plus context-free proxy streams), collecting timings"""
+    targets = [("direct", direct_url, None), ("proxy", proxy_url, None)]
+    if no_context:
+        targets.append(("proxy_nc", proxy_url, {"max_context_tokens": 0}))
+    results = {label: [] for label, _, _ in targets}
+
+    async with httpx.AsyncClient(timeout=httpx.Timeout(600.0)) as client:
+        # Warm up both paths (connection setup, proxy embedder, vLLM graphs)
+        for base_url in (direct_url, proxy_url):
+            await stream_once(client, base_url, model_name, PROMPTS[0], 8)
+
+        for run in range(num_runs):
+            prompt = PROMPTS[run % len(PROMPTS)]
+            for label, base_url, extra in targets:
+                timing = await stream_once(client, base_url, model_name, prompt, max_tokens, extra)
+                if timing:
+                    results[label].append(timing)
+                    print(f"   [{run + 1}/{num_runs}] {label:<8} TTFT {timing['ttft_ms']:8.1f} ms, "
+                          f"{timing['events']} events")
+
+    return results
+
+
+def save_results(results):
+    """Save benchmark results to JSON file"""
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    results_file = TEST_RESULTS_DIR / f"streaming_overhead_{timestamp}.json"
+
+    with open(results_file, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+
+    latest_file = TEST_RESULTS_DIR / "streaming_overhead_latest.json"
+    with open(latest_file, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+
+    print(f"\n[SAVE] Results saved to: {results_file}")
+    print(f"[SAVE] Latest results: {latest_file}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure per-token streaming overhead added by the RAG proxy")
+    parser.add_argument(
+        "--runs",
+        type=int,
+        default=5,
+        help="Streams per target (default: 5)"
+    )
+    parser.add_argument(
+        "--max-tokens",
+        type=int,
+        default=200,
+        help="Max tokens per stream (default: 200)"
+    )
+    parser.add_argument(
+        "--direct-url",
+        type=str,
+        default=DIRECT_URL,
+        help=f"vLLM base URL (default: {DIRECT_URL})"
+    )
+    parser.add_argument(
+        "--proxy-url",
+        type=str,
+        default=PROXY_URL,
+        help=f"RAG proxy base URL (default: {PROXY_URL})"
+    )
+    parser.add_argument(
+        "--no-context",
+        action="store_true",
+        help="Also stream through the proxy with max_context_tokens 0 (same prompt as direct)"
+    )
+
+    args = parser.parse_args()
+
+    print("━" * 80)
+    print("Step 6: RAG Proxy Streaming Overhead Benchmark")
+    print("━" * 80)
+    print(f"Timestamp: {datetime.now()}")
+    print("")
+
+    model_name = detect_model(args.direct_url)
+    if not model_name:
+        return
+
+    print(f"\n[STREAM] Running {args.runs} streams per target...")
+    raw = asyncio.run(run_benchmark(
+        args.direct_url, args.proxy_url, model_name, args.runs, args.max_tokens, args.no_context
+    ))
+
+    direct = summarize("direct", raw["direct"])
+    proxy = summarize("proxy", raw["proxy"])
+    itl_overhead = proxy["itl_mean_ms"] - direct["itl_mean_ms"]
+    ttft_overhead = proxy["ttft_median_ms"] - direct["ttft_median_ms"]
+    proxy_nc = summarize("proxy_nc", raw["proxy_nc"]) if args.no_context else None
+    if proxy_nc:
+        itl_overhead_nc = proxy_nc["itl_mean_ms"] - direct["itl_mean_ms"]
+        ttft_overhead_nc = proxy_nc["ttft_median_ms"] - direct["ttft_median_ms"]
+
+    print("\n" + "━" * 80)
+    print("Comparison")
+    print("━" * 80)
+    print(f"{'Target':<10} {'TTFT med (ms)':>14} {'ITL mean (ms)':>14} {'ITL med (ms)':>13} {'ITL p95 (ms)':>13}")
+    for summary in (direct, proxy, proxy_nc):
+        if summary is None:
+            continue
+        print(f"{summary['target']:<10} {summary['ttft_median_ms']:>14.1f} {summary['itl_mean_ms']:>14.2f} "
+              f"{summary['itl_median_ms']:>13.2f} {summary['itl_p95_ms']:>13.2f}")
+    for summary in (proxy, proxy_nc):
+        if summary and summary["server_timing_mean_ms"]:
+            breakdown = ", ".join(f"{name} {ms:.1f} ms" for name, ms in summary["server_timing_mean_ms"].items())
+            print(f"\n{summary['target']} Server-Timing (mean): {breakdown}")
+    print(f"\nPer-token overhead (ITL): {itl_overhead:+.3f} ms")
+    print(f"TTFT overhead (retrieval + context prefill): {ttft_overhead:+.1f} ms")
+    if proxy_nc:
+        print(f"Per-token overhead without context (ITL): {itl_overhead_nc:+.3f} ms")
+        print(f"TTFT overhead without context (retrieval + relay): {ttft_overhead_nc:+.1f} ms")
+    else:
+        print("[INFO] Run with --no-context to separate relay cost from context prefill")
+    if itl_overhead > 1.0:
+        print("[WARN] Proxy adds more than 1 ms per token")
+
+    results = {
+        "timestamp": datetime.now().isoformat(),
+        "model": model_name,
+        "runs": args.runs,
+        "max_tokens": args.max_tokens,
+        "no_context": args.no_context,
+        "direct": direct,
+        "proxy": proxy,
+        "itl_overhead_ms": itl_overhead,
+        "ttft_overhead_ms": ttft_overhead
+    }
+    if proxy_nc:
+        results.update({
+            "proxy_no_context": proxy_nc,
+            "itl_overhead_no_context_ms": itl_overhead_nc,
+            "ttft_overhead_no_context_ms": ttft_overhead_nc
+        })
+    save_results(results)
+
+    print("\n" + "━" * 80)
+    print("[COMPLETE] Streaming overhead benchmark complete!")
+    print("━" * 80)
+    print("")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,310 @@
+#!/home/ruifrvaz/.venvs/rag/bin/python3
+"""
+Step 7: Prefix Cache Replay Benchmark
+Purpose: Compare vLLM prefix-cache reuse and TTFT for the proxy's context layouts
+Usage: ./7_prefix_cache_replay.py [--turns 8] [--max-tokens 150]
+
+Process:
+  1. Detect model served by vLLM (localhost:8000)
+  2. Replay the same multi-turn writing session through the RAG proxy (localhost:8001)
+     once per context layout ("system" and "latest"), interleaving turns so both
+     sessions see the same GPU conditions; each session has a unique system prompt
+     so the two never share cached prefixes
+  3. Scrape vLLM /metrics around every request for prefix-cache hits/queries
+  4. Report per-layout prefix-cache hit rate and TTFT (first turn vs later turns)
+  5. Save results to test_results/ folder (JSON format)
+
+Interpretation:
+  - "system" inserts the retrieved context near the start of the prompt, so each
+    new turn invalidates the cached prefix and the whole history is prefilled again
+  - "latest" keeps the system prompt and earlier turns byte-identical; hit rate
+    should approach (history tokens / prompt tokens) and later-turn TTFT should
+    stay flat as the conversation grows
+
+Output:
+  - test_results/prefix_cache_replay_YYYYMMDD_HHMMSS.json (timestamped)
+  - test_results/prefix_cache_replay_latest.json (always latest)
+
+Dependencies:
+  - httpx: Async HTTP client
+
+Requirements:
+  - vLLM server running with prefix caching (default in vLLM V1): cd .. && ./serve_vllm.sh
+  - RAG proxy running: cd .. && ./serve_rag_proxy.sh
+
+Note: Uses RAG virtual environment at ~/.venvs/rag
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+import uuid
+from pathlib import Path
+from datetime import datetime
+
+import httpx
+
+# Directories
+TEST_RESULTS_DIR = Path(__file__).parent / "test_results"
+TEST_RESULTS_DIR.mkdir(exist_ok=True)
+
+# Server configuration
+DIRECT_URL = "http://localhost:8000/v1"
+PROXY_URL = "http://localhost:8001/v1"
+METRICS_URL = "http://localhost:8000/metrics"
+
+LAYOUTS = ["system", "latest"]
+
+# Prefix-cache counters (token counts); names differ across vLLM versions
+PREFIX_HITS_METRICS = ["vllm:prefix_cache_hits_total", "vllm:gpu_prefix_cache_hits_total"]
+PREFIX_QUERIES_METRICS = ["vllm:prefix_cache_queries_total", "vllm:gpu_prefix_cache_queries_total"]
+
+SYSTEM_PROMPT = """You are a co-author on a long-form science fiction novel.
+Keep characters, technology and worldbuilding consistent with earlier chapters.
+Write in close third person, past tense, with concrete sensory detail."""
+
+SESSION = [
+    "Who is Captain Elena and what drives her?",
+    "Describe the bridge of the Prometheus as she first sees it.",
+    "What do the Arcturians look like up close?",
+    "Write the opening lines of her first contact with an Arcturian envoy.",
+    "How does the ship's FTL drive work, in a way Elena would explain it?",
+    "Continue the scene: the envoy asks about Earth's history.",
+    "What political tensions exist between the colonies?",
+    "End the chapter with a cliffhanger involving the FTL drive.",
+    "Summarize the chapter so far in three sentences.",
+    "Suggest a title for the next chapter.",
+]
+
+
+def detect_model(base_url):
+    """Detect the model served by vLLM"""
+    try:
+        response = httpx.get(f"{base_url}/models", timeout=5.0)
+        model_name = response.json()["data"][0]["id"]
+        print(f"[OK] vLLM server running - Model: {model_name}")
+        return model_name
+    except Exception as e:
+        print(f"[ERROR] vLLM server not responding: {e}")
+        print(f"[INFO] Start server: cd .. && ./serve_vllm.sh")
+        return None
+
+
+def parse_counter(metrics_text, names):
+    """Sum a Prometheus counter over all label sets (first name present wins)"""
+    for name in names:
+        values = [
+            float(line.rsplit(" ", 1)[1])
+            for line in metrics_text.splitlines()
+            if line.startswith(name) and line[len(name):len(name) + 1] in ("{", " ")
+        ]
+        if values:
+            return sum(values)
+    return None
+
+
+async def prefix_cache_counters(client, metrics_url):
+    """Current (hits, queries) prefix-cache token counters, or None if not exposed"""
+    try:
+        response = await client.get(metrics_url, timeout=5.0)
+        hits = parse_counter(response.text, PREFIX_HITS_METRICS)
+        queries = parse_counter(response.text, PREFIX_QUERIES_METRICS)
+    except Exception:
+        return None
+    if hits is None or queries is None:
+        return None
+    return hits, queries
+
+
+async def stream_turn(client, proxy_url, model_name, messages, layout, max_tokens):
+    """Stream one chat turn through the proxy; returns TTFT and the reply text"""
+    payload = {
+        "model": model_name,
+        "messages": messages,
+        "max_tokens": max_tokens,
+        "temperature": 0.0,
+        "stream": True,
+        "context_layout": layout
+    }
+
+    start = time.perf_counter()
+    ttft = None
+    reply = []
+    async with client.stream("POST", f"{proxy_url}/chat/completions", json=payload) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if not line.startswith("data: ") or line == "data: [DONE]":
+                continue
+            if ttft is None:
+                ttft = time.perf_counter() - start
+            choices = json.loads(line[6:]).get("choices") or [{}]
+            reply.append(choices[0].get("delta", {}).get("content") or "")
+
+    return {"ttft_ms": (ttft or 0.0) * 1000, "reply": "".join(reply)}
+
+
+async def run_benchmark(proxy_url, metrics_url, model_name, layouts, num_turns, max_tokens):
+    """Replay the session once per layout, interleaving turns"""
+    results = {layout: [] for layout in layouts}
+    histories = {
+        # Unique tag per session: the two layouts never share a cached prefix
+        layout: [{"role": "system", "content": f"[Session {uuid.uuid4().hex[:8]}]\n{SYSTEM_PROMPT}"}]
+        for layout in layouts
+    }
+
+    async with httpx.AsyncClient(timeout=httpx.Timeout(600.0)) as client:
+        for turn in range(num_turns):
+            question = SESSION[turn % len(SESSION)]
+            for layout in layouts:
+                messages = histories[layout] + [{"role": "user", "content": question}]
+                before = await prefix_cache_counters(client, metrics_url)
+                timing = await stream_turn(client, proxy_url, model_name, messages, layout, max_tokens)
+                after = await prefix_cache_counters(client, metrics_url)
+
+                hits = queries = None
+                if before and after:
+                    hits, queries = after[0] - before[0], after[1] - before[1]
+                results[layout].append({
+                    "turn": turn + 1,
+                    "ttft_ms": timing["ttft_ms"],
+                    "prefix_cache_hit_tokens": hits,
+                    "prefix_cache_query_tokens": queries
+                })
+
+                # Client keeps its own history (without injected context), like Continue.dev
+                histories[layout] = messages + [{"role": "assistant", "content": timing["reply"]}]
+
+                hit_rate = f"{hits / queries:6.1%}" if queries else "   N/A"
+                print(f"   [turn {turn + 1}/{num_turns}] {layout:<7} TTFT {timing['ttft_ms']:8.1f} ms, "
+                      f"prefix cache hit rate {hit_rate}")
+
+    return results
+
+
+def summarize(layout, turns):
+    """Aggregate TTFT and prefix-cache hit rate for one layout"""
+    later = [t["ttft_ms"] for t in turns[1:]]
+    hits = [t["prefix_cache_hit_tokens"] for t in turns if t["prefix_cache_hit_tokens"] is not None]
+    queries = [t["prefix_cache_query_tokens"] for t in turns if t["prefix_cache_query_tokens"] is not None]
+    later_hits = [t["prefix_cache_hit_tokens"] for t in turns[1:] if t["prefix_cache_hit_tokens"] is not None]
+    later_queries = [t["prefix_cache_query_tokens"] for t in turns[1:] if t["prefix_cache_query_tokens"] is not None]
+
+    return {
+        "layout": layout,
+        "turns": len(turns),
+        "first_turn_ttft_ms": turns[0]["ttft_ms"] if turns else 0.0,
+        "later_turns_ttft_mean_ms": statistics.mean(later) if later else 0.0,
+        "later_turns_ttft_median_ms": statistics.median(later) if later else 0.0,
+        "prefix_cache_hit_rate": sum(hits) / sum(queries) if sum(queries) else None,
+        "later_turns_prefix_cache_hit_rate": sum(later_hits) / sum(later_queries) if sum(later_queries) else None,
+        "per_turn": turns
+    }
+
+
+def save_results(results):
+    """Save benchmark results to JSON file"""
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    results_file = TEST_RESULTS_DIR / f"prefix_cache_replay_{timestamp}.json"
+
+    with open(results_file, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+
+    latest_file = TEST_RESULTS_DIR / "prefix_cache_replay_latest.json"
+    with open(latest_file, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+
+    print(f"\n[SAVE] Results saved to: {results_file}")
+    print(f"[SAVE] Latest results: {latest_file}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare prefix-cache reuse and TTFT across RAG context layouts")
+    parser.add_argument(
+        "--turns",
+        type=int,
+        default=8,
+        help=f"Conversation turns per layout (default: 8, script has {len(SESSION)})"
+    )
+    parser.add_argument(
+        "--max-tokens",
+        type=int,
+        default=150,
+        help="Max tokens per reply (default: 150)"
+    )
+    parser.add_argument(
+        "--layouts",
+        type=str,
+        nargs="+",
+        choices=LAYOUTS,
+        default=LAYOUTS,
+        help="Context layouts to compare (default: system latest)"
+    )
+    parser.add_argument(
+        "--direct-url",
+        type=str,
+        default=DIRECT_URL,
+        help=f"vLLM base URL (default: {DIRECT_URL})"
+    )
+    parser.add_argument(
+        "--metrics-url",
+        type=str,
+        default=METRICS_URL,
+        help=f"vLLM Prometheus metrics URL (default: {METRICS_URL})"
+    )
+    parser.add_argument(
+        "--proxy-url",
+        type=str,
+        default=PROXY_URL,
+        help=f"RAG proxy base URL (default: {PROXY_URL})"
+    )
+
+    args = parser.parse_args()
+
+    print("━" * 80)
+    print("Step 7: Prefix Cache Replay Benchmark")
+    print("━" * 80)
+    print(f"Timestamp: {datetime.now()}")
+    print("")
+
+    model_name = detect_model(args.direct_url)
+    if not model_name:
+        return
+
+    print(f"\n[REPLAY] {args.turns} turns per layout: {', '.join(args.layouts)}")
+    raw = asyncio.run(run_benchmark(
+        args.proxy_url, args.metrics_url, model_name, args.layouts, args.turns, args.max_tokens
+    ))
+    summaries = {layout: summarize(layout, turns) for layout, turns in raw.items()}
+
+    print("\n" + "━" * 80)
+    print("Comparison")
+    print("━" * 80)
+    print(f"{'Layout':<10} {'Hit rate':>9} {'Hit rate (turn 2+)':>19} {'TTFT turn 1 (ms)':>17} {'TTFT turn 2+ (ms)':>18}")
+    for summary in summaries.values():
+        hit_rate = summary["prefix_cache_hit_rate"]
+        later_rate = summary["later_turns_prefix_cache_hit_rate"]
+        print(f"{summary['layout']:<10} "
+              f"{(f'{hit_rate:.1%}' if hit_rate is not None else 'N/A'):>9} "
+              f"{(f'{later_rate:.1%}' if later_rate is not None else 'N/A'):>19} "
+              f"{summary['first_turn_ttft_ms']:>17.1f} {summary['later_turns_ttft_mean_ms']:>18.1f}")
+    if all(s["prefix_cache_hit_rate"] is None for s in summaries.values()):
+        print("\n[WARN] vLLM /metrics exposes no prefix-cache counters (is prefix caching enabled?)")
+
+    save_results({
+        "timestamp": datetime.now().isoformat(),
+        "model": model_name,
+        "turns": args.turns,
+        "max_tokens": args.max_tokens,
+        "layouts": summaries
+    })
+
+    print("\n" + "━" * 80)
+    print("[COMPLETE] Prefix cache replay benchmark complete!")
+    print("━" * 80)
+    print("")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,323 @@
+#!/home/ruifrvaz/.venvs/rag/bin/python3
+"""
+Step 8: Hybrid Retrieval Benchmark
+Purpose: Compare recall and latency of dense, BM25 and hybrid (RRF) retrieval
+Usage: ./8_hybrid_retrieval.py [--collection scifi_world] [--top-k 5] [--backend exact] [--queries-file FILE]
+
+Process:
+  1. Load ChromaDB collection, search backend and BM25 index from Step 2
+  2. Build ground truth per query: chunks whose text contains all of the query's
+     key terms (character names, ships, invented technology)
+  3. Run each query through dense search, BM25 and their reciprocal rank fusion
+     (same fusion as the RAG proxy's --hybrid)
+  4. Report recall@k, MRR and search latency per method
+  5. Save results to test_results/ folder (JSON format)
+
+Interpretation:
+  - Ground truth is lexical (the query's entity names), so this measures entity
+    recall - the failure mode hybrid retrieval targets - not general relevance
+  - Latency excludes query embedding (identical for dense and hybrid);
+    hybrid = dense search of --candidates hits + BM25 lookup + fusion
+
+Queries file format (JSON):
+  [{"query": "What does Elena fear?", "terms": ["elena"]}, ...]
+
+Output:
+  - test_results/hybrid_retrieval_YYYYMMDD_HHMMSS.json (timestamped)
+  - test_results/hybrid_retrieval_latest.json (always latest)
+
+Dependencies:
+  - sentence-transformers: Query embedding generation
+  - chromadb: Vector similarity search
+
+Note: Uses RAG virtual environment at ~/.venvs/rag
+"""
+
+import argparse
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+from datetime import datetime
+import chromadb
+from chromadb.config import Settings
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from utils.aliases import resolve_alias
+from utils.embedders import (
+    EMBEDDING_BACKENDS, EMBEDDING_MODEL, AgreementError, FingerprintError, embedding_fingerprint,
+    load_embedding_model, verify_fingerprint
+)
+from utils.lexical_index import RRF_K, load_lexical_index, reciprocal_rank_fusion
+from utils.vector_index import BACKENDS, load_index, timed_query
+
+# Directories
+CHROMA_DIR = Path(__file__).parent.parent / "chroma_db"
+STORE_DIR = Path(__file__).parent.parent / "embeddings"
+TEST_RESULTS_DIR = Path(__file__).parent / "test_results"
+TEST_RESULTS_DIR.mkdir(exist_ok=True)
+
+METHODS = ["dense", "bm25", "hybrid"]
+HYBRID_CANDIDATES = 20  # Same default as the RAG proxy
+
+# Entity-centric queries: natural phrasing, relevance defined by the key terms
+TEST_QUERIES = [
+    {"query": "What are Elena's personality traits?", "terms": ["elena"]},
+    {"query": "Describe the Arcturian homeworld", "terms": ["arcturian"]},
+    {"query": "How does the FTL drive work?", "terms": ["ftl"]},
+    {"query": "What does the bridge of the Prometheus look like?", "terms": ["prometheus"]},
+    {"query": "What do the Arcturians think of Elena?", "terms": ["arcturian", "elena"]},
+]
+
+
+def load_vector_store(persist_dir, collection_name):
+    """Load ChromaDB collection"""
+    print(f"[LOAD] Loading vector store:")
+    print(f"   Directory: {persist_dir}")
+    print(f"   Collection: {collection_name}")
+
+    if not persist_dir.exists():
+        print(f"[ERROR] ChromaDB directory not found: {persist_dir}")
+        print(f"[INFO] Run setup/2_embed_and_store.py first")
+        return None
+
+    client = chromadb.PersistentClient(
+        path=str(persist_dir),
+        settings=Settings(anonymized_telemetry=False)
+    )
+
+    try:
+        collection = client.get_collection(name=resolve_alias(persist_dir, collection_name))
+        print(f"[OK] Collection loaded - {collection.count()} chunks")
+        return collection
+    except Exception as e:
+        print(f"[ERROR] Collection '{collection_name}' not found: {e}")
+        return None
+
+
+def ground_truth(collection, queries):
+    """Relevant chunk ids per query: chunks containing all of its terms (case-insensitive)"""
+    corpus = collection.get(include=["documents"])
+    texts = [(chunk_id, doc.lower()) for chunk_id, doc in zip(corpus["ids"], corpus["documents"])]
+    return [
+        {chunk_id for chunk_id, text in texts if all(term.lower() in text for term in q["terms"])}
+        for q in queries
+    ]
+
+
+def score_ranking(ranking, relevant, top_k):
+    """recall@k (against min(k, |relevant|)) and reciprocal rank of the first relevant hit"""
+    top = ranking[:top_k]
+    hits = sum(1 for chunk_id in top if chunk_id in relevant)
+    first = next((rank for rank, chunk_id in enumerate(top, 1) if chunk_id in relevant), None)
+    return {
+        "recall": hits / min(top_k, len(relevant)),
+        "reciprocal_rank": 1.0 / first if first else 0.0
+    }
+
+
+def run_query(index, lexical, query_embedding, query, top_k, candidates, rrf_k):
+    """Rankings and search latency (ms) for each method"""
+    dense, dense_ms = timed_query(index, query_embedding, top_k)
+
+    start = time.perf_counter()
+    lexical_ids = lexical.query_ids(query, top_k)
+    bm25_ms = (time.perf_counter() - start) * 1000
+
+    # Hybrid: wider candidate lists from both, fused (as in the proxy)
+    start = time.perf_counter()
+    dense_candidates, _ = timed_query(index, query_embedding, max(candidates, top_k))
+    lexical_candidates = lexical.query_ids(query, max(candidates, top_k))
+    fused = reciprocal_rank_fusion([dense_candidates['ids'][0], lexical_candidates], rrf_k)
+    hybrid_ms = (time.perf_counter() - start) * 1000
+
+    return {
+        "dense": (dense['ids'][0], dense_ms),
+        "bm25": (lexical_ids, bm25_ms),
+        "hybrid": ([chunk_id for chunk_id, _ in fused[:top_k]], hybrid_ms)
+    }
+
+
+def summarize(per_query, method):
+    """Mean recall/MRR and latency percentiles for one method"""
+    recalls = [q[method]["recall"] for q in per_query]
+    rrs = [q[method]["reciprocal_rank"] for q in per_query]
+    latencies = sorted(q[method]["search_ms"] for q in per_query)
+    return {
+        "recall_at_k": statistics.mean(recalls) if recalls else 0.0,
+        "mrr": statistics.mean(rrs) if rrs else 0.0,
+        "latency_mean_ms": statistics.mean(latencies) if latencies else 0.0,
+        "latency_p95_ms": latencies[int(0.95 * (len(latencies) - 1))] if latencies else 0.0
+    }
+
+
+def save_results(results):
+    """Save benchmark results to JSON file"""
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    results_file = TEST_RESULTS_DIR / f"hybrid_retrieval_{timestamp}.json"
+
+    with open(results_file, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+
+    latest_file = TEST_RESULTS_DIR / "hybrid_retrieval_latest.json"
+    with open(latest_file, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+
+    print(f"\n[SAVE] Results saved to: {results_file}")
+    print(f"[SAVE] Latest results: {latest_file}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare dense, BM25 and hybrid retrieval recall and latency")
+    parser.add_argument(
+        "--collection",
+        type=str,
+        default="scifi_world",
+        help="ChromaDB collection name (default: scifi_world)"
+    )
+    parser.add_argument(
+        "--top-k",
+        type=int,
+        default=5,
+        help="Number of results to retrieve (default: 5)"
+    )
+    parser.add_argument(
+        "--backend",
+        type=str,
+        choices=BACKENDS,
+        default="exact",
+        help="Dense search backend (default: exact)"
+    )
+    parser.add_argument(
+        "--candidates",
+        type=int,
+        default=HYBRID_CANDIDATES,
+        help=f"Hits per ranking before fusion (default: {HYBRID_CANDIDATES})"
+    )
+    parser.add_argument(
+        "--rrf-k",
+        type=int,
+        default=RRF_K,
+        help=f"Reciprocal rank fusion constant (default: {RRF_K})"
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=20,
+        help="Timed repetitions per query (default: 20)"
+    )
+    parser.add_argument(
+        "--queries-file",
+        type=str,
+        default=None,
+        help='JSON list of {"query": ..., "terms": [...]} (default: built-in entity queries)'
+    )
+    parser.add_argument(
+        "--embedding-backend",
+        type=str,
+        choices=EMBEDDING_BACKENDS,
+        default="torch",
+        help="Query embedding backend: torch (fp32), onnx, onnx-int8 (default: torch)"
+    )
+
+    args = parser.parse_args()
+
+    print("━" * 80)
+    print("Step 8: Hybrid Retrieval Benchmark")
+    print("━" * 80)
+    print(f"Timestamp: {datetime.now()}")
+    print("")
+
+    queries = TEST_QUERIES
+    if args.queries_file:
+        with open(args.queries_file, 'r', encoding='utf-8') as f:
+            queries = json.load(f)
+
+    collection = load_vector_store(CHROMA_DIR, args.collection)
+    if not collection:
+        return
+
+    try:
+        index = load_index(collection, args.backend, store_dir=STORE_DIR)
+        lexical = load_lexical_index(collection, STORE_DIR)
+    except ValueError as e:
+        print(f"[ERROR] {e}")
+        return
+    print(f"[OK] BM25 index: {len(lexical.vocab)} terms, {len(lexical.doc_rows)} postings "
+          f"({lexical.nbytes / 1e6:.1f} MB)")
+
+    print(f"\n[EMBED] Loading model: {EMBEDDING_MODEL} ({args.embedding_backend})")
+    embedder = load_embedding_model(EMBEDDING_MODEL, args.embedding_backend)
+    try:
+        check = verify_fingerprint(collection, embedder,
+                                   embedding_fingerprint(embedder, EMBEDDING_MODEL, args.embedding_backend))
+    except (FingerprintError, AgreementError) as e:
+        print(f"[ERROR] {e}")
+        return
+    print(f"[OK] Model loaded (fingerprint check: {check['status']})")
+
+    relevant_sets = ground_truth(collection, queries)
+
+    print("\n" + "━" * 80)
+    print(f"Queries (top_k={args.top_k}, candidates={args.candidates}, rrf_k={args.rrf_k})")
+    print("━" * 80)
+    per_query = []
+    for q, relevant in zip(queries, relevant_sets):
+        if not relevant:
+            print(f"[SKIP] {q['query']} - no chunk contains {q['terms']}")
+            continue
+
+        query_embedding = embedder.encode([q["query"]])[0]
+        timings = {method: [] for method in METHODS}
+        for _ in range(args.repeat):
+            runs = run_query(index, lexical, query_embedding, q["query"],
+                             args.top_k, args.candidates, args.rrf_k)
+            for method in METHODS:
+                timings[method].append(runs[method][1])
+
+        entry = {"query": q["query"], "terms": q["terms"], "relevant_chunks": len(relevant)}
+        for method in METHODS:
+            entry[method] = {
+                **score_ranking(runs[method][0], relevant, args.top_k),
+                "search_ms": statistics.median(timings[method]),
+                "ids": runs[method][0]
+            }
+        per_query.append(entry)
+        print(f"{q['query'][:50]:<50} ({len(relevant)} relevant) recall@{args.top_k}: "
+              + " | ".join(f"{m} {entry[m]['recall']:.2f}" for m in METHODS))
+
+    if not per_query:
+        print("[ERROR] No query has relevant chunks in this collection")
+        return
+
+    summaries = {method: summarize(per_query, method) for method in METHODS}
+
+    print("\n" + "━" * 80)
+    print("Comparison")
+    print("━" * 80)
+    print(f"{'Method':<8} {f'Recall@{args.top_k}':>10} {'MRR':>7} {'Mean (ms)':>10} {'P95 (ms)':>10}")
+    for method, summary in summaries.items():
+        print(f"{method:<8} {summary['recall_at_k']:>10.3f} {summary['mrr']:>7.3f} "
+              f"{summary['latency_mean_ms']:>10.3f} {summary['latency_p95_ms']:>10.3f}")
+
+    save_results({
+        "timestamp": datetime.now().isoformat(),
+        "collection": args.collection,
+        "backend": args.backend,
+        "embedding_backend": args.embedding_backend,
+        "top_k": args.top_k,
+        "candidates": args.candidates,
+        "rrf_k": args.rrf_k,
+        "summary": summaries,
+        "queries": per_query
+    })
+
+    print("\n" + "━" * 80)
+    print("[COMPLETE] Hybrid retrieval benchmark complete!")
+    print("━" * 80)
+    print("")
+
+
+if __name__ == "__main__":
+    main()
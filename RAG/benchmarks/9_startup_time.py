@@ -0,0 +1,248 @@
+#!/home/ruifrvaz/.venvs/rag/bin/python3
+"""
+Step 9: RAG Proxy Startup Time Benchmark
+Purpose: Measure how long the RAG proxy takes from launch to live and to ready, per startup phase
+Usage: ./9_startup_time.py [--runs 3] [--proxy-args "--backend exact --hybrid"]
+
+Process:
+  1. Launch serve_rag_proxy.py on a spare port (--port, default 8011) with --proxy-args
+  2. Poll GET /live and GET /ready; record time from launch to the first 200 of each
+  3. Read the proxy's own phase timings from /ready (embedder, vector_store,
+     reranker, vllm, fingerprint, warmup: start offset + duration; phases overlap)
+  4. Send one chat completion (max_tokens 1) and record its latency and
+     Server-Timing breakdown: with warm-up, embed + search are already fast
+  5. Stop the proxy; repeat for --runs cold starts (OS page cache stays warm
+     after the first run, so run 1 is the coldest)
+  6. Save results to test_results/ folder (JSON format)
+
+Interpretation:
+  - time_to_live: process + imports (torch, chromadb, fastapi) until uvicorn accepts connections
+  - time_to_ready: until components are loaded, warmed up and a vLLM backend is up
+  - Concurrent loading: time_to_ready tracks the slowest of embedder /
+    vector_store / vllm rather than their sum
+
+Output:
+  - test_results/startup_time_YYYYMMDD_HHMMSS.json (timestamped)
+  - test_results/startup_time_latest.json (always latest)
+
+Dependencies:
+  - httpx: HTTP client
+
+Requirements:
+  - vLLM server running: cd .. && ./serve_vllm.sh (otherwise the proxy never becomes ready)
+  - ChromaDB collection exists: setup/2_embed_and_store.py
+
+Note: Uses RAG virtual environment at ~/.venvs/rag
+"""
+
+import argparse
+import json
+import shlex
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from datetime import datetime
+
+import httpx
+
+# Directories
+TEST_RESULTS_DIR = Path(__file__).parent / "test_results"
+TEST_RESULTS_DIR.mkdir(exist_ok=True)
+PROXY_SCRIPT = Path(__file__).parent.parent / "serve_rag_proxy.py"
+
+# Benchmark configuration
+PROXY_PORT = 8011          # Spare port, so a running proxy on 8001 is not disturbed
+POLL_INTERVAL_S = 0.05     # /live and /ready polling period
+READY_TIMEOUT_S = 300.0    # Give up on a run after this long
+FIRST_QUERY = "Describe the Arcturian homeworld atmosphere."
+
+
+def parse_server_timing(header):
+    """Parse a Server-Timing header into {name: duration_ms}"""
+    entries = {}
+    for entry in header.split(","):
+        name, _, params = entry.strip().partition(";")
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "dur" and name:
+                entries[name] = float(value)
+    return entries
+
+
+def wait_for(client, url, launched, process, timeout):
+    """Poll url until it answers 200; seconds since launch (None on timeout or exit)"""
+    while time.perf_counter() - launched < timeout:
+        if process.poll() is not None:
+            return None
+        try:
+            if client.get(url).status_code == 200:
+                return time.perf_counter() - launched
+        except httpx.TransportError:
+            pass
+        time.sleep(POLL_INTERVAL_S)
+    return None
+
+
+def first_query(client, base_url):
+    """One chat completion right after ready: latency + Server-Timing breakdown"""
+    models = client.get(f"{base_url}/v1/models").json()["data"]
+    start = time.perf_counter()
+    response = client.post(f"{base_url}/v1/chat/completions", json={
+        "model": models[0]["id"],
+        "messages": [{"role": "user", "content": FIRST_QUERY}],
+        "max_tokens": 1,
+        "temperature": 0.7
+    })
+    return {
+        "status": response.status_code,
+        "latency_ms": (time.perf_counter() - start) * 1000,
+        "server_timing_ms": parse_server_timing(response.headers.get("server-timing", ""))
+    }
+
+
+def run_once(port, proxy_args, timeout):
+    """Launch the proxy once and time it to live, ready and the first query"""
+    base_url = f"http://localhost:{port}"
+    command = [sys.executable, str(PROXY_SCRIPT), "--port", str(port)] + proxy_args
+    launched = time.perf_counter()
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT)
+    try:
+        with httpx.Client(timeout=httpx.Timeout(60.0)) as client:
+            result = {"time_to_live_s": wait_for(client, f"{base_url}/live", launched, process, timeout)}
+            result["time_to_ready_s"] = wait_for(client, f"{base_url}/ready", launched, process, timeout)
+            try:
+                result["startup"] = client.get(f"{base_url}/ready").json()["startup"]
+            except (httpx.HTTPError, ValueError, KeyError):
+                result["startup"] = None
+            if result["time_to_ready_s"] is not None:
+                result["first_query"] = first_query(client, base_url)
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+    return result
+
+
+def summarize(runs):
+    """Mean time to live / ready, per-phase durations and first query latency across runs"""
+    ready = [r for r in runs if r["time_to_ready_s"] is not None]
+    phases = list(dict.fromkeys(name for r in ready for name in (r["startup"] or {}).get("phases", {})))
+
+    def mean(values):
+        values = [v for v in values if v is not None]
+        return statistics.mean(values) if values else None
+
+    return {
+        "runs": len(runs),
+        "ready_runs": len(ready),
+        "time_to_live_mean_s": mean(r["time_to_live_s"] for r in runs),
+        "time_to_ready_mean_s": mean(r["time_to_ready_s"] for r in ready),
+        "phase_mean_s": {
+            name: mean(r["startup"]["phases"].get(name, {}).get("seconds") for r in ready)
+            for name in phases
+        },
+        "first_query_mean_ms": mean(r["first_query"]["latency_ms"] for r in ready if "first_query" in r)
+    }
+
+
+def save_results(results):
+    """Save benchmark results to JSON file"""
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    results_file = TEST_RESULTS_DIR / f"startup_time_{timestamp}.json"
+
+    with open(results_file, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+
+    latest_file = TEST_RESULTS_DIR / "startup_time_latest.json"
+    with open(latest_file, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+
+    print(f"\n[SAVE] Results saved to: {results_file}")
+    print(f"[SAVE] Latest results: {latest_file}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure RAG proxy time-to-ready per startup phase")
+    parser.add_argument(
+        "--runs",
+        type=int,
+        default=3,
+        help="Cold starts to measure (default: 3)"
+    )
+    parser.add_argument(
+        "--port",
+        type=int,
+        default=PROXY_PORT,
+        help=f"Port for the benchmarked proxy (default: {PROXY_PORT})"
+    )
+    parser.add_argument(
+        "--proxy-args",
+        type=str,
+        default="",
+        help="Extra serve_rag_proxy.py arguments, e.g. \"--backend exact --hybrid --rerank\" (default: none)"
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=READY_TIMEOUT_S,
+        help=f"Seconds to wait for /ready per run (default: {READY_TIMEOUT_S:.0f})"
+    )
+
+    args = parser.parse_args()
+    proxy_args = shlex.split(args.proxy_args)
+
+    print("━" * 80)
+    print("Step 9: RAG Proxy Startup Time Benchmark")
+    print("━" * 80)
+    print(f"Timestamp: {datetime.now()}")
+    print(f"Proxy: {PROXY_SCRIPT.name} --port {args.port} {args.proxy_args}")
+    print("")
+
+    runs = []
+    for run in range(args.runs):
+        result = run_once(args.port, proxy_args, args.timeout)
+        runs.append(result)
+        if result["time_to_ready_s"] is None:
+            error = (result["startup"] or {}).get("error") or "timed out / exited"
+            print(f"   [{run + 1}/{args.runs}] not ready: {error}")
+            continue
+        phases = ", ".join(f"{name} {phase['seconds']:.2f}s"
+                           for name, phase in result["startup"]["phases"].items())
+        print(f"   [{run + 1}/{args.runs}] live {result['time_to_live_s']:.2f}s, "
+              f"ready {result['time_to_ready_s']:.2f}s ({phases}), "
+              f"first query {result['first_query']['latency_ms']:.0f} ms")
+
+    summary = summarize(runs)
+
+    print("\n" + "━" * 80)
+    print("Time to ready")
+    print("━" * 80)
+    if not summary["ready_runs"]:
+        print("[ERROR] Proxy never became ready - is vLLM running and the collection built?")
+    else:
+        print(f"{'Milestone / phase':<24} {'Mean (s)':>10}")
+        print(f"{'live':<24} {summary['time_to_live_mean_s']:>10.2f}")
+        for name, seconds in summary["phase_mean_s"].items():
+            print(f"{'  ' + name:<24} {seconds:>10.2f}")
+        print(f"{'ready':<24} {summary['time_to_ready_mean_s']:>10.2f}")
+        print(f"\nFirst query after ready (max_tokens 1): {summary['first_query_mean_ms']:.0f} ms")
+
+    save_results({
+        "timestamp": datetime.now().isoformat(),
+        "proxy_args": proxy_args,
+        "summary": summary,
+        "runs": runs
+    })
+
+    print("\n" + "━" * 80)
+    print("[COMPLETE] Startup time benchmark complete!")
+    print("━" * 80)
+    print("")
+
+
+if __name__ == "__main__":
+    main()
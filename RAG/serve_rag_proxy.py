@@ -2,18 +2,200 @@
 """
 Step 5: RAG Proxy Server
 Purpose: Transparent RAG layer that intercepts all vLLM requests
-Usage: ./5_serve_rag_proxy.py [--port 8001] [--collection scifi_world]
+Usage: ./5_serve_rag_proxy.py [--port 8001] [--collection scifi_world] [--max-connections 64]
 
 Process:
-  1. Load embedding model (bge-large-en-v1.5) at startup
-  2. Connect to ChromaDB collection
-  3. Start FastAPI server on port 8001
+  1. Start FastAPI server on port 8001 (GET /live answers immediately)
+  2. Load embedding model (bge-large-en-v1.5) and ChromaDB collections
+     concurrently in the background, warm them up (GET /ready once done)
+  3. Probe vLLM until a backend serves a model (503 for completions until then)
   4. Intercept all OpenAI API requests
   5. Retrieve relevant context from vector database
   6. Augment messages with RAG context
-  7. Forward to vLLM server (port 8000)
+  7. Forward to vLLM server (port 8000, or the --vllm-urls backend serving the
+     requested model) over pooled async HTTP connections
   8. Return response to client
 
+Concurrency:
+  - Upstream calls never block the event loop, so concurrent clients
+    (e.g. several Continue.dev windows) overlap and vLLM can batch them
+    (see MAX_SEQS in serve_vllm.sh)
+  - Connection pool limits: --max-connections, --max-keepalive, --upstream-timeout
+  - Streaming responses relay vLLM's SSE bytes unchanged (no per-token parsing)
+  - Query embedding runs on a worker pool; concurrent queries arriving within
+    --embed-max-wait-ms are coalesced into one encode batch (--embed-batch-size)
+
+Embedding backends (--embedding-backend):
+  - torch: fp32 PyTorch (reference, what setup/2_embed_and_store.py uses by default)
+  - onnx / onnx-int8: ONNX Runtime, fp32 or dynamically int8-quantized
+    weights (exported once to embeddings/onnx/); int8 cuts query embedding
+    CPU time several-fold, leaving the cores to feed vLLM
+  - benchmarks/10_embedding_backends.py: latency, throughput, recall per backend
+
+Embedding fingerprint:
+  - Step 2 stores model, backend, precision, dimension, normalization and a
+    reference embedding hash in the collection metadata
+  - Each served collection (and each build swapped in later) is checked
+    against the query embedder: a different model, dimension or
+    normalization is refused outright; if the reference hash differs
+    (e.g. onnx-int8 queries on an fp32 collection) --agreement-sample chunks
+    are re-encoded and must stay within cosine --min-agreement of their
+    stored embeddings
+  - A failed check at startup keeps the proxy not ready (GET /live shows
+    the error); a failed check on a rebuilt collection skips the swap
+
+Startup and readiness:
+  - The embedder, the vector store (+ search indexes) and the reranker load
+    concurrently on worker threads while vLLM is probed; one warm-up encode
+    and search per collection then absorbs lazy initialization (torch
+    kernels, index pages) so the first real query is not the slow one
+  - GET /live: process up (503 only if loading failed, e.g. missing collection)
+  - GET /ready: 200 once loaded and a vLLM backend is in rotation; until
+    then it and the completion endpoints return 503 + Retry-After
+  - vLLM may start after the proxy: backends are re-checked every second
+    until one answers, then every --health-interval
+  - Per-phase timings: GET /ready, /stats ("startup"), /metrics
+    (rag:startup_phase_seconds); benchmarks/9_startup_time.py measures
+    time-to-ready from process launch
+
+Search backends (--backend):
+  - chroma: ChromaDB collection query (HNSW + SQLite)
+  - exact:  Whole collection loaded into a contiguous matrix at startup;
+            exact top-k with one matrix-vector product (--index-dtype float32|float16)
+  - mmap:   Exact search over embeddings/<collection>.store (written by Step 2),
+            opened zero-copy with np.memmap; workers share one page-cached copy
+
+Caching:
+  - Query embeddings: LRU + TTL cache keyed by (embedding model, normalized query),
+    so regenerations skip the CPU embedding step (--embed-cache-size, --embed-cache-ttl)
+  - Retrieval results: LRU cache keyed by (query embedding hash, top_k, collection,
+    collection version); the version is the generation + created_at written by
+    setup/2_embed_and_store.py, so results of a swapped-out build are never
+    reused (--retrieval-cache-size)
+  - Conversation reuse: chats are keyed by a hash of their leading messages
+    (system prompt + first user turn); a turn whose query embedding is within
+    --session-reuse-threshold cosine of the query behind the session's last
+    search reuses that chunk set and skips the search (--session-cache-size)
+
+Multi-collection fan-out:
+  - --extra-collections loads more collections next to --collection (e.g.
+    characters, world lore, previous chapters); a request selects them with
+    "collections" (+ optional "collection_top_k") or an X-RAG-Collections
+    header ("characters:3, world_lore"); "collection_top_k" may only name
+    searched collections (on its own: --collection)
+  - The searches run concurrently on worker threads, so retrieval takes about
+    as long as the slowest collection; hits are merged by distance on a common
+    1 - cosine scale (bge embeddings are unit-norm)
+
+Collection hot swap (blue/green):
+  - setup/2_embed_and_store.py builds each rebuild into a new versioned
+    collection (<name>__g<generation>) and then atomically points the alias in
+    chroma_db/aliases.json at it; served names are aliases
+  - The proxy watches aliases.json (--alias-poll-interval) and, on a change,
+    loads the new build and its search indexes on a worker thread while the
+    old one keeps serving; the swap is a single reference replacement between
+    requests, and in-flight requests finish on the build they started with
+  - POST /admin/collections/reload swaps immediately; PUT
+    /admin/collections/{alias} {"collection": ...} re-points an alias (e.g.
+    roll back to the previous generation) and swaps
+  - Admin endpoints accept loopback clients only, unless --admin-token (or
+    RAG_ADMIN_TOKEN) is set: then any client with "Authorization: Bearer
+    <token>"; they return 503 until the collections are loaded
+
+Context layout (--context-layout, or "context_layout" per chat request):
+  - system: RAG system message inserted after the first system message (default)
+  - latest: System prompt and earlier turns forwarded byte-identical; context is
+            prepended to the latest user message in source order, so vLLM's
+            automatic prefix cache keeps covering the conversation history
+
+Diversification (--mmr):
+  - Over-fetches --mmr-candidates hits and re-selects top_k with maximal
+    marginal relevance (--mmr-lambda), so overlapping neighbour chunks do not
+    fill the context with repeated text; one NumPy similarity matrix per query,
+    selection time reported on /stats and /metrics (rag:mmr_select_ms)
+
+Hybrid retrieval (--hybrid):
+  - BM25 over embeddings/<collection>.bm25.npz (built by Step 2) runs next to
+    the vector search; both rankings (--hybrid-candidates each) are fused with
+    reciprocal rank fusion (--rrf-k), so exact names and invented terms the
+    embedding model blurs still reach the context
+  - Postings are precomputed BM25 weights in flat arrays: a lookup is a few
+    slice-adds (rag:lexical_search_ms); chunks found only by BM25 carry no
+    distance and pass the --max-distance cutoff
+
+Reranking (--rerank):
+  - Over-fetches --rerank-candidates hits and scores them with a small
+    cross-encoder (--rerank-model) in one batched CPU forward pass
+  - Hard latency budget (--rerank-budget-ms): if scoring has not finished,
+    the first-stage order is used (late scores are still cached); with the
+    rerank worker busy, reranking is skipped instead of queued
+  - Orders are cached per (query, candidate set) (--rerank-cache-size);
+    outcomes on /stats and /metrics (rag:rerank_total, rag:rerank_score_ms)
+
+Retrieval gate:
+  - Queries matching a skip rule (--skip-patterns; defaults: "continue",
+    rewrite/edit commands followed by the text to edit - after a ":" line
+    break, fenced or quoted - and quoted code blocks) get no context
+    and pay for no embedding, search or extra prefill
+  - --max-distance drops chunks farther than the cutoff (collection distance
+    space); if none remain, no context is injected
+
+Context budget:
+  - Retrieved chunks are packed in rank order into a token budget; chunk token
+    counts come from the collection metadata (served model's tokenizer, Step 2),
+    so nothing is tokenized per request
+  - Budget = min(request "max_context_tokens", --max-context-tokens,
+    vLLM max_model_len - conversation - max_tokens - reserve)
+
+vLLM backends (--vllm-urls):
+  - Several vLLM servers behind one proxy (e.g. base model on 8000, merged
+    fine-tune on 8002); each backend's models come from its /models endpoint
+    and requests are routed by their "model" (GET /v1/models lists them all)
+  - Among backends serving the same model, the one with the fewest
+    outstanding requests gets the request
+  - Active health checks (--health-interval) eject a backend after
+    --eject-after consecutive failures and re-admit it once it answers again;
+    requests whose connection fails move on to the next backend
+  - Unknown model: 404; model known but every backend serving it down (or none up yet): 503
+
+Request coalescing (--coalesce):
+  - Identical deterministic requests (temperature 0, same upstream body by
+    canonical hash) in flight at the same time share one vLLM request:
+    non-streaming followers get the leader's response, streaming followers
+    first receive the chunks buffered so far, then the live stream
+  - Responses carry X-RAG-Coalesced (leader / follower); the upstream request
+    is aborted only when every subscriber has disconnected
+
+Response cache (--response-cache):
+  - Deterministic requests (temperature 0) only; both layers are LRU-bounded
+    (--response-cache-size) and replay streaming answers as the recorded SSE
+    chunks, so a repeated query returns in milliseconds with no vLLM work
+  - Exact layer: canonical request + searched collections and their versions
+    (a swapped-in build changes the key); checked before admission control
+  - Semantic layer: same request apart from the query text, identical
+    retrieved chunk ids, and query embedding within --semantic-cache-threshold
+    cosine of a cached query
+  - Responses carry X-RAG-Cache (exact / semantic) when served from cache
+
+Admission control (--admission):
+  - At most --max-inflight requests are handled at once; up to --max-queue
+    more wait (FIFO) for a slot
+  - vLLM /metrics is polled for num_requests_waiting and KV-cache usage; new
+    requests get 429 + Retry-After once vLLM's queue reaches --max-vllm-waiting,
+    KV-cache usage reaches --max-kv-usage, the proxy queue is full, or the
+    predicted wait (queue depth x mean service time) exceeds --max-queue-wait,
+    so interactive clients fail fast instead of timing out behind a backlog
+
+Metrics:
+  - GET /metrics: Prometheus text format (rag:* names, scraped like vLLM's vllm:*)
+  - Per-stage latency histograms: embed, search, context assembly,
+    upstream time-to-first-token (streaming), upstream total, proxy overhead
+  - Counters: requests, retrieved chunks, context chars/tokens, cache hits/misses, errors
+  - GET /stats: JSON view (recent queries, batching, cache and search statistics)
+  - Every completion response carries a Server-Timing header (embed, search,
+    assemble, upstream_ttfb in ms) and X-RAG-Context-Tokens, so clients and
+    load tests can attribute latency per request
+
 Output:
   - Transparent RAG proxy on http://localhost:8001
   - OpenAI-compatible API endpoints
@@ -24,7 +206,7 @@ Dependencies:
   - uvicorn: ASGI server
   - sentence-transformers: Query embedding
   - chromadb: Vector database
-  - openai: vLLM client
+  - httpx: Pooled async client for vLLM (keep-alive connections)
 
 Requirements:
   - vLLM server running: cd .. && ./serve_vllm.sh
@@ -34,36 +216,175 @@ Note: Uses RAG virtual environment at ~/.venvs/rag
 """
 
 import argparse
-from contextlib import asynccontextmanager
+import asyncio
+import hashlib
+import hmac
+import ipaddress
+import json
+import os
+import sys
+import time
+from contextlib import asynccontextmanager, contextmanager
 from pathlib import Path
 from datetime import datetime
-from typing import Optional, Dict, Any, List
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
 
-from fastapi import FastAPI, HTTPException, Request
-from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi import FastAPI, Header, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
+from starlette.background import BackgroundTask
+import httpx
 import uvicorn
 
-from sentence_transformers import SentenceTransformer
+from sentence_transformers import CrossEncoder
 import chromadb
 from chromadb.config import Settings
-from openai import OpenAI
+
+sys.path.insert(0, str(Path(__file__).parent))
+from utils.embedding import EmbeddingBatcher
+from utils.embedders import (
+    AGREEMENT_SAMPLE, EMBEDDING_BACKENDS, EMBEDDING_MODEL, MIN_AGREEMENT, AgreementError, FingerprintError,
+    embedding_fingerprint, load_embedding_model, verify_fingerprint
+)
+from utils.startup import StartupTracker
+from utils.backends import (
+    EJECT_AFTER_FAILURES, HEALTH_INTERVAL_S, RETRY_INTERVAL_S, BackendPool, NoBackendAvailable, metrics_url
+)
+from utils.aliases import alias_mtime, clear_serving, record_serving, resolve_alias, set_alias
+from utils.admission import (
+    ADMISSION_MAX_INFLIGHT, ADMISSION_MAX_KV_USAGE, ADMISSION_MAX_QUEUE, ADMISSION_MAX_WAIT_S,
+    ADMISSION_MAX_WAITING, ADMISSION_POLL_INTERVAL_S, AdmissionController, AdmissionRejected
+)
+from utils.coalesce import RequestCoalescer, is_deterministic, request_key
+from utils.caches import (
+    LRUCache, SemanticResponseCache, SessionRetrievalCache, complete_sse, normalize_query
+)
+from utils.context import (
+    DEFAULT_SKIP_PATTERNS, compile_skip_rules, conversation_tokens,
+    matching_skip_rule, select_within_budget, within_distance
+)
+from utils.metrics import Counter, Histogram, format_metric, render_prometheus
+from utils.lexical_index import RRF_K, load_lexical_index, reciprocal_rank_fusion
+from utils.mmr import MMR_CANDIDATES, MMR_LAMBDA, mmr_select, select_results
+from utils.rerank import RERANK_BUDGET_MS, RERANK_CACHE_SIZE, RERANK_CANDIDATES, RERANK_MODEL, Reranker
+from utils.vector_index import BACKENDS, fetch_by_ids, load_index, merge_results, timed_query
 
 # Directories
 CHROMA_DIR = Path(__file__).parent / "chroma_db"
-
-# Embedding model (must match Step 2)
-EMBEDDING_MODEL = "BAAI/bge-large-en-v1.5"
+STORE_DIR = Path(__file__).parent / "embeddings"
 
 # vLLM server configuration
-VLLM_BASE_URL = "http://localhost:8000/v1"
+VLLM_BASE_URL = "http://localhost:8000/v1"  # Default backend (--vllm-urls)
 VLLM_API_KEY = "EMPTY"
 
+# Upstream connection pool (keep-alive connections to vLLM)
+UPSTREAM_MAX_CONNECTIONS = 64     # Total concurrent connections to vLLM
+UPSTREAM_MAX_KEEPALIVE = 32       # Idle connections kept open for reuse
+UPSTREAM_KEEPALIVE_EXPIRY = 30.0  # Seconds before idle connection is closed
+UPSTREAM_TIMEOUT = 600.0          # Seconds (long creative generations)
+
+# Startup: readiness gating
+WARMUP_QUERY = "Describe the Arcturian homeworld"  # Encoded + searched once before the proxy reports ready
+NOT_READY_RETRY_AFTER_S = 2  # Retry-After of 503s while starting or without a vLLM backend
+
+# Streaming responses: disable caching/buffering by intermediaries
+STREAM_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+# Query embedding micro-batching
+EMBED_BATCH_SIZE = 16     # Max queries per encode() call
+EMBED_MAX_WAIT_MS = 5.0   # How long a query waits for companions to batch with
+EMBED_WORKERS = 1         # Parallel encode() calls (each uses all torch threads)
+
+# Query embedding cache (Continue.dev re-sends the same message on retry/regenerate)
+EMBED_CACHE_SIZE = 1024       # Entries (~4 KB each at 1024 dims); 0 disables
+EMBED_CACHE_TTL = 3600.0      # Seconds
+
+# Context placement in chat requests
+CONTEXT_LAYOUTS = ["system", "latest"]
+
+# Context token budget
+CONTEXT_RESERVE_TOKENS = 256  # RAG instructions + chat template margin
+
+# Retrieval result cache (versioned by collection generation, no TTL needed)
+RETRIEVAL_CACHE_SIZE = 512    # Entries; 0 disables
+
+# Conversation-scoped retrieval reuse (follow-up turns about the same scene)
+SESSION_CACHE_SIZE = 256          # Sessions; 0 disables
+SESSION_CACHE_TTL = 3600.0        # Seconds since the session's last search
+SESSION_REUSE_THRESHOLD = 0.9     # Min cosine similarity to reuse the previous chunk set
+
+# Response cache (deterministic requests only)
+RESPONSE_CACHE_SIZE = 256          # Responses per layer (exact, semantic)
+SEMANTIC_CACHE_THRESHOLD = 0.97    # Min query cosine similarity (with identical chunks) for reuse
+
+# Collection hot swap
+ALIAS_POLL_INTERVAL_S = 2.0  # Seconds between aliases.json change checks (0 = admin endpoint only)
+
+# Hybrid retrieval
+HYBRID_CANDIDATES = 20  # Hits per ranking (dense, BM25) before fusion
+
+# Metrics
+STAGE_BUCKETS_S = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120]
+SERVER_TIMING_STAGES = ["embed", "search", "rerank", "assemble", "upstream_ttfb"]
+
 # Global state (loaded once at startup)
 embedder = None
+embedder_fingerprint = None  # Query embedder fingerprint, checked against each served collection
+embed_batcher = None
+embedding_cache = None
+retrieval_cache = None
+session_cache = None
 chroma_client = None
-collection = None
-vllm_client = None
+collections = {}  # Served collections by alias (--collection + --extra-collections)
+swap_lock = asyncio.Lock()  # One collection swap at a time (file watch + admin endpoints)
+alias_watcher = None  # Background aliases.json poll (--alias-poll-interval)
+search_latency_ms = Histogram(
+    "search_latency_ms", [0.1, 0.25, 0.5, 1, 2, 5, 10, 25, 50, 100],
+    "Vector search latency (ms, cache misses only)"
+)
+mmr_select_ms = Histogram(
+    "mmr_select_ms", [0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10],
+    "MMR re-selection time (ms, cache misses only)"
+)
+reranker = None  # Cross-encoder second stage (--rerank)
+admission = None  # Admission controller (--admission)
+coalescer = None  # Single-flight upstream requests (--coalesce)
+response_cache = None  # Exact-match responses of deterministic requests (--response-cache)
+semantic_response_cache = None  # Near-identical query reuse (--response-cache)
+lexical_search_ms = Histogram(
+    "lexical_search_ms", [0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2, 5],
+    "BM25 lookup latency (ms, cache misses only)"
+)
+vllm_backends = None  # vLLM servers by model (BackendPool)
+startup = None  # Phase timings + load/ready state (StartupTracker)
+startup_tasks = []  # Background component loading + vLLM wait
+skip_rules = []  # Compiled skip-retrieval patterns
+
+# Per-stage latency histograms (seconds), keyed by the stage names used in request timings
+stage_seconds = {
+    "embed": Histogram("embed_seconds", STAGE_BUCKETS_S, "Query embedding time incl. cache lookup (s)"),
+    "search": Histogram("search_seconds", STAGE_BUCKETS_S, "Vector search time incl. cache lookup (s)"),
+    "rerank": Histogram("rerank_seconds", STAGE_BUCKETS_S, "Cross-encoder rerank wait incl. cache lookup (s)"),
+    "assemble": Histogram("context_assembly_seconds", STAGE_BUCKETS_S, "Context formatting and prompt augmentation time (s)"),
+    "upstream_ttft": Histogram("upstream_ttft_seconds", STAGE_BUCKETS_S, "vLLM time to first streamed chunk (s, streaming only)"),
+    "upstream": Histogram("upstream_seconds", STAGE_BUCKETS_S, "vLLM request time until the last byte (s)"),
+    "overhead": Histogram("proxy_overhead_seconds", STAGE_BUCKETS_S, "Request time not spent waiting on vLLM (s)"),
+}
+requests_total = Counter("requests_total", "Requests received", labels=("endpoint", "stream"))
+errors_total = Counter("errors_total", "Failed requests by stage", labels=("stage",))
+retrieved_chunks_total = Counter("retrieved_chunks_total", "Chunks injected as context")
+context_chars_total = Counter("context_chars_total", "Characters of context injected")
+context_tokens_total = Counter("context_tokens_total", "Tokens of context injected (per-chunk counts from Step 2)")
+dropped_chunks_total = Counter("context_dropped_chunks_total", "Retrieved chunks left out of the context",
+                               labels=("reason",))
+collection_searches_total = Counter("collection_searches_total", "Backend searches per collection (retrieval cache misses)",
+                                    labels=("collection",))
+lexical_only_chunks_total = Counter("hybrid_lexical_only_chunks_total",
+                                    "Fused hits found by BM25 but not by vector search")
+response_cache_hits_total = Counter("response_cache_hits_total", "Responses served from the response cache",
+                                    labels=("layer",))
+skipped_retrievals_total = Counter("retrieval_skipped_total", "Requests answered without retrieved context",
+                                   labels=("reason",))
 
 # Query history tracking (last 10 queries)
 query_history = []
@@ -81,6 +402,14 @@ class ChatCompletionRequest(BaseModel):
     max_tokens: Optional[int] = 800
     stream: Optional[bool] = False
     top_k: Optional[int] = 5  # RAG-specific parameter
+    max_context_tokens: Optional[int] = None  # RAG-specific: context token budget
+    context_layout: Optional[str] = None  # RAG-specific: "system" or "latest"
+    collections: Optional[List[str]] = None  # RAG-specific: collections to search
+    collection_top_k: Optional[Dict[str, int]] = None  # RAG-specific: per-collection top_k
+
+class AliasRequest(BaseModel):
+    collection: str  # Versioned collection (build) the alias should point at
+
 
 class CompletionRequest(BaseModel):
     model: str
@@ -89,59 +418,262 @@ class CompletionRequest(BaseModel):
     max_tokens: Optional[int] = 800
     stream: Optional[bool] = False
     top_k: Optional[int] = 5  # RAG-specific parameter
+    max_context_tokens: Optional[int] = None  # RAG-specific: context token budget
+    collections: Optional[List[str]] = None  # RAG-specific: collections to search
+    collection_top_k: Optional[Dict[str, int]] = None  # RAG-specific: per-collection top_k
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Lifespan context manager for startup/shutdown (replaces deprecated @app.on_event)"""
-    # Startup
-    global embedder, chroma_client, collection, vllm_client
+    # Startup: cheap setup only; models, vector store and the vLLM probe load in the background
+    global startup, startup_tasks, admission, coalescer, vllm_backends
+    global response_cache, semantic_response_cache
     
+    startup = StartupTracker()
     print("━" * 80)
     print("RAG Proxy Server - Startup")
     print("━" * 80)
     print(f"Timestamp: {datetime.now()}")
     print(f"Embedding model: {EMBEDDING_MODEL}")
     print(f"Collection: {app.state.collection_name}")
-    print(f"vLLM backend: {VLLM_BASE_URL}")
+    print(f"vLLM backends: {', '.join(app.state.vllm_urls)}")
     print("")
     
-    # Check vLLM server
-    print("[CHECK] Testing vLLM server...")
-    try:
-        test_client = OpenAI(
-            base_url=VLLM_BASE_URL,
-            api_key=VLLM_API_KEY,
-            http_client=None
+    # Create pooled upstream clients (one per vLLM server)
+    vllm_backends = BackendPool(
+        app.state.vllm_urls,
+        lambda url: create_upstream_client(
+            url,
+            app.state.max_connections,
+            app.state.max_keepalive,
+            app.state.upstream_timeout
+        ),
+        health_interval_s=app.state.health_interval,
+        eject_after=app.state.eject_after
+    )
+    
+    if app.state.admission:
+        admission = AdmissionController(
+            vllm_backends.backends[0].client, [metrics_url(b.url) for b in vllm_backends.backends],
+            max_inflight=app.state.max_inflight,
+            max_queue=app.state.max_queue,
+            max_waiting=app.state.max_vllm_waiting,
+            max_kv_usage=app.state.max_kv_usage,
+            max_wait_s=app.state.max_queue_wait,
+            poll_interval_s=app.state.admission_poll_interval
         )
-        models = test_client.models.list()
-        print(f"[OK] vLLM server responding - Model: {models.data[0].id}")
-    except Exception as e:
-        print(f"[ERROR] vLLM server not responding: {e}")
-        print(f"[INFO] Start server: cd .. && ./serve_vllm.sh")
-        raise RuntimeError("vLLM server not available") from e
+        await admission.start()
+        print(f"[OK] Admission control: {app.state.max_inflight} in flight + {app.state.max_queue} queued, "
+              f"429 at vLLM waiting >= {app.state.max_vllm_waiting}, KV cache >= {app.state.max_kv_usage:.0%}, "
+              f"predicted wait > {app.state.max_queue_wait:.0f}s")
     
-    # Load components
-    embedder = load_embedder()
-    chroma_client, collection = load_vector_store(CHROMA_DIR, app.state.collection_name)
-    vllm_client = OpenAI(
-        base_url=VLLM_BASE_URL,
-        api_key=VLLM_API_KEY,
-        http_client=None  # Fix httpx compatibility
-    )
+    if app.state.coalesce:
+        coalescer = RequestCoalescer()
+        print(f"[OK] Request coalescing: identical temperature-0 requests in flight share one vLLM request")
     
-    print("")
-    print("━" * 80)
-    print("[OK] RAG Proxy Server ready!")
-    print("━" * 80)
-    print(f"Listening on: http://localhost:{app.state.port}")
-    print(f"All requests will be automatically augmented with RAG context")
-    print("")
+    if app.state.response_cache:
+        response_cache = LRUCache("responses_exact", max_entries=app.state.response_cache_size)
+        semantic_response_cache = SemanticResponseCache(
+            max_entries=app.state.response_cache_size,
+            threshold=app.state.semantic_cache_threshold
+        )
+        print(f"[OK] Response cache: {app.state.response_cache_size} entries per layer, "
+              f"semantic reuse at cosine >= {app.state.semantic_cache_threshold} with identical chunks")
+    
+    startup_tasks = [asyncio.create_task(load_components()), asyncio.create_task(wait_for_vllm())]
+    print(f"[OK] Listening on http://localhost:{app.state.port} (GET /live) - "
+          f"loading in the background, GET /ready returns 200 once ready")
     
     yield
     
-    # Shutdown (cleanup if needed)
+    # Shutdown: close pooled upstream connections
     print("\n[SHUTDOWN] RAG Proxy Server shutting down...")
+    for task in startup_tasks + [alias_watcher]:
+        if task:
+            task.cancel()
+    if admission:
+        await admission.stop()
+    if embed_batcher:
+        await embed_batcher.stop()
+    if reranker:
+        await reranker.stop()
+    await vllm_backends.stop()
+    clear_serving(CHROMA_DIR)
+
+
+async def wait_for_vllm():
+    """Probe the vLLM backends, then wait until one serves a model (the pool keeps retrying)"""
+    with startup.phase("vllm"):
+        await vllm_backends.start()
+        for backend in vllm_backends.backends:
+            if backend.healthy:
+                print(f"[OK] {backend.name} responding - Models: " + ", ".join(
+                    f"{model} (max_model_len: {backend.max_model_len(model)})" for model in backend.models))
+            else:
+                print(f"[WARN] {backend.name} not responding ({backend.last_error})")
+        if not vllm_backends.available.is_set():
+            print(f"[WARN] No vLLM server responding yet - requests get 503 until one is up "
+                  f"(retried every {RETRY_INTERVAL_S:.0f}s)")
+            print(f"[INFO] Start server: cd .. && ./serve_vllm.sh")
+        await vllm_backends.available.wait()
+    is_ready()
+
+
+async def load_components():
+    """
+    Load the embedder, vector store and reranker concurrently, then warm them up.
+    
+    A failure (e.g. missing collection) is kept for /live and /ready instead
+    of stopping the server.
+    """
+    global embedder, embed_batcher, embedding_cache, retrieval_cache, session_cache
+    global reranker, skip_rules, alias_watcher
+    
+    try:
+        loaders = [startup.run("embedder", load_embedder), startup.run("vector_store", load_collections)]
+        if app.state.rerank:
+            loaders.append(startup.run("reranker", load_reranker, app.state.rerank_model,
+                                       app.state.rerank_budget_ms, app.state.rerank_cache_size))
+        embedder, _, *loaded_reranker = await asyncio.gather(*loaders)
+        await startup.run("fingerprint", verify_collections)
+        
+        embed_batcher = EmbeddingBatcher(
+            lambda texts: embedder.encode(texts, batch_size=len(texts), convert_to_numpy=True),
+            max_batch_size=app.state.embed_batch_size,
+            max_wait_ms=app.state.embed_max_wait_ms,
+            num_workers=app.state.embed_workers
+        )
+        await embed_batcher.start()
+        print(f"[OK] Embedding worker pool: {app.state.embed_workers} worker(s), "
+              f"batch <= {app.state.embed_batch_size}, wait <= {app.state.embed_max_wait_ms}ms")
+        embedding_cache = LRUCache(
+            "query_embeddings",
+            max_entries=app.state.embed_cache_size,
+            ttl_seconds=app.state.embed_cache_ttl
+        )
+        print(f"[OK] Embedding cache: {app.state.embed_cache_size} entries, TTL {app.state.embed_cache_ttl:.0f}s")
+        if app.state.mmr:
+            print(f"[OK] MMR: {app.state.mmr_candidates} candidates, lambda {app.state.mmr_lambda}")
+        if app.state.hybrid:
+            print(f"[OK] Hybrid: {app.state.hybrid_candidates} candidates per ranking, RRF k={app.state.rrf_k}")
+        if loaded_reranker:
+            reranker = loaded_reranker[0]
+            await reranker.start()
+            print(f"[OK] Reranker: {app.state.rerank_candidates} candidates, "
+                  f"budget {app.state.rerank_budget_ms:.0f}ms, cache {app.state.rerank_cache_size} entries")
+        tokenizer = (default_collection().collection.metadata or {}).get("tokenizer")
+        if tokenizer is None:
+            print(f"[WARN] Collection has no chunk token counts - context budget uses estimates "
+                  f"(re-run setup/2_embed_and_store.py)")
+        elif vllm_backends.served_models() and tokenizer not in vllm_backends.served_models():
+            print(f"[WARN] Chunk token counts use {tokenizer}, vLLM serves "
+                  f"{', '.join(vllm_backends.served_models())} - budgets are approximate")
+        print(f"[OK] Context budget: {app.state.max_context_tokens or 'context window'} tokens max, "
+              f"layout: {app.state.context_layout}")
+        retrieval_cache = LRUCache("retrieval_results", max_entries=app.state.retrieval_cache_size)
+        print(f"[OK] Retrieval cache: {app.state.retrieval_cache_size} entries "
+              f"(collection version {default_collection().version})")
+        session_cache = SessionRetrievalCache(
+            max_entries=app.state.session_cache_size,
+            ttl_seconds=app.state.session_cache_ttl,
+            threshold=app.state.session_reuse_threshold
+        )
+        skip_rules = compile_skip_rules(app.state.skip_patterns)
+        print(f"[OK] Retrieval gate: {len(skip_rules)} skip rule(s), "
+              f"max distance {app.state.max_distance if app.state.max_distance is not None else 'off'}")
+        print(f"[OK] Session reuse: {app.state.session_cache_size} sessions, "
+              f"cosine >= {app.state.session_reuse_threshold}")
+        
+        with startup.phase("warmup"):
+            await warm_up()
+        
+        if app.state.alias_poll_interval > 0:
+            alias_watcher = asyncio.create_task(watch_aliases(app.state.alias_poll_interval))
+            print(f"[OK] Collection hot swap: watching {CHROMA_DIR.name}/aliases.json "
+                  f"every {app.state.alias_poll_interval:.0f}s")
+    except Exception as e:
+        startup.mark_failed(e)
+        print(f"[ERROR] Startup failed: {startup.error}")
+        return
+    
+    startup.mark_loaded()
+    print(f"[OK] Components loaded in {startup.loaded_s:.1f}s")
+    is_ready()
+
+
+async def warm_up():
+    """One encode through the worker pool and one search per collection, so the first query skips lazy init"""
+    start = time.perf_counter()
+    query_embedding = await embed_batcher.encode(WARMUP_QUERY)
+    for served in collections.values():
+        await asyncio.to_thread(timed_query, served.index, query_embedding, 1)
+        if served.lexical_index:
+            served.lexical_index.query_ids(WARMUP_QUERY, 1)
+    print(f"[OK] Warm-up: encode + search of {len(collections)} collection(s) "
+          f"in {(time.perf_counter() - start) * 1000:.0f}ms")
+
+
+def is_ready() -> bool:
+    """Components loaded and a vLLM backend healthy; the first time is recorded and announced"""
+    ready = startup is not None and startup.loaded and vllm_backends.available.is_set()
+    if ready and startup.ready_s is None:
+        startup.mark_ready()
+        print("")
+        print("━" * 80)
+        print(f"[OK] RAG Proxy Server ready! ({startup.ready_s:.1f}s after start)")
+        print("━" * 80)
+        print(f"Listening on: http://localhost:{app.state.port}")
+        print(f"All requests will be automatically augmented with RAG context")
+        print("")
+    return ready
+
+
+def require_admin(request: Request, authorization: Optional[str]):
+    """
+    Allow a mutating admin request.
+    
+    Raises:
+        HTTPException: 401 without the admin token (--admin-token), 403 from a
+                       non-loopback client when no token is configured, 503
+                       until the collections are loaded
+    """
+    token = app.state.admin_token
+    if token:
+        supplied = (authorization or "").removeprefix("Bearer ").strip()
+        if not hmac.compare_digest(supplied.encode(), token.encode()):
+            raise HTTPException(status_code=401, detail="Admin token required (Authorization: Bearer <token>)",
+                                headers={"WWW-Authenticate": "Bearer"})
+    else:
+        try:
+            loopback = ipaddress.ip_address(request.client.host).is_loopback
+        except (AttributeError, ValueError):
+            loopback = False
+        if not loopback:
+            raise HTTPException(status_code=403, detail="Admin endpoints are loopback-only without --admin-token")
+    if not startup.loaded:
+        raise HTTPException(status_code=503, detail=f"RAG proxy {'startup failed' if startup.error else 'starting'}: "
+                                                    f"collections not loaded",
+                            headers={"Retry-After": str(NOT_READY_RETRY_AFTER_S)})
+
+
+def require_ready():
+    """
+    Fail fast while the proxy cannot answer completions.
+    
+    Raises:
+        HTTPException: 503 + Retry-After while loading, after a failed startup,
+                       or while no vLLM backend is up
+    """
+    if is_ready():
+        return
+    if startup.error:
+        detail = f"RAG proxy startup failed: {startup.error}"
+    elif not startup.loaded:
+        detail = "RAG proxy starting: loading embedder and vector store"
+    else:
+        detail = "No vLLM backend available yet"
+    raise HTTPException(status_code=503, detail=detail, headers={"Retry-After": str(NOT_READY_RETRY_AFTER_S)})
 
 
 app = FastAPI(
@@ -152,14 +684,145 @@ app = FastAPI(
 )
 
 
+def create_upstream_client(base_url: str, max_connections: int, max_keepalive: int,
+                           timeout: float) -> httpx.AsyncClient:
+    """Create pooled async HTTP client for one vLLM server (keep-alive connections)"""
+    print(f"[VLLM] Creating upstream connection pool:")
+    print(f"   Backend: {base_url}")
+    print(f"   Max connections: {max_connections} (keep-alive: {max_keepalive})")
+    print(f"   Timeout: {timeout:.0f}s")
+    
+    return httpx.AsyncClient(
+        base_url=base_url,
+        headers={"Authorization": f"Bearer {VLLM_API_KEY}"},
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=UPSTREAM_KEEPALIVE_EXPIRY
+        ),
+        timeout=httpx.Timeout(timeout, connect=10.0)
+    )
+
+
+@contextmanager
+def timed_stage(timings: Optional[Dict[str, float]], name: str):
+    """Add the duration of a request stage to its timings (errors are counted per stage)"""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        errors_total.inc(stage=name)
+        raise
+    finally:
+        if timings is not None:
+            timings[name] = timings.get(name, 0.0) + time.perf_counter() - start
+
+
+def rag_response_headers(timings: Dict[str, float], context_tokens: int) -> Dict[str, str]:
+    """Server-Timing breakdown (ms) and context size headers for one response"""
+    server_timing = ", ".join(
+        f"{name};dur={timings.get(name, 0.0) * 1000:.1f}" for name in SERVER_TIMING_STAGES
+    )
+    return {"Server-Timing": server_timing, "X-RAG-Context-Tokens": str(context_tokens)}
+
+
+def context_budget(requested: Optional[int], prompt_texts: List[str], max_tokens: Optional[int],
+                   model: str) -> Optional[int]:
+    """
+    Context token budget for one request (None = unlimited).
+    
+    Smallest of the request's max_context_tokens, the server-wide
+    --max-context-tokens, and what is left of the model's context window
+    (vLLM max_model_len) after the conversation, the generation (max_tokens)
+    and a fixed reserve.
+    """
+    limits = [limit for limit in (requested, app.state.max_context_tokens) if limit is not None]
+    max_model_len = vllm_backends.max_model_len(model)
+    if max_model_len:
+        remaining = (max_model_len - conversation_tokens(prompt_texts)
+                     - (max_tokens or 0) - CONTEXT_RESERVE_TOKENS)
+        limits.append(remaining)
+    return max(0, min(limits)) if limits else None
+
+
+async def admit_request():
+    """
+    Admission ticket for one request (None with admission control off).
+    
+    Raises:
+        HTTPException: 429 with Retry-After when the proxy or vLLM is saturated
+    """
+    if admission is None:
+        return None
+    try:
+        return await admission.admit()
+    except AdmissionRejected as e:
+        print(f"[ADMISSION] Rejected ({e.reason}), Retry-After {e.retry_after}s")
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+
+def observe_request(timings: Dict[str, float]):
+    """Record a finished request's stage timings in the latency histograms"""
+    total = time.perf_counter() - timings["start"]
+    timings["overhead"] = max(0.0, total - timings.get("upstream", 0.0))
+    for name, histogram in stage_seconds.items():
+        if name in timings:
+            histogram.observe(timings[name])
+
+
 def load_embedder():
-    """Load embedding model at startup"""
-    print(f"[EMBED] Loading model: {EMBEDDING_MODEL}")
-    embedder = SentenceTransformer(EMBEDDING_MODEL)
-    print(f"[OK] Model loaded")
+    """Load embedding model at startup (--embedding-backend) and fingerprint it"""
+    global embedder_fingerprint
+    print(f"[EMBED] Loading model: {EMBEDDING_MODEL} ({app.state.embedding_backend})")
+    embedder = load_embedding_model(EMBEDDING_MODEL, app.state.embedding_backend)
+    embedder_fingerprint = embedding_fingerprint(embedder, EMBEDDING_MODEL, app.state.embedding_backend)
+    print(f"[OK] Model loaded (reference hash {embedder_fingerprint['embedding_reference_hash']})")
     return embedder
 
 
+def verify_embeddings(served: "ServedCollection") -> Dict[str, Any]:
+    """
+    Check the query embedder against a collection's embedding fingerprint.
+    
+    Raises:
+        FingerprintError: Collection embedded with another model, dimension or normalization
+        AgreementError: Stored chunk embeddings not reproduced within --min-agreement
+    """
+    report = verify_fingerprint(served.collection, embedder, embedder_fingerprint,
+                                app.state.min_agreement, app.state.agreement_sample)
+    if report["status"] == "match":
+        print(f"[OK] {served.alias} embedding fingerprint matches: {report['stored']}")
+    elif report["status"] == "agreement":
+        agreement = report["agreement"]
+        print(f"[OK] {served.alias} embeddings ({report['stored']}) agree with {report['query']}: "
+              f"min cosine {agreement['min']:.4f}, mean {agreement['mean']:.4f} over {agreement['texts']} "
+              f"chunks (threshold {agreement['threshold']})")
+    else:
+        print(f"[WARN] {served.alias} embedded with {report['stored']}, queries use {report['query']} - "
+              f"unverified: {report['reason']}")
+    served.embedding_check = report
+    return report
+
+
+def verify_collections():
+    """Check every served collection against the query embedder (startup, after the parallel loads)"""
+    for served in collections.values():
+        verify_embeddings(served)
+
+
+def load_reranker(model_name: str, budget_ms: float, cache_size: int) -> Reranker:
+    """Load the cross-encoder (CPU) and run one warm-up pass so the first request stays within budget"""
+    print(f"[LOAD] Loading reranker: {model_name}")
+    cross_encoder = CrossEncoder(model_name, device="cpu")
+    start = time.perf_counter()
+    cross_encoder.predict([("warm up", "warm up")])
+    print(f"[OK] Reranker loaded (warm-up {(time.perf_counter() - start) * 1000:.0f}ms)")
+    return Reranker(
+        lambda pairs: cross_encoder.predict(pairs, batch_size=len(pairs)),
+        model_name, budget_ms=budget_ms, cache_size=cache_size
+    )
+
+
 def load_vector_store(persist_dir: Path, collection_name: str):
     """Load ChromaDB at startup"""
     print(f"\n[CHROMA] Loading vector store:")
@@ -174,52 +837,411 @@ def load_vector_store(persist_dir: Path, collection_name: str):
         settings=Settings(anonymized_telemetry=False)
     )
     
+    return client, load_collection(client, collection_name)
+
+
+def load_collections():
+    """Open the vector store and every served collection with its search indexes"""
+    global chroma_client
+    chroma_client, primary = load_vector_store(CHROMA_DIR, app.state.collection_name)
+    for name in [app.state.collection_name] + app.state.extra_collections:
+        served = ServedCollection(
+            name, primary if name == app.state.collection_name else load_collection(chroma_client, name)
+        )
+        collections[name] = served
+        if served.lexical_index:
+            print(f"[OK] {name} BM25: {len(served.lexical_index.vocab)} terms, "
+                  f"{len(served.lexical_index.doc_rows)} postings ({served.lexical_index.nbytes / 1e6:.1f} MB)")
+    record_serving(CHROMA_DIR, [served.collection.name for served in collections.values()])
+    print(f"[OK] Search backend: {app.state.backend} ({', '.join(collections)})")
+
+
+def load_collection(client, collection_name: str, physical: Optional[str] = None):
+    """Open the collection behind a name (alias) of the vector store (physical: already resolved)"""
+    physical = physical or resolve_alias(CHROMA_DIR, collection_name)
     try:
-        collection = client.get_collection(name=collection_name)
-        print(f"[OK] Collection loaded: {collection.count()} chunks")
-        return client, collection
+        collection = client.get_collection(name=physical)
+        print(f"[OK] Collection loaded: {collection_name} -> {physical} ({collection.count()} chunks)")
+        return collection
     except Exception as e:
-        raise ValueError(f"Collection '{collection_name}' not found. Run setup/2_embed_and_store.py first.")
+        raise ValueError(f"Collection '{physical}' not found. Run setup/2_embed_and_store.py first.")
+
 
+def collection_version(coll) -> str:
+    """Collection version: generation counter + build timestamp from Step 2 metadata"""
+    metadata = coll.metadata or {}
+    if "generation" in metadata:
+        return f"{metadata['generation']}:{metadata.get('created_at', '')}"
+    # Collections built before versioning: id changes whenever Step 2 recreates it
+    return str(coll.id)
 
-def retrieve_context(query: str, top_k: int = 5) -> str:
-    """Retrieve relevant context for query"""
+
+class ServedCollection:
+    """A collection served by the proxy: Chroma handle, search backend and BM25 index (--hybrid)"""
+    
+    def __init__(self, alias: str, collection):
+        self.alias = alias
+        self.collection = collection
+        self.version = collection_version(collection)
+        self.index = load_index(collection, app.state.backend, app.state.index_dtype, STORE_DIR)
+        self.lexical_index = load_lexical_index(collection, STORE_DIR) if app.state.hybrid else None
+        self.embedding_check: Optional[Dict[str, Any]] = None  # verify_embeddings() report
+    
+    @property
+    def name(self) -> str:
+        return self.alias
+    
+    @property
+    def space(self) -> str:
+        return (self.collection.metadata or {}).get("hnsw:space", "l2")
+
+
+async def swap_collections() -> Dict[str, Dict[str, Any]]:
+    """
+    Re-resolve the served aliases and swap in rebuilt collections.
+    
+    A new build and its search indexes load on a worker thread while the
+    current one keeps serving; the swap replaces one entry of `collections`,
+    so requests that already resolved their targets finish on the old build.
+    A build whose index fails to load (e.g. store file not written yet) or
+    whose embeddings do not match the query embedder (fingerprint check) is
+    skipped and the old one stays in place.
+    
+    Returns:
+        Per alias: collection served, its version, and whether it was swapped (or the load error)
+    """
+    async with swap_lock:
+        report = {}
+        for alias, served in list(collections.items()):
+            target = resolve_alias(CHROMA_DIR, alias)
+            swapped = False
+            if target != served.collection.name:
+                try:
+                    replacement = await asyncio.to_thread(
+                        lambda: ServedCollection(alias, load_collection(chroma_client, alias, target))
+                    )
+                    await asyncio.to_thread(verify_embeddings, replacement)
+                except Exception as e:
+                    print(f"[WARN] {alias} -> {target} not ready, still serving {served.collection.name}: {e}")
+                    report[alias] = {"collection": served.collection.name, "version": served.version,
+                                     "swapped": False, "error": str(e)}
+                    if isinstance(e, (FingerprintError, AgreementError)):
+                        report[alias]["retry"] = False  # Same embeddings on every retry
+                    continue
+                collections[alias] = replacement
+                record_serving(CHROMA_DIR, [served.collection.name for served in collections.values()])
+                retrieval_cache.clear()
+                print(f"[CHROMA] Swapped {alias}: {served.collection.name} -> {replacement.collection.name} "
+                      f"(version {replacement.version}), dropping cached results")
+                served, swapped = replacement, True
+            report[alias] = {"collection": served.collection.name, "version": served.version, "swapped": swapped}
+        return report
+
+
+async def watch_aliases(interval: float):
+    """Swap collections whenever aliases.json changes; retried until every new build loads or is rejected"""
+    seen = alias_mtime(CHROMA_DIR)
+    while True:
+        await asyncio.sleep(interval)
+        mtime = alias_mtime(CHROMA_DIR)
+        if mtime == seen:
+            continue
+        try:
+            report = await swap_collections()
+        except Exception as e:
+            print(f"[WARN] Collection swap failed: {e}")
+            continue
+        if not any("error" in entry and entry.get("retry", True) for entry in report.values()):
+            seen = mtime
+
+
+def default_collection() -> Optional[ServedCollection]:
+    """The --collection collection (None before startup)"""
+    return collections.get(app.state.collection_name)
+
+
+def resolve_collections(names: Optional[List[str]], top_k_overrides: Optional[Dict[str, int]],
+                        header: Optional[str], top_k: int) -> List[Tuple[ServedCollection, int]]:
+    """
+    Collections (with their top_k) to search for one request.
+    
+    The request's "collections" field wins over the X-RAG-Collections header
+    ("name[:top_k], ..."); "collection_top_k" overrides per collection.
+    Without either, only --collection is searched (its top_k can still be
+    overridden).
+    
+    Raises:
+        HTTPException: 400 for collections not served, collection_top_k names
+                       that are not searched, or malformed top_k values
+    """
+    requested = {}
+    if names:
+        requested = {name: top_k for name in names}
+    elif header:
+        for item in header.split(","):
+            name, _, k = item.strip().partition(":")
+            if not name:
+                continue
+            try:
+                requested[name] = int(k) if k else top_k
+            except ValueError:
+                raise HTTPException(status_code=400, detail=f"Invalid top_k in X-RAG-Collections: '{item.strip()}'")
+    if not requested:
+        requested = {app.state.collection_name: top_k}
+    
+    overrides = top_k_overrides or {}
+    unsearched = [name for name in overrides if name not in requested]
+    if unsearched:
+        raise HTTPException(status_code=400, detail=f"collection_top_k names collections not searched: "
+                                                    f"{unsearched} (searched: {list(requested)})")
+    requested.update(overrides)
+    unknown = [name for name in requested if name not in collections]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Collections not served: {unknown} "
+                                                    f"(available: {list(collections)})")
+    return [(collections[name], max(0, k)) for name, k in requested.items()]
+
+
+def vector_search(served: ServedCollection, query_embedding, top_k: int) -> Dict[str, Any]:
+    """Vector search, MMR re-selected if enabled"""
+    if app.state.mmr:
+        # Over-fetch candidates with their embeddings, keep top_k diverse ones
+        candidates, elapsed_ms = timed_query(
+            served.index, query_embedding, max(app.state.mmr_candidates, top_k), include_embeddings=True
+        )
+        mmr_start = time.perf_counter()
+        rows = mmr_select(query_embedding, candidates['embeddings'][0], top_k, app.state.mmr_lambda)
+        results = select_results(candidates, rows)
+        mmr_select_ms.observe((time.perf_counter() - mmr_start) * 1000)
+    else:
+        results, elapsed_ms = timed_query(served.index, query_embedding, top_k)
+    search_latency_ms.observe(elapsed_ms)
+    return results
+
+
+def hybrid_search(served: ServedCollection, query: str, query_embedding, top_k: int) -> Dict[str, Any]:
+    """Vector + BM25 search fused with reciprocal rank fusion"""
+    candidates = max(app.state.hybrid_candidates, top_k)
+    dense = vector_search(served, query_embedding, candidates)
+    
+    lexical_start = time.perf_counter()
+    lexical_ids = served.lexical_index.query_ids(query, candidates)
+    lexical_search_ms.observe((time.perf_counter() - lexical_start) * 1000)
+    
+    fused = reciprocal_rank_fusion([dense['ids'][0], lexical_ids], app.state.rrf_k)[:top_k]
+    dense_rows = {chunk_id: i for i, chunk_id in enumerate(dense['ids'][0])}
+    fetched = fetch_by_ids(served.index, [chunk_id for chunk_id, _ in fused if chunk_id not in dense_rows])
+    lexical_only_chunks_total.inc(len(fetched))
+    
+    results = {"ids": [[]], "documents": [[]], "metadatas": [[]], "distances": [[]]}
+    for chunk_id, _ in fused:
+        if chunk_id in dense_rows:
+            i = dense_rows[chunk_id]
+            document, metadata = dense['documents'][0][i], dense['metadatas'][0][i]
+            distance = dense['distances'][0][i]
+        elif chunk_id in fetched:
+            (document, metadata), distance = fetched[chunk_id], None
+        else:
+            continue
+        results['ids'][0].append(chunk_id)
+        results['documents'][0].append(document)
+        results['metadatas'][0].append(metadata)
+        results['distances'][0].append(distance)
+    return results
+
+
+async def search_collection(served: ServedCollection, query_embedding, top_k: int,
+                            version: Optional[str] = None, query: Optional[str] = None,
+                            offload: bool = False) -> Dict[str, Any]:
+    """
+    Vector (or hybrid, with query text) search, reusing cached results for the current collection version.
+    
+    With offload, a cache miss searches on a worker thread so several
+    collections can be searched concurrently.
+    """
+    if version is None:
+        version = served.version
+    mmr = (app.state.mmr_candidates, app.state.mmr_lambda) if app.state.mmr else None
+    hybrid = None
+    if app.state.hybrid and query is not None:
+        hybrid = (app.state.hybrid_candidates, app.state.rrf_k, normalize_query(query))
+    embedding_hash = hashlib.blake2b(query_embedding.tobytes(), digest_size=16).hexdigest()
+    key = (embedding_hash, top_k, served.name, version, mmr, hybrid)
+    
+    results = retrieval_cache.get(key)
+    if results is None:
+        collection_searches_total.inc(collection=served.name)
+        if hybrid:
+            search, search_args = hybrid_search, (served, query, query_embedding, top_k)
+        else:
+            search, search_args = vector_search, (served, query_embedding, top_k)
+        results = await asyncio.to_thread(search, *search_args) if offload else search(*search_args)
+        retrieval_cache.put(key, results)
+    return results
+
+
+def session_key(messages: List[Message]) -> str:
+    """Conversation key: hash of the leading messages (up to and including the first user turn)"""
+    leading = []
+    for msg in messages:
+        leading.append([msg.role, msg.content])
+        if msg.role == "user":
+            break
+    return hashlib.blake2b(json.dumps(leading).encode("utf-8"), digest_size=16).hexdigest()
+
+
+async def embed_query(query: str):
+    """Embed query text, reusing cached embeddings for repeated queries"""
+    key = (EMBEDDING_MODEL, normalize_query(query))
+    query_embedding = embedding_cache.get(key)
+    if query_embedding is None:
+        # Worker pool, batched with concurrent requests
+        query_embedding = await embed_batcher.encode(query)
+        embedding_cache.put(key, query_embedding)
+    return query_embedding
+
+
+async def retrieve_context(query: str, top_k: int = 5, budget: Optional[int] = None,
+                           timings: Optional[Dict[str, float]] = None, source_order: bool = False,
+                           session: Optional[str] = None,
+                           targets: Optional[List[Tuple[ServedCollection, int]]] = None,
+                           retrieval: Optional[Dict[str, Any]] = None):
+    """
+    Retrieve relevant context for query (stage durations are added to timings).
+    
+    Queries matching a skip rule, or whose hits are all beyond the distance
+    cutoff, get no context. With a session key, a query close to the session's previous one reuses
+    that turn's chunk set instead of searching. With a reranker, the search
+    over-fetches candidates and the cross-encoder picks top_k within its budget.
+    
+    targets lists the collections to search with their top_k (default: the
+    --collection collection with top_k); several are searched concurrently
+    and merged by distance.
+    
+    With source_order, the selected chunks are listed by (source, chunk id)
+    instead of rank, so the same chunks always produce the same text.
+    
+    If given, retrieval receives the query "embedding" and the ids of the
+    chunks placed in the context ("chunk_ids").
+    
+    Returns:
+        (context text, context tokens) - chunks packed into the token budget
+    """
+    # Retrieval gate: message-shape rules (before any embedding work)
+    rule = matching_skip_rule(query, skip_rules)
+    if rule:
+        print(f"[RAG] Retrieval skipped (rule: {rule})")
+        skipped_retrievals_total.inc(reason="rule")
+        return "", 0
+    
     # Generate query embedding
-    query_embedding = embedder.encode([query])[0]
+    with timed_stage(timings, "embed"):
+        query_embedding = await embed_query(query)
+    if retrieval is not None:
+        retrieval.update(embedding=query_embedding, chunk_ids=())
     
-    # Search
-    results = collection.query(
-        query_embeddings=[query_embedding.tolist()],
-        n_results=top_k
-    )
+    # Search (reused within a conversation, cached per collection version)
+    targets = targets or [(default_collection(), top_k)]
+    top_k = sum(k for _, k in targets)
+    fetch_k = [max(k, app.state.rerank_candidates) if reranker else k for _, k in targets]
+    with timed_stage(timings, "search"):
+        versions = [served.version for served, _ in targets]
+        scope = tuple((served.name, k, version) for (served, _), k, version in zip(targets, fetch_k, versions))
+        results = session_cache.reuse(session, query_embedding, scope) if session else None
+        if results is None:
+            search_start = time.perf_counter()
+            found = await asyncio.gather(*(
+                search_collection(served, query_embedding, k, version, query, offload=len(targets) > 1)
+                for (served, _), k, version in zip(targets, fetch_k, versions)
+            ))
+            if len(found) == 1:
+                results = found[0]
+            else:
+                results = merge_results(found, [served.space for served, _ in targets],
+                                        [served.name for served, _ in targets])
+            if session:
+                session_cache.remember(session, query_embedding, results, scope,
+                                       (time.perf_counter() - search_start) * 1000)
+    
+    # Second stage: cross-encoder order within the latency budget (first-stage order otherwise)
+    if reranker:
+        with timed_stage(timings, "rerank"):
+            results, outcome = await reranker.rerank(query, results, top_k)
+        if outcome not in ("reranked", "cached"):
+            print(f"[RAG] Rerank {outcome} - using first-stage order")
+    
+    ids, documents, metadatas = results['ids'][0], results['documents'][0], results['metadatas'][0]
+    if not documents:
+        return "", 0
     
-    if not results['documents'][0]:
-        return ""
+    # Distance cutoff: drop weak chunks, skip the context entirely if none are relevant
+    relevant = within_distance(results['distances'][0], app.state.max_distance)
+    if len(relevant) < len(documents):
+        dropped_chunks_total.inc(len(documents) - len(relevant), reason="distance")
+        ids = [ids[i] for i in relevant]
+        documents = [documents[i] for i in relevant]
+        metadatas = [metadatas[i] for i in relevant]
+        if not documents:
+            print(f"[RAG] Retrieval skipped (best distance {min(results['distances'][0]):.4f} "
+                  f"> {app.state.max_distance})")
+            skipped_retrievals_total.inc(reason="distance")
+            return "", 0
     
-    # Format context
-    context_parts = []
-    for i, (doc, metadata) in enumerate(zip(results['documents'][0], results['metadatas'][0]), 1):
-        source = metadata.get('source', 'unknown')
-        context_parts.append(f"[Source {i}: {source}]\n{doc}")
+    # Format context (ranked chunks that fit the token budget)
+    with timed_stage(timings, "assemble"):
+        selected, context_tokens = select_within_budget(documents, metadatas, budget)
+        if source_order:
+            selected = sorted(selected, key=lambda row: (
+                str(metadatas[row].get('source', '')), metadatas[row].get('chunk_id', 0)
+            ))
+        context_parts = []
+        for i, row in enumerate(selected, 1):
+            source = metadatas[row].get('source', 'unknown')
+            context_parts.append(f"[Source {i}: {source}]\n{documents[row]}")
+        context = "\n\n".join(context_parts)
+    if retrieval is not None:
+        retrieval["chunk_ids"] = tuple(ids[row] for row in selected)
     
-    return "\n\n".join(context_parts)
+    if len(selected) < len(documents):
+        print(f"[RAG] Context budget {budget} tokens: kept {len(selected)}/{len(documents)} chunks")
+    retrieved_chunks_total.inc(len(selected))
+    if len(selected) < len(documents):
+        dropped_chunks_total.inc(len(documents) - len(selected), reason="budget")
+    context_chars_total.inc(len(context))
+    context_tokens_total.inc(context_tokens)
+    return context, context_tokens
 
 
-def augment_messages_with_context(messages: List[Message], context: str, top_k: int) -> List[Message]:
-    """Insert RAG context into message history"""
+def augment_messages_with_context(messages: List[Message], context: str, top_k: int,
+                                  layout: str = "system") -> List[Message]:
+    """Insert RAG context into message history (layout: "system" or "latest")"""
     if not context:
         return messages
     
     # Extract the user's question (last user message)
     user_query = None
-    for msg in reversed(messages):
-        if msg.role == "user":
-            user_query = msg.content
+    user_index = None
+    for i in range(len(messages) - 1, -1, -1):
+        if messages[i].role == "user":
+            user_query, user_index = messages[i].content, i
             break
     
     if not user_query:
         return messages
     
+    if layout == "latest":
+        # Leave everything before the latest user turn untouched (prefix cache hit)
+        augmented_user_message = Message(
+            role="user",
+            content=f"""Retrieved Context (from top {top_k} relevant chunks of my science fiction writing documents):
+{context}
+
+Use the retrieved context above if it is relevant, and reference it naturally. If it doesn't help, rely on your general knowledge.
+
+{user_query}"""
+        )
+        return messages[:user_index] + [augmented_user_message] + messages[user_index + 1:]
+    
     # Create RAG system message
     rag_system_message = Message(
         role="system",
@@ -249,93 +1271,416 @@ Retrieved Context (from top {top_k} relevant chunks):
     return new_messages
 
 
+async def relay_stream(chunks: AsyncIterator[bytes], timings: Dict[str, float], upstream_start: float,
+                       release: Callable[[], None], ticket=None, on_complete=None):
+    """
+    Relay upstream SSE bytes, recording time to first chunk and total upstream time.
+    
+    on_complete("sse", chunks) receives the relayed chunks once the stream has
+    ended normally.
+    """
+    relayed = [] if on_complete else None
+    try:
+        async for chunk in chunks:
+            if "upstream_ttft" not in timings:
+                timings["upstream_ttft"] = time.perf_counter() - upstream_start
+            if relayed is not None:
+                relayed.append(chunk)
+            yield chunk
+        if on_complete:
+            on_complete("sse", relayed)
+    except Exception:
+        errors_total.inc(stage="upstream")
+        raise
+    finally:
+        timings["upstream"] = time.perf_counter() - upstream_start
+        observe_request(timings)
+        release()
+        if ticket:
+            ticket.release()
+
+
+async def close_stream(upstream: Optional[httpx.Response], release: Callable[[], None], ticket=None):
+    """Return the upstream connection to the pool (shared streams: leave the flight) and free the admission slot"""
+    if upstream is not None:
+        await upstream.aclose()
+    release()
+    if ticket:
+        ticket.release()
+
+
+def response_cache_key(endpoint: str, body: Dict[str, Any], targets: List[Tuple["ServedCollection", int]],
+                       versions: List[str], **extra) -> str:
+    """Canonical response cache key: request body, searched collections (with versions) and extra fields"""
+    return request_key(endpoint, {
+        "request": body,
+        "collections": [[served.name, k, version] for (served, k), version in zip(targets, versions)],
+        **extra
+    })
+
+
+def cached_response(entry: Tuple[str, Any, int], layer: str, timings: Dict[str, float], ticket=None):
+    """Replay a cached response (SSE chunks are streamed as recorded) without any upstream request"""
+    if ticket:
+        ticket.release()
+    kind, body, context_tokens = entry
+    response_cache_hits_total.inc(layer=layer)
+    observe_request(timings)
+    if kind == "sse":
+        async def replay():
+            for chunk in body:
+                yield chunk
+        response = StreamingResponse(replay(), media_type="text/event-stream", headers=STREAM_HEADERS)
+    else:
+        response = JSONResponse(body)
+    response.headers.update(rag_response_headers(timings, context_tokens))
+    response.headers["X-RAG-Cache"] = layer
+    return response
+
+
+def remember_response(exact_key: str, scope: Optional[str], query_embedding, context_tokens: int):
+    """on_complete callback storing a finished response in both cache layers (not streams cut short by an error)"""
+    def store(kind: str, body: Any):
+        if kind == "sse" and not complete_sse(body):
+            print(f"[CACHE] Stream ended with an error or without [DONE] - not cached")
+            return
+        entry = (kind, body, context_tokens)
+        response_cache.put(exact_key, entry)
+        if scope is not None:
+            semantic_response_cache.store(scope, query_embedding, entry)
+    return store
+
+
+async def send_to_backend(endpoint: str, payload: Dict[str, Any], headers: Optional[Dict[str, str]] = None):
+    """
+    Open a streamed upstream request on the best backend for the payload's model.
+    
+    Returns:
+        (httpx.Response, backend lease) - the caller closes the response and releases the lease
+    """
+    try:
+        response, lease = await vllm_backends.send(
+            payload["model"], "POST", endpoint, json=payload, headers=headers
+        )
+    except NoBackendAvailable as e:
+        print(f"[VLLM] {e}")
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    print(f"[VLLM] Forwarding to {lease.backend.url}{endpoint}")
+    return response, lease
+
+
+async def fetch_upstream(endpoint: str, payload: Dict[str, Any], timings: Dict[str, float]) -> httpx.Response:
+    """Non-streaming upstream request, read completely (the connection goes back to the pool)"""
+    upstream_start = time.perf_counter()
+    response, lease = await send_to_backend(endpoint, payload)
+    timings["upstream_ttfb"] = time.perf_counter() - upstream_start
+    try:
+        await response.aread()
+    finally:
+        await response.aclose()
+        lease.release()
+    return response
+
+
+async def open_stream(endpoint: str, payload: Dict[str, Any]):
+    """
+    Open an upstream SSE stream (identity encoding so raw bytes are valid SSE).
+    
+    Returns:
+        (httpx.Response, backend lease)
+    
+    Raises:
+        HTTPException: Upstream answered with an error status
+    """
+    with timed_stage(None, "upstream"):
+        upstream, lease = await send_to_backend(endpoint, payload, headers={"Accept-Encoding": "identity"})
+        if upstream.status_code != 200:
+            detail = (await upstream.aread()).decode("utf-8", errors="replace")
+            await upstream.aclose()
+            lease.release()
+            raise HTTPException(status_code=upstream.status_code, detail=detail)
+    return upstream, lease
+
+
+async def open_shared_stream(endpoint: str, payload: Dict[str, Any]):
+    """Upstream stream for a coalesced flight: (raw chunks, close) - closed by the flight's pump"""
+    upstream, lease = await open_stream(endpoint, payload)
+    
+    async def close():
+        await upstream.aclose()
+        lease.release()
+    
+    return upstream.aiter_raw(), close
+
+
+async def forward_to_vllm(endpoint: str, payload: Dict[str, Any], stream: bool, timings: Dict[str, float],
+                          ticket=None, on_complete=None):
+    """
+    Forward request to the vLLM backend serving payload["model"] without blocking
+    the event loop (a streaming response releases ticket when done).
+    
+    With --coalesce, identical deterministic requests in flight at the same
+    time share one upstream request (X-RAG-Coalesced: leader / follower).
+    on_complete(kind, body) receives successful responses: ("json", dict) or,
+    once the stream has ended, ("sse", raw chunks).
+    
+    Raises:
+        HTTPException: 404 unknown model, 503 no healthy backend for it, or vLLM's error status
+    """
+    coalesce = coalescer is not None and is_deterministic(payload)
+    shared = False
+    
+    if not stream:
+        with timed_stage(timings, "upstream"):
+            upstream_start = time.perf_counter()
+            if coalesce:
+                response, shared = await coalescer.call(
+                    request_key(endpoint, payload), lambda: fetch_upstream(endpoint, payload, timings)
+                )
+                if shared:
+                    timings["upstream_ttfb"] = time.perf_counter() - upstream_start
+            else:
+                response = await fetch_upstream(endpoint, payload, timings)
+            if response.status_code != 200:
+                raise HTTPException(status_code=response.status_code, detail=response.text)
+        observe_request(timings)
+        body = response.json()
+        if on_complete:
+            on_complete("json", body)
+        result = JSONResponse(body)
+    
+    else:
+        # Streaming: upstream time is recorded by relay_stream once the last byte is sent
+        upstream_start = time.perf_counter()
+        if coalesce:
+            # Followers get the chunks buffered so far, then the live stream
+            subscription, shared = await coalescer.stream(
+                request_key(endpoint, payload), lambda: open_shared_stream(endpoint, payload)
+            )
+            upstream, chunks, release = None, subscription, subscription.close
+        else:
+            upstream, lease = await open_stream(endpoint, payload)
+            chunks, release = upstream.aiter_raw(), lease.release
+        timings["upstream_ttfb"] = time.perf_counter() - upstream_start
+        
+        # Zero-copy relay: pass upstream text/event-stream bytes through as they
+        # arrive, without decoding or re-serializing each frame. vLLM already
+        # sends the terminating "data: [DONE]" event.
+        result = StreamingResponse(
+            relay_stream(chunks, timings, upstream_start, release, ticket, on_complete),
+            media_type="text/event-stream",
+            headers=STREAM_HEADERS,
+            background=BackgroundTask(close_stream, upstream, release, ticket)  # Connection returns to the pool
+        )
+    
+    if coalesce:
+        result.headers["X-RAG-Coalesced"] = "follower" if shared else "leader"
+    return result
+
+
 @app.get("/")
 async def root():
     """Health check endpoint"""
     return {
         "service": "RAG Proxy Server",
         "status": "running",
-        "vllm_backend": VLLM_BASE_URL,
+        "vllm_backends": [backend.url for backend in vllm_backends.backends],
+        "models": vllm_backends.served_models(),
         "collection": app.state.collection_name,
-        "chunks": collection.count() if collection else 0,
+        "collections": list(collections),
+        "chunks": default_collection().collection.count() if default_collection() else 0,
         "model": EMBEDDING_MODEL
     }
 
 
 @app.post("/v1/chat/completions")
-async def chat_completions(request: ChatCompletionRequest):
+async def chat_completions(request: ChatCompletionRequest,
+                           x_rag_collections: Optional[str] = Header(None)):
     """OpenAI-compatible chat completions endpoint with automatic RAG"""
+    timings = {"start": time.perf_counter()}
+    requests_total.inc(endpoint="chat_completions", stream=str(bool(request.stream)).lower())
+    layout = request.context_layout or app.state.context_layout
+    ticket = None
+    response = None
     try:
+        require_ready()
+        if layout not in CONTEXT_LAYOUTS:
+            errors_total.inc(stage="request")
+            raise HTTPException(status_code=400, detail=f"Unknown context_layout '{layout}' (choose from {CONTEXT_LAYOUTS})")
+        try:
+            targets = resolve_collections(request.collections, request.collection_top_k,
+                                          x_rag_collections, request.top_k)
+        except HTTPException:
+            errors_total.inc(stage="request")
+            raise
+        
         # Extract user query for RAG retrieval
-        user_query = None
-        for msg in reversed(request.messages):
-            if msg.role == "user":
-                user_query = msg.content
+        user_query, user_index = None, None
+        for i in range(len(request.messages) - 1, -1, -1):
+            if request.messages[i].role == "user":
+                user_query, user_index = request.messages[i].content, i
                 break
         
         if not user_query:
+            errors_total.inc(stage="request")
             raise HTTPException(status_code=400, detail="No user message found")
         
+        # Response cache, exact layer: answered before taking an admission slot
+        body = request.model_dump(exclude={"collections", "collection_top_k"})
+        cache_key = None
+        if response_cache is not None and is_deterministic(body):
+            versions = [served.version for served, _ in targets]
+            cache_key = response_cache_key("/chat/completions", body, targets, versions, layout=layout)
+            entry = response_cache.get(cache_key)
+            if entry is not None:
+                print(f"[CACHE] Exact response hit")
+                response = cached_response(entry, "exact", timings)
+                return response
+        
+        ticket = await admit_request()
+        
         # Retrieve context
         print(f"[RAG] Query: {user_query[:100]}...")
-        context = retrieve_context(user_query, top_k=request.top_k)
+        budget = context_budget(
+            request.max_context_tokens,
+            [msg.content for msg in request.messages],
+            request.max_tokens,
+            request.model
+        )
+        retrieval = {}
+        context, context_tokens = await retrieve_context(
+            user_query, top_k=request.top_k, budget=budget, timings=timings,
+            source_order=(layout == "latest"), session=session_key(request.messages), targets=targets,
+            retrieval=retrieval
+        )
         print(f"[RAG] Retrieved {len(context)} chars of context")
         
+        # Response cache, semantic layer: same request but the query, same chunks, near-identical query
+        on_complete = None
+        if cache_key:
+            scope = None
+            if "embedding" in retrieval:
+                scope_messages = [dict(msg) for msg in body["messages"]]
+                scope_messages[user_index]["content"] = None
+                scope = response_cache_key("/chat/completions", {**body, "messages": scope_messages}, targets,
+                                           versions, layout=layout, chunk_ids=retrieval["chunk_ids"])
+                entry = semantic_response_cache.lookup(scope, retrieval["embedding"])
+                if entry is not None:
+                    print(f"[CACHE] Semantic response hit")
+                    response_cache.put(cache_key, entry)
+                    response = cached_response(entry, "semantic", timings, ticket)
+                    return response
+            on_complete = remember_response(cache_key, scope, retrieval.get("embedding"), context_tokens)
+        
         # Track query
         query_history.append({
             "timestamp": datetime.now().isoformat(),
             "query": user_query[:200],  # First 200 chars
             "context_length": len(context),
+            "context_tokens": context_tokens,
             "model": request.model
         })
         if len(query_history) > MAX_HISTORY:
             query_history.pop(0)
         
         # Augment messages with context
-        augmented_messages = augment_messages_with_context(
-            request.messages, 
-            context,
-            request.top_k
-        )
+        with timed_stage(timings, "assemble"):
+            augmented_messages = augment_messages_with_context(
+                request.messages, 
+                context,
+                sum(k for _, k in targets),
+                layout
+            )
         
         # Forward to vLLM
-        print(f"[VLLM] Forwarding to {VLLM_BASE_URL}")
-        response = vllm_client.chat.completions.create(
-            model=request.model,
-            messages=[{"role": msg.role, "content": msg.content} for msg in augmented_messages],
-            temperature=request.temperature,
-            max_tokens=request.max_tokens,
-            stream=request.stream
+        response = await forward_to_vllm(
+            "/chat/completions",
+            {
+                "model": request.model,
+                "messages": [{"role": msg.role, "content": msg.content} for msg in augmented_messages],
+                "temperature": request.temperature,
+                "max_tokens": request.max_tokens,
+                "stream": request.stream
+            },
+            request.stream,
+            timings,
+            ticket,
+            on_complete
         )
-        
-        if request.stream:
-            # Handle streaming response
-            async def generate():
-                for chunk in response:
-                    yield f"data: {chunk.model_dump_json()}\n\n"
-                yield "data: [DONE]\n\n"
-            
-            return StreamingResponse(generate(), media_type="text/event-stream")
-        else:
-            # Return regular response
-            return response.model_dump()
+        response.headers.update(rag_response_headers(timings, context_tokens))
+        return response
     
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"[ERROR] {e}")
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        # Streaming responses release the slot once the last byte is relayed
+        if ticket and not isinstance(response, StreamingResponse):
+            ticket.release()
 
 
 @app.post("/v1/completions")
-async def completions(request: CompletionRequest):
+async def completions(request: CompletionRequest,
+                      x_rag_collections: Optional[str] = Header(None)):
     """OpenAI-compatible completions endpoint with automatic RAG"""
+    timings = {"start": time.perf_counter()}
+    requests_total.inc(endpoint="completions", stream=str(bool(request.stream)).lower())
+    ticket = None
+    response = None
     try:
+        require_ready()
+        try:
+            targets = resolve_collections(request.collections, request.collection_top_k,
+                                          x_rag_collections, request.top_k)
+        except HTTPException:
+            errors_total.inc(stage="request")
+            raise
+        
+        # Response cache, exact layer: answered before taking an admission slot
+        body = request.model_dump(exclude={"collections", "collection_top_k"})
+        cache_key = None
+        if response_cache is not None and is_deterministic(body):
+            versions = [served.version for served, _ in targets]
+            cache_key = response_cache_key("/completions", body, targets, versions)
+            entry = response_cache.get(cache_key)
+            if entry is not None:
+                print(f"[CACHE] Exact response hit")
+                response = cached_response(entry, "exact", timings)
+                return response
+        
+        ticket = await admit_request()
+        
         # Retrieve context
         print(f"[RAG] Query: {request.prompt[:100]}...")
-        context = retrieve_context(request.prompt, top_k=request.top_k)
+        budget = context_budget(request.max_context_tokens, [request.prompt], request.max_tokens,
+                                request.model)
+        retrieval = {}
+        context, context_tokens = await retrieve_context(
+            request.prompt, top_k=request.top_k, budget=budget, timings=timings, targets=targets,
+            retrieval=retrieval
+        )
         print(f"[RAG] Retrieved {len(context)} chars of context")
         
+        # Response cache, semantic layer: same request but the prompt, same chunks, near-identical prompt
+        on_complete = None
+        if cache_key:
+            scope = None
+            if "embedding" in retrieval:
+                scope = response_cache_key("/completions", {**body, "prompt": None}, targets, versions,
+                                           chunk_ids=retrieval["chunk_ids"])
+                entry = semantic_response_cache.lookup(scope, retrieval["embedding"])
+                if entry is not None:
+                    print(f"[CACHE] Semantic response hit")
+                    response_cache.put(cache_key, entry)
+                    response = cached_response(entry, "semantic", timings, ticket)
+                    return response
+            on_complete = remember_response(cache_key, scope, retrieval.get("embedding"), context_tokens)
+        
         # Augment prompt with context
-        augmented_prompt = f"""Retrieved Context:
+        with timed_stage(timings, "assemble"):
+            augmented_prompt = f"""Retrieved Context:
 {context}
 
 User Query:
@@ -344,30 +1689,53 @@ User Query:
 Response:"""
         
         # Forward to vLLM
-        print(f"[VLLM] Forwarding to {VLLM_BASE_URL}")
-        response = vllm_client.completions.create(
-            model=request.model,
-            prompt=augmented_prompt,
-            temperature=request.temperature,
-            max_tokens=request.max_tokens,
-            stream=request.stream
+        response = await forward_to_vllm(
+            "/completions",
+            {
+                "model": request.model,
+                "prompt": augmented_prompt,
+                "temperature": request.temperature,
+                "max_tokens": request.max_tokens,
+                "stream": request.stream
+            },
+            request.stream,
+            timings,
+            ticket,
+            on_complete
         )
-        
-        if request.stream:
-            # Handle streaming response
-            async def generate():
-                for chunk in response:
-                    yield f"data: {chunk.model_dump_json()}\n\n"
-                yield "data: [DONE]\n\n"
-            
-            return StreamingResponse(generate(), media_type="text/event-stream")
-        else:
-            # Return regular response
-            return response.model_dump()
+        response.headers.update(rag_response_headers(timings, context_tokens))
+        return response
     
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"[ERROR] {e}")
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        # Streaming responses release the slot once the last byte is relayed
+        if ticket and not isinstance(response, StreamingResponse):
+            ticket.release()
+
+
+@app.get("/live")
+async def live():
+    """Liveness: the server answers (components may still be loading); 503 once startup has failed"""
+    if startup.error:
+        return JSONResponse(status_code=503, content={"status": "failed", "error": startup.error})
+    return {"status": "alive", "uptime_s": round(startup.elapsed(), 1)}
+
+
+@app.get("/ready")
+async def ready():
+    """Readiness: components loaded and warmed up, and a vLLM backend in rotation (503 until then)"""
+    body = {
+        "ready": is_ready(),
+        "components_loaded": startup.loaded,
+        "vllm_available": vllm_backends.available.is_set(),
+        "startup": startup.stats()
+    }
+    return JSONResponse(status_code=200 if body["ready"] else 503, content=body,
+                        headers=None if body["ready"] else {"Retry-After": str(NOT_READY_RETRY_AFTER_S)})
 
 
 @app.get("/health")
@@ -375,24 +1743,182 @@ async def health():
     """Detailed health check"""
     return {
         "rag_proxy": "healthy",
+        "ready": is_ready(),
         "embedder": "loaded" if embedder else "not loaded",
-        "vector_store": "connected" if collection else "not connected",
-        "chunks": collection.count() if collection else 0,
-        "vllm_backend": VLLM_BASE_URL
+        "vector_store": "connected" if collections else "not connected",
+        "search_backend": app.state.backend,
+        "chunks": default_collection().collection.count() if default_collection() else 0,
+        "collections": {name: served.index.count() for name, served in collections.items()},
+        "vllm_backends": {
+            backend.name: {"healthy": backend.healthy, "models": list(backend.models)}
+            for backend in vllm_backends.backends
+        }
     }
 
 
+@app.get("/v1/models")
+async def list_models():
+    """OpenAI-compatible model list: every model served by a healthy vLLM backend"""
+    return {"object": "list", "data": vllm_backends.model_cards()}
+
+
+@app.post("/admin/collections/reload")
+async def reload_collections(http_request: Request, authorization: Optional[str] = Header(None)):
+    """Swap in rebuilt collections now instead of waiting for the aliases.json watch"""
+    require_admin(http_request, authorization)
+    return {"collections": await swap_collections()}
+
+
+@app.put("/admin/collections/{alias}")
+async def point_alias(alias: str, request: AliasRequest, http_request: Request,
+                      authorization: Optional[str] = Header(None)):
+    """Point a served alias at another build (e.g. roll back a generation) and swap"""
+    require_admin(http_request, authorization)
+    if alias not in collections:
+        raise HTTPException(status_code=404, detail=f"Collection not served: {alias} "
+                                                    f"(available: {list(collections)})")
+    try:
+        chroma_client.get_collection(name=request.collection)
+    except Exception:
+        raise HTTPException(status_code=404, detail=f"Collection '{request.collection}' not found")
+    previous = set_alias(CHROMA_DIR, alias, request.collection)
+    print(f"[CHROMA] Alias {alias}: {previous or alias} -> {request.collection}")
+    return {"alias": alias, "previous": previous, "collections": await swap_collections()}
+
+
 @app.get("/stats")
 async def stats():
     """RAG proxy statistics and recent queries"""
     return {
         "total_queries": len(query_history),
         "recent_queries": query_history[-5:],  # Last 5 queries
-        "chunks_available": collection.count() if collection else 0,
-        "embedding_model": EMBEDDING_MODEL
+        "chunks_available": default_collection().collection.count() if default_collection() else 0,
+        "embedding_model": EMBEDDING_MODEL,
+        "embedding_backend": app.state.embedding_backend,
+        "embedding_fingerprints": {alias: served.embedding_check for alias, served in collections.items()},
+        "embedding_batching": embed_batcher.stats() if embed_batcher else {},
+        "embedding_cache": embedding_cache.stats() if embedding_cache else {},
+        "rerank": reranker.stats() if reranker else {"enabled": False},
+        "admission": admission.stats() if admission else {"enabled": False},
+        "coalescing": coalescer.stats() if coalescer else {"enabled": False},
+        "response_cache": {
+            "exact": response_cache.stats(),
+            "semantic": semantic_response_cache.stats(),
+            "hits": response_cache_hits_total.snapshot()
+        } if response_cache is not None else {"enabled": False},
+        "vllm_backends": vllm_backends.stats() if vllm_backends else {},
+        "startup": startup.stats() if startup else {},
+        "search": {
+            "backend": app.state.backend,
+            "latency_ms_histogram": search_latency_ms.snapshot(),
+            "mmr": {
+                "enabled": app.state.mmr,
+                "candidates": app.state.mmr_candidates,
+                "lambda": app.state.mmr_lambda,
+                "select_ms_histogram": mmr_select_ms.snapshot()
+            },
+            "hybrid": {
+                "enabled": app.state.hybrid,
+                "candidates": app.state.hybrid_candidates,
+                "rrf_k": app.state.rrf_k,
+                "terms": {name: len(served.lexical_index.vocab)
+                          for name, served in collections.items() if served.lexical_index},
+                "lexical_only_chunks": lexical_only_chunks_total.value(),
+                "lexical_search_ms_histogram": lexical_search_ms.snapshot()
+            }
+        },
+        "retrieval_cache": {
+            **(retrieval_cache.stats() if retrieval_cache else {}),
+            "collection_version": default_collection().version if default_collection() else None
+        },
+        "collections": {
+            name: {
+                "collection": served.collection.name,
+                "chunks": served.index.count(),
+                "version": served.version,
+                "searches": collection_searches_total.value(collection=name)
+            }
+            for name, served in collections.items()
+        },
+        "session_reuse": session_cache.stats() if session_cache else {},
+        "retrieval_gate": {
+            "skip_rules": len(skip_rules),
+            "max_distance": app.state.max_distance,
+            "skipped": skipped_retrievals_total.snapshot(),
+            "dropped_chunks": dropped_chunks_total.snapshot()
+        }
     }
 
 
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics (text exposition format, same surface as vLLM's /metrics)"""
+    caches = [c for c in (embedding_cache, retrieval_cache, session_cache,
+                          response_cache, semantic_response_cache) if c is not None]
+    if reranker:
+        caches.append(reranker.cache)
+    blocks = [
+        format_metric("cache_hits_total", "counter", "Cache hits",
+                      [({"cache": c.name}, c.hits) for c in caches]),
+        format_metric("cache_misses_total", "counter", "Cache misses",
+                      [({"cache": c.name}, c.misses) for c in caches]),
+        format_metric("cache_entries", "gauge", "Entries currently cached",
+                      [({"cache": c.name}, len(c)) for c in caches]),
+        format_metric("session_reuses_total", "counter", "Chat turns that reused the previous turn's chunk set",
+                      [({}, session_cache.reuses if session_cache else 0)]),
+        format_metric("session_search_saved_seconds_total", "counter", "Search time skipped by session reuse (s)",
+                      [({}, session_cache.search_ms_saved / 1000 if session_cache else 0.0)]),
+        format_metric("collection_chunks", "gauge", "Chunks in each served collection",
+                      [({"collection": name}, served.index.count()) for name, served in collections.items()]),
+    ]
+    histograms = list(stage_seconds.values()) + [search_latency_ms, mmr_select_ms, lexical_search_ms]
+    if embed_batcher:
+        histograms += [embed_batcher.batch_sizes, embed_batcher.queue_wait_ms, embed_batcher.encode_ms]
+    counters = [requests_total, errors_total, retrieved_chunks_total, dropped_chunks_total,
+                skipped_retrievals_total, lexical_only_chunks_total, collection_searches_total,
+                response_cache_hits_total,
+                context_chars_total, context_tokens_total]
+    if reranker:
+        histograms.append(reranker.score_ms)
+        counters.append(reranker.outcomes)
+    if coalescer:
+        counters.append(coalescer.requests)
+        blocks.append(format_metric(
+            "coalesce_inflight", "gauge", "Shared upstream requests in flight",
+            [({"mode": "call"}, len(coalescer.calls)), ({"mode": "stream"}, len(coalescer.streams))]
+        ))
+    if startup:
+        blocks += [
+            format_metric("ready", "gauge", "Whether the proxy answers completions (loaded + vLLM backend up)",
+                          [({}, int(is_ready()))]),
+            format_metric("startup_phase_seconds", "gauge", "Duration of each startup phase (s)",
+                          [({"phase": name}, phase["seconds"]) for name, phase in startup.phases.items()]),
+        ]
+    if vllm_backends:
+        counters += [vllm_backends.requests, vllm_backends.failures, vllm_backends.ejections]
+        blocks += [
+            format_metric("backend_up", "gauge", "Whether a vLLM backend is in rotation",
+                          [({"backend": b.name}, int(b.healthy)) for b in vllm_backends.backends]),
+            format_metric("backend_outstanding_requests", "gauge", "Requests in progress per vLLM backend",
+                          [({"backend": b.name}, b.outstanding) for b in vllm_backends.backends]),
+        ]
+    if admission:
+        histograms.append(admission.queue_wait_ms)
+        counters.append(admission.outcomes)
+        blocks += [
+            format_metric("admission_inflight", "gauge", "Requests holding an admission slot",
+                          [({}, admission.inflight)]),
+            format_metric("admission_queued", "gauge", "Requests waiting for an admission slot",
+                          [({}, admission.queued)]),
+            format_metric("admission_predicted_wait_seconds", "gauge", "Predicted wait for a new request (s)",
+                          [({}, admission.predicted_wait())]),
+        ]
+    return PlainTextResponse(
+        render_prometheus(histograms + counters, blocks),
+        media_type="text/plain; version=0.0.4"
+    )
+
+
 def main():
     parser = argparse.ArgumentParser(
         description="RAG Proxy Server - Transparent RAG layer for vLLM"
@@ -409,18 +1935,373 @@ def main():
         default="scifi_world",
         help="ChromaDB collection name (default: scifi_world)"
     )
+    parser.add_argument(
+        "--extra-collections",
+        type=str,
+        nargs="*",
+        default=[],
+        help="More collections requests may search (\"collections\" / X-RAG-Collections), "
+             "e.g. characters world_lore chapters (default: none)"
+    )
+    parser.add_argument(
+        "--alias-poll-interval",
+        type=float,
+        default=ALIAS_POLL_INTERVAL_S,
+        help="Seconds between checks of chroma_db/aliases.json for rebuilt collections; "
+             f"0 = swap only via POST /admin/collections/reload (default: {ALIAS_POLL_INTERVAL_S})"
+    )
+    parser.add_argument(
+        "--admin-token",
+        type=str,
+        default=os.environ.get("RAG_ADMIN_TOKEN"),
+        help="Bearer token for the /admin endpoints; without one they only accept loopback clients "
+             "(default: $RAG_ADMIN_TOKEN)"
+    )
     parser.add_argument(
         "--host",
         type=str,
         default="0.0.0.0",
         help="Host to bind to (default: 0.0.0.0)"
     )
+    parser.add_argument(
+        "--backend",
+        type=str,
+        choices=BACKENDS,
+        default="chroma",
+        help="Vector search backend: chroma (HNSW), exact (in-memory matrix) or mmap (embedding store file) (default: chroma)"
+    )
+    parser.add_argument(
+        "--index-dtype",
+        type=str,
+        choices=["float32", "float16"],
+        default="float32",
+        help="Exact backend matrix dtype (default: float32)"
+    )
+    parser.add_argument(
+        "--embed-batch-size",
+        type=int,
+        default=EMBED_BATCH_SIZE,
+        help=f"Max queries coalesced into one embedding batch (default: {EMBED_BATCH_SIZE})"
+    )
+    parser.add_argument(
+        "--embed-max-wait-ms",
+        type=float,
+        default=EMBED_MAX_WAIT_MS,
+        help=f"Max time a query waits to be batched (default: {EMBED_MAX_WAIT_MS})"
+    )
+    parser.add_argument(
+        "--embed-workers",
+        type=int,
+        default=EMBED_WORKERS,
+        help=f"Embedding worker threads (default: {EMBED_WORKERS})"
+    )
+    parser.add_argument(
+        "--embedding-backend",
+        type=str,
+        choices=EMBEDDING_BACKENDS,
+        default="torch",
+        help="Query embedding backend: torch (fp32), onnx (ONNX Runtime fp32), onnx-int8 "
+             "(int8-quantized, several times faster on CPU) (default: torch)"
+    )
+    parser.add_argument(
+        "--min-agreement",
+        type=float,
+        default=MIN_AGREEMENT,
+        help=f"Lowest cosine between the query embedder's and the stored embedding of a chunk when "
+             f"the collection's fingerprint hash differs (default: {MIN_AGREEMENT})"
+    )
+    parser.add_argument(
+        "--agreement-sample",
+        type=int,
+        default=AGREEMENT_SAMPLE,
+        help=f"Chunks re-encoded for the agreement check, 0 = skip (fingerprint identity still enforced) "
+             f"(default: {AGREEMENT_SAMPLE})"
+    )
+    parser.add_argument(
+        "--embed-cache-size",
+        type=int,
+        default=EMBED_CACHE_SIZE,
+        help=f"Query embedding cache entries, 0 disables (default: {EMBED_CACHE_SIZE})"
+    )
+    parser.add_argument(
+        "--embed-cache-ttl",
+        type=float,
+        default=EMBED_CACHE_TTL,
+        help=f"Query embedding cache TTL in seconds (default: {EMBED_CACHE_TTL:.0f})"
+    )
+    parser.add_argument(
+        "--retrieval-cache-size",
+        type=int,
+        default=RETRIEVAL_CACHE_SIZE,
+        help=f"Retrieval result cache entries, 0 disables (default: {RETRIEVAL_CACHE_SIZE})"
+    )
+    parser.add_argument(
+        "--mmr",
+        action="store_true",
+        help="Re-select retrieved chunks with maximal marginal relevance (drops near-duplicate neighbours)"
+    )
+    parser.add_argument(
+        "--mmr-candidates",
+        type=int,
+        default=MMR_CANDIDATES,
+        help=f"Candidates fetched before MMR re-selection (default: {MMR_CANDIDATES})"
+    )
+    parser.add_argument(
+        "--mmr-lambda",
+        type=float,
+        default=MMR_LAMBDA,
+        help=f"MMR relevance/diversity trade-off, 1.0 = plain top-k (default: {MMR_LAMBDA})"
+    )
+    parser.add_argument(
+        "--hybrid",
+        action="store_true",
+        help="Fuse BM25 (embeddings/<collection>.bm25.npz from Step 2) with vector search (RRF)"
+    )
+    parser.add_argument(
+        "--hybrid-candidates",
+        type=int,
+        default=HYBRID_CANDIDATES,
+        help=f"Hits per ranking (vector, BM25) before fusion (default: {HYBRID_CANDIDATES})"
+    )
+    parser.add_argument(
+        "--rrf-k",
+        type=int,
+        default=RRF_K,
+        help=f"Reciprocal rank fusion constant, higher flattens rank differences (default: {RRF_K})"
+    )
+    parser.add_argument(
+        "--rerank",
+        action="store_true",
+        help="Rerank over-fetched candidates with a cross-encoder (CPU, latency-bounded)"
+    )
+    parser.add_argument(
+        "--rerank-model",
+        type=str,
+        default=RERANK_MODEL,
+        help=f"Cross-encoder model (default: {RERANK_MODEL})"
+    )
+    parser.add_argument(
+        "--rerank-candidates",
+        type=int,
+        default=RERANK_CANDIDATES,
+        help=f"First-stage hits scored by the cross-encoder (default: {RERANK_CANDIDATES})"
+    )
+    parser.add_argument(
+        "--rerank-budget-ms",
+        type=float,
+        default=RERANK_BUDGET_MS,
+        help=f"Max wait for rerank scores before using first-stage order (default: {RERANK_BUDGET_MS:.0f})"
+    )
+    parser.add_argument(
+        "--rerank-cache-size",
+        type=int,
+        default=RERANK_CACHE_SIZE,
+        help=f"Cached rerank orders, 0 disables (default: {RERANK_CACHE_SIZE})"
+    )
+    parser.add_argument(
+        "--skip-patterns",
+        type=str,
+        nargs="*",
+        default=DEFAULT_SKIP_PATTERNS,
+        help="Regexes (matched at the query start, case-insensitive) for queries that skip retrieval; "
+             "pass with no values to always retrieve (default: continue/rewrite/edit commands)"
+    )
+    parser.add_argument(
+        "--max-distance",
+        type=float,
+        default=None,
+        help="Drop chunks with distance above this (collection space; for bge + l2, 1.0 ~ cosine 0.5) "
+             "(default: off)"
+    )
+    parser.add_argument(
+        "--context-layout",
+        type=str,
+        choices=CONTEXT_LAYOUTS,
+        default="system",
+        help="Chat context placement: system (after first system message) or latest "
+             "(in the latest user message, keeps history prefix-cacheable) (default: system)"
+    )
+    parser.add_argument(
+        "--max-context-tokens",
+        type=int,
+        default=None,
+        help="Max retrieved context tokens per request (default: fill the remaining context window)"
+    )
+    parser.add_argument(
+        "--session-cache-size",
+        type=int,
+        default=SESSION_CACHE_SIZE,
+        help=f"Conversations tracked for retrieval reuse, 0 disables (default: {SESSION_CACHE_SIZE})"
+    )
+    parser.add_argument(
+        "--session-cache-ttl",
+        type=float,
+        default=SESSION_CACHE_TTL,
+        help=f"Session lifetime since its last search in seconds (default: {SESSION_CACHE_TTL:.0f})"
+    )
+    parser.add_argument(
+        "--session-reuse-threshold",
+        type=float,
+        default=SESSION_REUSE_THRESHOLD,
+        help=f"Min cosine similarity to the previous query to reuse its chunks (default: {SESSION_REUSE_THRESHOLD})"
+    )
+    parser.add_argument(
+        "--response-cache",
+        action="store_true",
+        help="Cache responses of temperature-0 requests (exact + semantic layer)"
+    )
+    parser.add_argument(
+        "--response-cache-size",
+        type=int,
+        default=RESPONSE_CACHE_SIZE,
+        help=f"Responses per cache layer (default: {RESPONSE_CACHE_SIZE})"
+    )
+    parser.add_argument(
+        "--semantic-cache-threshold",
+        type=float,
+        default=SEMANTIC_CACHE_THRESHOLD,
+        help=f"Min query cosine similarity to reuse a response with the same chunks; "
+             f"above 1 disables the semantic layer (default: {SEMANTIC_CACHE_THRESHOLD})"
+    )
+    parser.add_argument(
+        "--coalesce",
+        action="store_true",
+        help="Share one vLLM request among identical temperature-0 requests in flight"
+    )
+    parser.add_argument(
+        "--admission",
+        action="store_true",
+        help="Admission control: bounded queue + 429/Retry-After when vLLM is saturated"
+    )
+    parser.add_argument(
+        "--max-inflight",
+        type=int,
+        default=ADMISSION_MAX_INFLIGHT,
+        help=f"Requests handled at once with --admission (default: {ADMISSION_MAX_INFLIGHT}, ~2x MAX_SEQS)"
+    )
+    parser.add_argument(
+        "--max-queue",
+        type=int,
+        default=ADMISSION_MAX_QUEUE,
+        help=f"Requests waiting for a slot before 429 (default: {ADMISSION_MAX_QUEUE})"
+    )
+    parser.add_argument(
+        "--max-vllm-waiting",
+        type=int,
+        default=ADMISSION_MAX_WAITING,
+        help=f"vLLM num_requests_waiting at which new requests get 429 (default: {ADMISSION_MAX_WAITING})"
+    )
+    parser.add_argument(
+        "--max-kv-usage",
+        type=float,
+        default=ADMISSION_MAX_KV_USAGE,
+        help=f"vLLM KV-cache usage (0-1) at which new requests get 429 (default: {ADMISSION_MAX_KV_USAGE})"
+    )
+    parser.add_argument(
+        "--max-queue-wait",
+        type=float,
+        default=ADMISSION_MAX_WAIT_S,
+        help=f"Max predicted/actual seconds a request may queue before 429 (default: {ADMISSION_MAX_WAIT_S:.0f})"
+    )
+    parser.add_argument(
+        "--admission-poll-interval",
+        type=float,
+        default=ADMISSION_POLL_INTERVAL_S,
+        help=f"Seconds between vLLM /metrics polls (default: {ADMISSION_POLL_INTERVAL_S})"
+    )
+    parser.add_argument(
+        "--vllm-urls",
+        type=str,
+        nargs="+",
+        default=[VLLM_BASE_URL],
+        help=f"vLLM OpenAI base URLs; requests go to a backend serving their model "
+             f"(least outstanding requests first) (default: {VLLM_BASE_URL})"
+    )
+    parser.add_argument(
+        "--health-interval",
+        type=float,
+        default=HEALTH_INTERVAL_S,
+        help=f"Seconds between vLLM backend health checks (default: {HEALTH_INTERVAL_S:.0f})"
+    )
+    parser.add_argument(
+        "--eject-after",
+        type=int,
+        default=EJECT_AFTER_FAILURES,
+        help=f"Consecutive failures before a vLLM backend leaves the rotation (default: {EJECT_AFTER_FAILURES})"
+    )
+    parser.add_argument(
+        "--max-connections",
+        type=int,
+        default=UPSTREAM_MAX_CONNECTIONS,
+        help=f"Max concurrent connections per vLLM backend (default: {UPSTREAM_MAX_CONNECTIONS})"
+    )
+    parser.add_argument(
+        "--max-keepalive",
+        type=int,
+        default=UPSTREAM_MAX_KEEPALIVE,
+        help=f"Max idle keep-alive connections to vLLM (default: {UPSTREAM_MAX_KEEPALIVE})"
+    )
+    parser.add_argument(
+        "--upstream-timeout",
+        type=float,
+        default=UPSTREAM_TIMEOUT,
+        help=f"vLLM request timeout in seconds (default: {UPSTREAM_TIMEOUT:.0f})"
+    )
     
     args = parser.parse_args()
     
     # Store in app state for startup handler
     app.state.collection_name = args.collection
+    app.state.extra_collections = [name for name in args.extra_collections if name != args.collection]
+    app.state.alias_poll_interval = args.alias_poll_interval
+    app.state.admin_token = args.admin_token
     app.state.port = args.port
+    app.state.backend = args.backend
+    app.state.index_dtype = args.index_dtype
+    app.state.embed_batch_size = args.embed_batch_size
+    app.state.embed_max_wait_ms = args.embed_max_wait_ms
+    app.state.embed_workers = args.embed_workers
+    app.state.embedding_backend = args.embedding_backend
+    app.state.min_agreement = args.min_agreement
+    app.state.agreement_sample = args.agreement_sample
+    app.state.embed_cache_size = args.embed_cache_size
+    app.state.embed_cache_ttl = args.embed_cache_ttl
+    app.state.retrieval_cache_size = args.retrieval_cache_size
+    app.state.session_cache_size = args.session_cache_size
+    app.state.session_cache_ttl = args.session_cache_ttl
+    app.state.session_reuse_threshold = args.session_reuse_threshold
+    app.state.mmr = args.mmr
+    app.state.mmr_candidates = args.mmr_candidates
+    app.state.mmr_lambda = args.mmr_lambda
+    app.state.hybrid = args.hybrid
+    app.state.hybrid_candidates = args.hybrid_candidates
+    app.state.rrf_k = args.rrf_k
+    app.state.rerank = args.rerank
+    app.state.rerank_model = args.rerank_model
+    app.state.rerank_candidates = args.rerank_candidates
+    app.state.rerank_budget_ms = args.rerank_budget_ms
+    app.state.rerank_cache_size = args.rerank_cache_size
+    app.state.skip_patterns = args.skip_patterns
+    app.state.max_distance = args.max_distance
+    app.state.context_layout = args.context_layout
+    app.state.max_context_tokens = args.max_context_tokens
+    app.state.vllm_urls = args.vllm_urls
+    app.state.health_interval = args.health_interval
+    app.state.eject_after = args.eject_after
+    app.state.max_connections = args.max_connections
+    app.state.max_keepalive = args.max_keepalive
+    app.state.upstream_timeout = args.upstream_timeout
+    app.state.coalesce = args.coalesce
+    app.state.response_cache = args.response_cache
+    app.state.response_cache_size = args.response_cache_size
+    app.state.semantic_cache_threshold = args.semantic_cache_threshold
+    app.state.admission = args.admission
+    app.state.max_inflight = args.max_inflight
+    app.state.max_queue = args.max_queue
+    app.state.max_vllm_waiting = args.max_vllm_waiting
+    app.state.max_kv_usage = args.max_kv_usage
+    app.state.max_queue_wait = args.max_queue_wait
+    app.state.admission_poll_interval = args.admission_poll_interval
     
     # Run server
     uvicorn.run(
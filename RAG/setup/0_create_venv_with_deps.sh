@@ -8,7 +8,7 @@ set -euo pipefail
 #
 # What this installs in ~/.venvs/rag:
 #   - chromadb: Vector database with persistence
-#   - sentence-transformers: Embedding models (CPU-based)
+#   - sentence-transformers[onnx]: Embedding models (CPU-based, optional ONNX/int8 backends)
 #   - langchain-community: Document loaders
 #   - langchain-text-splitters: Text chunking utilities
 #   - openai: Client for vLLM server (OpenAI-compatible)
@@ -90,7 +90,7 @@ pip install chromadb==0.5.23
 
 echo ""
 echo "[INSTALL] Step 3/5: Installing sentence-transformers (embeddings)..."
-pip install sentence-transformers==3.3.1
+pip install "sentence-transformers[onnx]==3.3.1"
 
 echo ""
 echo "[INSTALL] Step 4/5: Installing LangChain components..."
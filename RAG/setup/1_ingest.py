@@ -27,8 +27,8 @@ from langchain_community.document_loaders import (
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 
 # Directories
-DATA_DIR = Path(__file__).parent / "data"
-CHUNKS_DIR = Path(__file__).parent / "chunks"
+DATA_DIR = Path(__file__).parent.parent / "data"
+CHUNKS_DIR = Path(__file__).parent.parent / "chunks"
 CHUNKS_DIR.mkdir(exist_ok=True)
 
 
@@ -2,16 +2,36 @@
 """
 Step 2: Generate Embeddings and Store in Vector Database
 Purpose: Load chunks, create embeddings, store in ChromaDB
-Usage: ./2_embed_and_store.py [--collection my_docs]
+Usage: ./2_embed_and_store.py [--collection my_docs] [--store-dtype float16] [--tokenizer MODEL] [--keep-generations 2]
+                              [--embedding-backend onnx-int8]
 
 Process:
   1. Load chunks from Step 1 (chunks_latest.json)
-  2. Initialize embedding model (BAAI/bge-large-en-v1.5, CPU-based)
-  3. Generate embeddings for all chunks (batch processing)
-  4. Store embeddings + metadata in ChromaDB (persistent storage)
+  2. Initialize embedding model (BAAI/bge-large-en-v1.5, CPU-based; --embedding-backend
+     torch fp32 by default, or ONNX Runtime fp32 / int8)
+  3. Generate embeddings for all chunks (batch processing); with an ONNX backend,
+     check cosine agreement with fp32 on --agreement-sample chunks and stop
+     before storing anything if it is below --min-agreement
+  4. Count tokens per chunk with the served model's tokenizer (metadata "tokens",
+     used by the RAG proxy to fill a context token budget without tokenizing)
+  5. Store embeddings + metadata in a new versioned ChromaDB collection
+     (<collection>__g<generation>, persistent storage) - the live one is untouched;
+     the collection metadata carries the embedding fingerprint (model, backend,
+     precision, dimension, normalization, reference embedding hash) that the
+     RAG proxy and benchmarks verify their query embedder against
+  6. Bump collection generation counter (RAG proxy invalidates cached results)
+  7. Write memory-mappable embedding store (embeddings/<collection>__g<N>.store)
+     for the exact-search "mmap" backend (proxy + benchmarks, zero-copy)
+  8. Build BM25 inverted index (embeddings/<collection>__g<N>.bm25.npz) for hybrid
+     lexical + dense retrieval (RAG proxy --hybrid)
+  9. Flip the alias <collection> -> <collection>__g<N> (chroma_db/aliases.json,
+     atomic rename): a running RAG proxy swaps to the new build between requests
+ 10. Delete builds older than --keep-generations (with their store and index files),
+     except builds a running RAG proxy still serves (chroma_db/serving/)
 
 Dependencies:
   - sentence-transformers: Embedding generation (bge-large-en-v1.5)
+  - transformers: Served model tokenizer (chunk token counts)
   - chromadb: Vector database with persistence
 
 Note: Uses RAG virtual environment at ~/.venvs/rag
@@ -19,24 +39,30 @@ Note: Uses RAG virtual environment at ~/.venvs/rag
 
 import argparse
 import json
+import sys
 import time
 from pathlib import Path
 from datetime import datetime
-from sentence_transformers import SentenceTransformer
 import chromadb
 from chromadb.config import Settings
 
-# Directories
-CHUNKS_DIR = Path(__file__).parent / "chunks"
-CHROMA_DIR = Path(__file__).parent / "chroma_db"
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from utils.aliases import KEEP_GENERATIONS, builds, resolve_alias, serving_builds, set_alias, versioned_name
+from utils.embedders import (
+    AGREEMENT_SAMPLE, EMBEDDING_BACKENDS, EMBEDDING_MODEL, MIN_AGREEMENT, AgreementError, check_agreement,
+    describe_fingerprint, embedding_fingerprint, load_embedding_model, sample_rows
+)
+from utils.embedding_store import DTYPES, store_path, write_store
+from utils.lexical_index import LexicalIndex, lexical_index_path
 
-# Embedding model - optimized for science fiction writing
-# Using bge-large-en-v1.5 for best semantic understanding of:
-# - Character personality nuances
-# - Thematic connections
-# - Worldbuilding details
-# - Plot coherence
-EMBEDDING_MODEL = "BAAI/bge-large-en-v1.5"  # 1024 dims
+# Directories (RAG/, shared with the proxy and benchmarks)
+CHUNKS_DIR = Path(__file__).parent.parent / "chunks"
+CHROMA_DIR = Path(__file__).parent.parent / "chroma_db"
+STORE_DIR = Path(__file__).parent.parent / "embeddings"
+
+# Tokenizer of the model served by vLLM (serve_vllm.sh default) - chunk token
+# counts must match the model that will read the context
+SERVED_MODEL = "meta-llama/Llama-3.1-8B-Instruct"
 
 
 def load_chunks(chunks_file):
@@ -57,20 +83,22 @@ def load_chunks(chunks_file):
     return chunks_data
 
 
-def create_embedder():
+def create_embedder(backend="torch"):
     """Initialize embedding model (runs on CPU)"""
     print(f"\n[EMBED] Initializing embedding model:")
     print(f"   Model: {EMBEDDING_MODEL}")
+    print(f"   Backend: {backend}")
     print(f"   Device: CPU (runs separate from vLLM GPU)")
     
-    embedder = SentenceTransformer(EMBEDDING_MODEL)
+    embedder = load_embedding_model(EMBEDDING_MODEL, backend)
     
-    # Get embedding dimension
-    test_embedding = embedder.encode(["test"])
-    dim = len(test_embedding[0])
-    print(f"[OK] Model loaded - Embedding dimension: {dim}")
+    # Fingerprint (embedding dimension, normalization, reference embedding hash)
+    fingerprint = embedding_fingerprint(embedder, EMBEDDING_MODEL, backend)
+    print(f"[OK] Model loaded - Embedding dimension: {fingerprint['embedding_dim']}")
+    print(f"   Fingerprint: {describe_fingerprint(fingerprint)}, "
+          f"reference hash {fingerprint['embedding_reference_hash']}")
     
-    return embedder, dim
+    return embedder, fingerprint
 
 
 def generate_embeddings(chunks_data, embedder, batch_size=32):
@@ -102,6 +130,29 @@ def generate_embeddings(chunks_data, embedder, batch_size=32):
     return embeddings
 
 
+def count_tokens(chunks_data, tokenizer_name):
+    """Count tokens per chunk with the served model's tokenizer (None if unavailable)"""
+    print(f"\n[TOKENS] Counting chunk tokens:")
+    print(f"   Tokenizer: {tokenizer_name}")
+    
+    try:
+        from transformers import AutoTokenizer
+        tokenizer = AutoTokenizer.from_pretrained(tokenizer_name)
+    except Exception as e:
+        print(f"[WARN] Tokenizer not available: {e}")
+        print(f"[INFO] Chunk token counts not stored - the RAG proxy will estimate them")
+        return None
+    
+    texts = [chunk['content'] for chunk in chunks_data['chunks']]
+    encoded = tokenizer(texts, add_special_tokens=False)["input_ids"]
+    token_counts = [len(ids) for ids in encoded]
+    
+    total = sum(token_counts)
+    print(f"[OK] {total} tokens ({total / max(len(token_counts), 1):.0f} per chunk)")
+    
+    return token_counts
+
+
 def create_vector_store(persist_dir):
     """Initialize ChromaDB client"""
     print(f"\n[STORE] Initializing ChromaDB:")
@@ -122,31 +173,9 @@ def create_vector_store(persist_dir):
     return client
 
 
-def store_embeddings(client, collection_name, chunks_data, embeddings):
-    """Store chunks and embeddings in ChromaDB collection"""
+def prepare_records(chunks_data, token_counts=None):
+    """Build ids, documents and metadata lists (shared by ChromaDB and the embedding store)"""
     chunks = chunks_data['chunks']
-    
-    print(f"\n[STORE] Storing in collection: {collection_name}")
-    print(f"   Chunks: {len(chunks)}")
-    
-    # Delete existing collection if it exists
-    try:
-        client.delete_collection(name=collection_name)
-        print(f"[INFO] Deleted existing collection: {collection_name}")
-    except:
-        pass
-    
-    # Create collection
-    collection = client.create_collection(
-        name=collection_name,
-        metadata={
-            "description": "RAG document store",
-            "created_at": datetime.now().isoformat(),
-            "total_chunks": len(chunks)
-        }
-    )
-    
-    # Prepare data for batch insert
     ids = [f"chunk_{chunk['id']}" for chunk in chunks]
     documents = [chunk['content'] for chunk in chunks]
     metadatas = [
@@ -157,6 +186,67 @@ def store_embeddings(client, collection_name, chunks_data, embeddings):
         }
         for chunk in chunks
     ]
+    if token_counts is not None:
+        for metadata, tokens in zip(metadatas, token_counts):
+            metadata["tokens"] = tokens
+    return ids, documents, metadatas
+
+
+def collection_names(client):
+    """Names of all collections (list_collections returns names or objects depending on the version)"""
+    return [getattr(c, "name", c) for c in client.list_collections()]
+
+
+def verify_agreement(chunks_data, embeddings, backend, sample, min_agreement):
+    """Compare a sample of the backend's chunk embeddings with fp32 torch ones (raises AgreementError)"""
+    rows = sample_rows(len(embeddings), sample)
+    texts = [chunks_data['chunks'][row]['content'] for row in rows]
+    print(f"\n[AGREEMENT] Checking {backend} against fp32 on {len(rows)} chunks...")
+    reference = load_embedding_model(EMBEDDING_MODEL, "torch")
+    report = check_agreement(reference, texts, embeddings[rows], min_agreement)
+    print(f"[OK] Min cosine {report['min']:.4f}, 1st percentile {report['p01']:.4f}, "
+          f"mean {report['mean']:.4f} (threshold {min_agreement})")
+    return report
+
+
+def store_embeddings(client, alias, chunks_data, embeddings, fingerprint, token_counts=None, tokenizer_name=None):
+    """Store chunks and embeddings in a new versioned ChromaDB collection (the alias is flipped later)"""
+    chunks = chunks_data['chunks']
+    
+    # Carry generation counter forward from the live build (and past any newer,
+    # rolled-back build, so a generation number is never reused)
+    generation = 1
+    try:
+        previous = client.get_collection(name=resolve_alias(CHROMA_DIR, alias))
+        generation = int((previous.metadata or {}).get("generation", 0)) + 1
+    except Exception:
+        pass
+    existing = builds(alias, collection_names(client))
+    if existing:
+        generation = max(generation, existing[0][0] + 1)
+    collection_name = versioned_name(alias, generation)
+    
+    print(f"\n[STORE] Storing in collection: {collection_name} (alias {alias})")
+    print(f"   Chunks: {len(chunks)}")
+    
+    # Create collection (blue/green: the live collection keeps serving meanwhile)
+    # generation + created_at form the collection version used by the RAG proxy
+    # to invalidate cached retrieval results after a rebuild; the embedding
+    # fingerprint lets every reader check its query embedder matches
+    metadata = {
+        "description": "RAG document store",
+        "created_at": datetime.now().isoformat(),
+        "generation": generation,
+        "total_chunks": len(chunks),
+        **fingerprint
+    }
+    if token_counts is not None:
+        metadata["tokenizer"] = tokenizer_name
+    collection = client.create_collection(name=collection_name, metadata=metadata)
+    print(f"[INFO] Collection generation: {generation}")
+    
+    # Prepare data for batch insert
+    ids, documents, metadatas = prepare_records(chunks_data, token_counts)
     
     # Store in batches
     batch_size = 100
@@ -181,6 +271,76 @@ def store_embeddings(client, collection_name, chunks_data, embeddings):
     return collection
 
 
+def flip_alias(alias, collection):
+    """Point the alias at the new build (atomic file replace; running proxies swap to it)"""
+    previous = set_alias(CHROMA_DIR, alias, collection.name)
+    print(f"\n[ALIAS] {alias} -> {collection.name} (was: {previous or 'not aliased'})")
+    return previous
+
+
+def prune_builds(client, alias, keep):
+    """
+    Delete all but the newest keep builds of an alias, with their embedding store and BM25 files.
+    
+    The live build and builds a running proxy still serves (e.g. after it
+    rejected a newer one) are kept.
+    """
+    live = resolve_alias(CHROMA_DIR, alias)
+    served = serving_builds(CHROMA_DIR)
+    old = [name for _, name in builds(alias, collection_names(client))[max(1, keep):] if name != live]
+    for name in [name for name in old if name in served]:
+        print(f"[PRUNE] Kept old build still served by a running proxy: {name}")
+    old = [name for name in old if name not in served]
+    for name in old:
+        client.delete_collection(name=name)
+        for path in (store_path(STORE_DIR, name), lexical_index_path(STORE_DIR, name)):
+            path.unlink(missing_ok=True)
+        print(f"[PRUNE] Deleted old build: {name}")
+    return old
+
+
+def write_embedding_store(collection, chunks_data, embeddings, dtype="float32", token_counts=None):
+    """Write memory-mappable embedding store (same ids/order/metadata as the collection)"""
+    path = store_path(STORE_DIR, collection.name)
+    print(f"\n[STORE] Writing embedding store:")
+    print(f"   File: {path}")
+    print(f"   Dtype: {dtype}")
+    
+    ids, documents, metadatas = prepare_records(chunks_data, token_counts)
+    collection_metadata = dict(collection.metadata or {})
+    header = write_store(
+        path,
+        collection.name,
+        ids,
+        embeddings,
+        documents,
+        metadatas,
+        metadata=collection_metadata,
+        space=collection_metadata.get("hnsw:space", "l2"),
+        dtype=dtype
+    )
+    
+    print(f"[OK] Embedding store written: {header['count']} x {header['dim']} "
+          f"({path.stat().st_size / 1e6:.1f} MB)")
+    return path
+
+
+def write_lexical_index(collection, chunks_data):
+    """Build BM25 inverted index over chunk texts (same ids/order as the collection)"""
+    path = lexical_index_path(STORE_DIR, collection.name)
+    print(f"\n[BM25] Building lexical index:")
+    print(f"   File: {path}")
+    
+    start = time.time()
+    ids, documents, _ = prepare_records(chunks_data)
+    index = LexicalIndex.build(ids, documents, metadata=dict(collection.metadata or {}))
+    index.save(path)
+    
+    print(f"[OK] Lexical index written: {len(index.vocab)} terms, {len(index.doc_rows)} postings "
+          f"({path.stat().st_size / 1e6:.1f} MB) in {time.time() - start:.2f}s")
+    return path
+
+
 def main():
     parser = argparse.ArgumentParser(description="Generate embeddings and store in vector DB")
     parser.add_argument(
@@ -195,6 +355,46 @@ def main():
         default=str(CHUNKS_DIR / "chunks_latest.json"),
         help="Chunks JSON file (default: chunks_latest.json)"
     )
+    parser.add_argument(
+        "--store-dtype",
+        type=str,
+        choices=list(DTYPES),
+        default="float32",
+        help="Embedding store matrix dtype (default: float32, float16 halves the file)"
+    )
+    parser.add_argument(
+        "--tokenizer",
+        type=str,
+        default=SERVED_MODEL,
+        help=f"Tokenizer for chunk token counts, i.e. the model served by vLLM (default: {SERVED_MODEL})"
+    )
+    parser.add_argument(
+        "--embedding-backend",
+        type=str,
+        choices=EMBEDDING_BACKENDS,
+        default="torch",
+        help="Chunk embedding backend (default: torch fp32; the RAG proxy's ONNX backends "
+             "check their agreement against fp32 collections)"
+    )
+    parser.add_argument(
+        "--min-agreement",
+        type=float,
+        default=MIN_AGREEMENT,
+        help=f"Lowest acceptable cosine between ONNX and fp32 embeddings of a chunk (default: {MIN_AGREEMENT})"
+    )
+    parser.add_argument(
+        "--agreement-sample",
+        type=int,
+        default=AGREEMENT_SAMPLE,
+        help=f"Chunks checked against fp32 with an ONNX backend, 0 = skip (default: {AGREEMENT_SAMPLE})"
+    )
+    parser.add_argument(
+        "--keep-generations",
+        type=int,
+        default=KEEP_GENERATIONS,
+        help=f"Builds kept per collection, the live one included (default: {KEEP_GENERATIONS}, "
+             f"i.e. one to roll back to)"
+    )
     
     args = parser.parse_args()
     
@@ -214,26 +414,53 @@ def main():
         return
     
     # Create embedder
-    embedder, dim = create_embedder()
+    embedder, fingerprint = create_embedder(args.embedding_backend)
     
     # Generate embeddings
     embeddings = generate_embeddings(chunks_data, embedder)
     
+    # Quantized/ONNX embeddings must stay close to fp32 before they are published
+    if args.embedding_backend != "torch" and args.agreement_sample > 0:
+        try:
+            verify_agreement(chunks_data, embeddings, args.embedding_backend,
+                             args.agreement_sample, args.min_agreement)
+        except AgreementError as e:
+            print(f"[ERROR] {e}")
+            print(f"[INFO] Nothing stored - use --embedding-backend torch or lower --min-agreement")
+            return
+    
+    # Count tokens per chunk (context token budgets in the RAG proxy)
+    token_counts = count_tokens(chunks_data, args.tokenizer)
+    
     # Create vector store
     client = create_vector_store(CHROMA_DIR)
     
     # Store embeddings
-    collection = store_embeddings(client, args.collection, chunks_data, embeddings)
+    collection = store_embeddings(client, args.collection, chunks_data, embeddings, fingerprint,
+                                  token_counts, args.tokenizer)
+    
+    # Write memory-mappable embedding store
+    embedding_store = write_embedding_store(collection, chunks_data, embeddings, args.store_dtype, token_counts)
+    
+    # Build BM25 inverted index (hybrid retrieval)
+    lexical_index = write_lexical_index(collection, chunks_data)
+    
+    # Publish: flip the alias only now that every file of the build exists
+    flip_alias(args.collection, collection)
+    prune_builds(client, args.collection, args.keep_generations)
     
     print("\n━" * 80)
     print("[COMPLETE] Embeddings generated and stored!")
     print("━" * 80)
     print(f"\n[INFO] Vector database:")
     print(f"   Location: {CHROMA_DIR}")
-    print(f"   Collection: {args.collection}")
+    print(f"   Collection: {args.collection} -> {collection.name}")
     print(f"   Chunks: {collection.count()}")
-    print(f"   Embedding model: {EMBEDDING_MODEL}")
-    print(f"   Embedding dim: {dim}")
+    print(f"   Embedding model: {describe_fingerprint(fingerprint)}")
+    print(f"   Reference hash: {fingerprint['embedding_reference_hash']}")
+    print(f"   Chunk token counts: {args.tokenizer if token_counts is not None else 'not stored (estimated at query time)'}")
+    print(f"   Embedding store: {embedding_store}")
+    print(f"   Lexical index: {lexical_index}")
     print(f"\n[NEXT] Next step: benchmarks/3_test_retrieval.py --collection {args.collection}")
     print("")
 
@@ -0,0 +1,229 @@
+"""
+AdmissionController (utils/admission.py) with stubbed vLLM /metrics: admit/reject thresholds,
+Retry-After, and slots freed by streaming responses (finished or client disconnect).
+
+Run: cd RAG && python -m pytest -q tests
+"""
+
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+import httpx
+import pytest
+from starlette.background import BackgroundTask
+from starlette.responses import StreamingResponse
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from utils.admission import AdmissionController, AdmissionRejected, STALE_POLLS
+
+METRICS_URLS = ["http://vllm-a:8000/metrics", "http://vllm-b:8000/metrics"]
+
+
+def metrics_body(waiting=0.0, running=1.0, kv_usage=0.25):
+    """vLLM Prometheus text with the gauges the controller polls"""
+    return (
+        "# HELP vllm:num_requests_waiting Number of requests waiting.\n"
+        f'vllm:num_requests_waiting{{model_name="m"}} {waiting}\n'
+        f'vllm:num_requests_running{{model_name="m"}} {running}\n'
+        f'vllm:gpu_cache_usage_perc{{model_name="m"}} {kv_usage}\n'
+    )
+
+
+def run(scenario, bodies=None, **limits):
+    """
+    Run scenario(controller) against a started controller.
+
+    bodies: {metrics URL: Prometheus text}; URLs without a body answer 500
+    """
+    bodies = bodies if bodies is not None else {METRICS_URLS[0]: metrics_body()}
+
+    def handler(request):
+        body = bodies.get(str(request.url))
+        return httpx.Response(200, text=body) if body is not None else httpx.Response(500)
+
+    async def main():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            controller = AdmissionController(client, list(bodies) or METRICS_URLS[:1], **limits)
+            await controller.start()
+            deadline = time.monotonic() + 5
+            while controller.vllm_updated is None and controller.poll_failures == 0:
+                assert time.monotonic() < deadline, "metrics were never polled"
+                await asyncio.sleep(0.01)
+            try:
+                return await scenario(controller)
+            finally:
+                await controller.stop()
+    return asyncio.run(main())
+
+
+async def rejected(controller):
+    """The AdmissionRejected a new request gets"""
+    with pytest.raises(AdmissionRejected) as error:
+        await controller.admit()
+    return error.value
+
+
+def test_admits_below_vllm_thresholds():
+    async def scenario(controller):
+        ticket = await controller.admit()
+        assert controller.inflight == 1
+        ticket.release()
+        ticket.release()  # Idempotent
+        assert controller.inflight == 0
+        assert controller.outcomes.value(outcome="admitted") == 1
+    run(scenario, {METRICS_URLS[0]: metrics_body(waiting=7, kv_usage=0.97)}, max_waiting=8, max_kv_usage=0.98)
+
+
+def test_rejects_when_vllm_queue_is_full():
+    async def scenario(controller):
+        error = await rejected(controller)
+        assert error.reason == "vllm_queue"
+        assert error.retry_after == 1  # No service time yet: one poll interval, rounded up
+        assert controller.inflight == 0
+    run(scenario, {METRICS_URLS[0]: metrics_body(waiting=8)}, max_waiting=8)
+
+
+def test_vllm_queues_are_summed_across_servers():
+    async def scenario(controller):
+        assert controller.vllm["waiting"] == 8
+        assert (await rejected(controller)).reason == "vllm_queue"
+    run(scenario, {url: metrics_body(waiting=4) for url in METRICS_URLS}, max_waiting=8)
+
+
+def test_rejects_when_kv_cache_is_full():
+    async def scenario(controller):
+        assert (await rejected(controller)).reason == "kv_cache"
+    run(scenario, {METRICS_URLS[0]: metrics_body(kv_usage=0.99)}, max_kv_usage=0.98)
+
+
+def test_stale_vllm_metrics_are_ignored():
+    async def scenario(controller):
+        await controller.stop()  # No more polls: the last values age
+        controller.vllm_updated -= (STALE_POLLS + 1) * controller.poll_interval
+        (await controller.admit()).release()
+    run(scenario, {METRICS_URLS[0]: metrics_body(waiting=100, kv_usage=1.0)})
+
+
+def test_rejects_when_proxy_queue_is_full():
+    async def scenario(controller):
+        held = await controller.admit()
+        waiter = asyncio.create_task(controller.admit())
+        await asyncio.sleep(0)
+        assert controller.queued == 1
+        error = await rejected(controller)
+        assert error.reason == "queue_full"
+
+        held.release()  # The queued request takes the freed slot
+        ticket = await waiter
+        assert (controller.inflight, controller.queued) == (1, 0)
+        ticket.release()
+        assert controller.outcomes.value(outcome="queued") == 1
+    run(scenario, max_inflight=1, max_queue=1)
+
+
+def test_rejects_on_predicted_wait_with_retry_after():
+    async def scenario(controller):
+        held = await controller.admit()
+        controller.service_s = 10.0
+        # One request ahead in vLLM plus one to be served: (1 + 1) x 10 s / 1 slot
+        assert controller.predicted_wait() == 20.0
+        error = await rejected(controller)
+        assert error.reason == "predicted_wait"
+        assert error.retry_after == 20
+        held.release()
+        controller.service_s = 4.0
+        assert controller.predicted_wait() == 8.0  # Still behind vLLM's queue, but under max_wait_s
+        (await controller.admit()).release()
+    run(scenario, {METRICS_URLS[0]: metrics_body(waiting=1)}, max_inflight=1, max_wait_s=15.0)
+
+
+def test_cancelled_queued_request_gives_back_its_place():
+    async def scenario(controller):
+        held = await controller.admit()
+        waiter = asyncio.create_task(controller.admit())
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert (controller.inflight, controller.queued) == (1, 0)
+        held.release()
+        (await controller.admit()).release()  # The slot was not taken by the cancelled request
+        assert controller.inflight == 0
+    run(scenario, max_inflight=1)
+
+
+async def serve_stream(controller, disconnect_after=None):
+    """
+    Drive one streaming response the way the proxy builds it (slot released when the
+    relay generator ends and by the background task) over raw ASGI.
+
+    disconnect_after: body chunks sent before the client disconnects (None: read it all)
+    """
+    ticket = await controller.admit()
+
+    async def relay():
+        try:
+            for i in range(100):
+                await asyncio.sleep(0.001)
+                yield f"data: {i}\n\n".encode()
+            yield b"data: [DONE]\n\n"
+        finally:
+            ticket.release()
+
+    response = StreamingResponse(relay(), media_type="text/event-stream",
+                                 background=BackgroundTask(ticket.release))
+    bodies = []
+    disconnected = asyncio.Event()
+    requested = False
+
+    async def receive():
+        nonlocal requested
+        if not requested:
+            requested = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.body" and message.get("more_body"):
+            bodies.append(message["body"])
+            if disconnect_after is not None and len(bodies) >= disconnect_after:
+                disconnected.set()
+
+    scope = {"type": "http", "asgi": {"version": "3.0", "spec_version": "2.3"}, "method": "POST",
+             "path": "/v1/chat/completions", "headers": []}
+    await response(scope, receive, send)
+    return bodies
+
+
+def test_slot_released_when_stream_finishes():
+    async def scenario(controller):
+        bodies = await serve_stream(controller)
+        assert bodies[-1] == b"data: [DONE]\n\n"
+        assert controller.inflight == 0
+        assert controller.service_s is not None
+    run(scenario, max_inflight=1)
+
+
+def test_slot_released_when_client_disconnects():
+    async def scenario(controller):
+        bodies = await serve_stream(controller, disconnect_after=3)
+        assert 3 <= len(bodies) < 100
+        assert controller.inflight == 0
+        (await controller.admit()).release()  # max_inflight 1: would block if the slot leaked
+    run(scenario, max_inflight=1)
+
+
+def test_slot_released_when_stream_task_is_cancelled():
+    async def scenario(controller):
+        task = asyncio.create_task(serve_stream(controller))
+        await asyncio.sleep(0.02)
+        assert controller.inflight == 1
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        await asyncio.sleep(0)  # Abandoned relay generator is finalized on the loop
+        assert controller.inflight == 0
+    run(scenario, max_inflight=1)
@@ -0,0 +1,48 @@
+"""
+Collection aliases and serving records (utils/aliases.py).
+
+Run: cd RAG && python -m pytest -q tests
+"""
+
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from utils.aliases import (
+    SERVING_DIR, builds, clear_serving, record_serving, resolve_alias, serving_builds, set_alias
+)
+
+
+def test_set_alias_returns_previous_target(tmp_path):
+    assert resolve_alias(tmp_path, "scifi_world") == "scifi_world"
+    assert set_alias(tmp_path, "scifi_world", "scifi_world__g1") is None
+    assert set_alias(tmp_path, "scifi_world", "scifi_world__g2") == "scifi_world__g1"
+    assert resolve_alias(tmp_path, "scifi_world") == "scifi_world__g2"
+
+
+def test_builds_newest_first():
+    names = ["scifi_world__g2", "scifi_world__g10", "characters__g3", "scifi_world"]
+    assert builds("scifi_world", names) == [(10, "scifi_world__g10"), (2, "scifi_world__g2")]
+
+
+def test_serving_records_of_running_processes(tmp_path):
+    record_serving(tmp_path, ["scifi_world__g5", "characters__g2"])
+    record_serving(tmp_path, ["scifi_world__g5"])  # Replaces this process's record
+    assert serving_builds(tmp_path) == {"scifi_world__g5"}
+    clear_serving(tmp_path)
+    assert serving_builds(tmp_path) == set()
+
+
+def test_records_of_exited_processes_are_dropped(tmp_path):
+    exited = subprocess.Popen([sys.executable, "-c", "pass"])
+    exited.wait()
+    stale = tmp_path / SERVING_DIR / f"{exited.pid}.json"
+    stale.parent.mkdir()
+    stale.write_text(json.dumps(["scifi_world__g3"]))
+    record_serving(tmp_path, ["scifi_world__g5"])
+    assert serving_builds(tmp_path) == {"scifi_world__g5"}
+    assert not stale.exists()
+    assert (tmp_path / SERVING_DIR / f"{os.getpid()}.json").exists()
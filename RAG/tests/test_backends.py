@@ -0,0 +1,204 @@
+"""
+BackendPool against two local stub OpenAI servers (GET /v1/models, POST /v1/chat/completions).
+
+Run: cd RAG && python -m pytest -q tests
+"""
+
+import asyncio
+import socket
+import sys
+import threading
+import time
+from pathlib import Path
+
+import httpx
+import pytest
+import uvicorn
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from utils.backends import BackendPool, NoBackendAvailable
+
+
+class StubServer:
+    """Minimal OpenAI-compatible server on a free local port; `healthy = False` fails every request"""
+
+    def __init__(self, name, models):
+        self.name = name
+        self.models = models
+        self.healthy = True
+        self.completions = 0
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(("127.0.0.1", 0))
+        self.url = f"http://127.0.0.1:{self.sock.getsockname()[1]}/v1"
+        self.server = uvicorn.Server(uvicorn.Config(self.app(), log_level="warning"))
+        self.thread = threading.Thread(target=self.server.run, kwargs={"sockets": [self.sock]}, daemon=True)
+
+    def app(self):
+        app = FastAPI()
+
+        @app.get("/v1/models")
+        async def models():
+            if not self.healthy:
+                return JSONResponse({"error": "down"}, status_code=503)
+            return {"object": "list", "data": [{"id": m, "object": "model", "max_model_len": 4096}
+                                               for m in self.models]}
+
+        @app.post("/v1/chat/completions")
+        async def completions(payload: dict):
+            if not self.healthy:
+                return JSONResponse({"error": "down"}, status_code=503)
+            self.completions += 1
+            return {"backend": self.name, "model": payload["model"],
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": "ok"}}]}
+
+        return app
+
+    def start(self):
+        self.thread.start()
+        deadline = time.monotonic() + 10
+        while not self.server.started:
+            assert time.monotonic() < deadline, f"stub {self.name} did not start"
+            time.sleep(0.01)
+
+    def stop(self):
+        self.server.should_exit = True
+        self.thread.join(timeout=10)
+
+
+@pytest.fixture(scope="module")
+def stubs():
+    base = StubServer("base", ["base-model", "shared-model"])
+    tuned = StubServer("tuned", ["tuned-model", "shared-model"])
+    for stub in (base, tuned):
+        stub.start()
+    yield base, tuned
+    for stub in (base, tuned):
+        stub.stop()
+
+
+@pytest.fixture(autouse=True)
+def healthy_stubs(stubs):
+    for stub in stubs:
+        stub.healthy = True
+
+
+def run(stubs, scenario, eject_after=2):
+    """Run scenario(pool, by_name) against a fresh pool over the stubs (no background health loop)"""
+    async def main():
+        pool = BackendPool([stub.url for stub in stubs], lambda url: httpx.AsyncClient(base_url=url),
+                           eject_after=eject_after)
+        await pool.check_all()
+        by_name = {stub.name: backend for stub, backend in zip(stubs, pool.backends)}
+        try:
+            return await scenario(pool, by_name)
+        finally:
+            await pool.stop()
+    return asyncio.run(main())
+
+
+async def complete(pool, model):
+    """One chat completion through the pool; the answering stub's name"""
+    response, lease = await pool.send(model, "POST", "/chat/completions",
+                                      json={"model": model, "messages": [{"role": "user", "content": "hi"}]})
+    try:
+        await response.aread()
+        return response.json()["backend"]
+    finally:
+        await response.aclose()
+        lease.release()
+
+
+def test_routes_by_model(stubs):
+    async def scenario(pool, by_name):
+        assert set(pool.served_models()) == {"base-model", "tuned-model", "shared-model"}
+        assert [await complete(pool, "base-model") for _ in range(3)] == ["base"] * 3
+        assert [await complete(pool, "tuned-model") for _ in range(3)] == ["tuned"] * 3
+        assert {await complete(pool, "shared-model") for _ in range(4)} == {"base", "tuned"}
+    run(stubs, scenario)
+
+
+def test_least_outstanding(stubs):
+    async def scenario(pool, by_name):
+        held = []
+        for _ in range(4):
+            held.append(await pool.send("shared-model", "POST", "/chat/completions",
+                                        json={"model": "shared-model", "messages": []}))
+            # Each new request goes to a backend with the fewest requests still open
+            assert abs(by_name["base"].outstanding - by_name["tuned"].outstanding) <= 1
+        assert by_name["base"].outstanding == by_name["tuned"].outstanding == 2
+        first, lease = held[0]
+        await first.aclose()
+        lease.release()
+        freed = lease.backend
+        response, second = await pool.send("shared-model", "POST", "/chat/completions",
+                                           json={"model": "shared-model", "messages": []})
+        assert second.backend is freed
+        held[0] = (response, second)
+        for response, lease in held:
+            await response.aclose()
+            lease.release()
+        assert by_name["base"].outstanding == by_name["tuned"].outstanding == 0
+    run(stubs, scenario)
+
+
+def test_ejects_after_consecutive_failures_and_readmits(stubs):
+    base, tuned = stubs
+
+    async def scenario(pool, by_name):
+        backend = by_name["tuned"]
+        tuned.healthy = False
+        for _ in range(2):
+            assert backend.healthy
+            await pool.check(backend)
+        assert not backend.healthy
+        assert pool.ejections.value(backend=backend.name) == 1
+        assert "tuned-model" not in pool.served_models()
+        assert {await complete(pool, "shared-model") for _ in range(4)} == {"base"}
+
+        tuned.healthy = True
+        assert await pool.check(backend)
+        assert backend.healthy and backend.failures == 0
+        assert await complete(pool, "tuned-model") == "tuned"
+    run(stubs, scenario, eject_after=2)
+
+
+def test_connection_errors_eject_and_fail_over(stubs):
+    async def scenario(pool, by_name):
+        backend = by_name["tuned"]
+        # Point the backend at a closed port: connection refused on every request
+        sock = socket.socket()
+        sock.bind(("127.0.0.1", 0))
+        dead = f"http://127.0.0.1:{sock.getsockname()[1]}/v1"
+        sock.close()
+        await backend.client.aclose()
+        backend.client = httpx.AsyncClient(base_url=dead)
+        for _ in range(4):
+            assert await complete(pool, "shared-model") == "base"  # Retried on the other backend
+        assert not backend.healthy
+    run(stubs, scenario, eject_after=2)
+
+
+def test_unknown_model_is_404(stubs):
+    async def scenario(pool, by_name):
+        with pytest.raises(NoBackendAvailable) as error:
+            pool.pick("no-such-model")
+        assert not error.value.known
+        assert error.value.status_code == 404
+    run(stubs, scenario)
+
+
+def test_all_backends_for_model_down_is_503(stubs):
+    base, tuned = stubs
+
+    async def scenario(pool, by_name):
+        tuned.healthy = False
+        await pool.check(by_name["tuned"])
+        with pytest.raises(NoBackendAvailable) as error:
+            await complete(pool, "tuned-model")
+        assert error.value.known
+        assert error.value.status_code == 503
+        assert await complete(pool, "base-model") == "base"
+    run(stubs, scenario, eject_after=1)
@@ -0,0 +1,46 @@
+"""
+Response and embedding caches (utils/caches.py): hit/miss accounting, cacheable streams.
+
+Run: cd RAG && python -m pytest -q tests
+"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from utils.caches import LRUCache, SemanticResponseCache, complete_sse
+
+
+def test_lru_counts_hits_and_misses():
+    cache = LRUCache("test", max_entries=2)
+    cache.put("a", 1)
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_semantic_lookup_counts_each_lookup_once():
+    cache = SemanticResponseCache(max_entries=4, threshold=0.97)
+    query = np.array([1.0, 0.0, 0.0, 0.0])
+    assert cache.lookup("scope", query) is None            # Unknown scope
+    cache.store("scope", query, "response")
+    assert cache.lookup("scope", query * 2) == "response"  # Same direction
+    assert cache.lookup("scope", np.array([0.0, 1.0, 0.0, 0.0])) is None  # Scope known, query too far
+    assert cache.lookup("other", query) is None            # Other chunks retrieved
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (1, 3)
+    assert stats["hit_rate"] == 0.25
+
+
+def test_only_complete_streams_are_cacheable():
+    frame = b'data: {"choices": [{"delta": {"content": "Elena"}}]}\n\n'
+    assert complete_sse([frame, b"data: [DONE]\n\n"])
+    assert complete_sse([frame[:20], frame[20:] + b"data: [DO", b"NE]\n\n"])  # Split across chunks
+    assert not complete_sse([frame])                                          # Cut off, no [DONE]
+    assert not complete_sse([frame, b'data: {"error": {"message": "engine dead", "code": 500}}\n\n',
+                             b"data: [DONE]\n\n"])
+    assert not complete_sse([frame, b'data: {"object": "error", "message": "boom"}\n\n', b"data: [DONE]\n\n"])
+    assert not complete_sse([frame, b"event: error\ndata: {}\n\n", b"data: [DONE]\n\n"])
+    assert not complete_sse([])
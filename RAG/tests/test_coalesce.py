@@ -0,0 +1,204 @@
+"""
+RequestCoalescer (utils/coalesce.py) against an in-process fake upstream: shared calls and streams.
+
+Run: cd RAG && python -m pytest -q tests
+"""
+
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from utils.coalesce import RequestCoalescer, request_key
+
+KEY = request_key("/chat/completions", {"model": "m", "temperature": 0, "messages": []})
+
+
+class Upstream:
+    """Fake upstream stream fed chunk by chunk from the test; None ends it, an exception fails it"""
+
+    def __init__(self):
+        self.queue = asyncio.Queue()
+        self.opens = 0
+        self.closed = False
+
+    async def open(self):
+        self.opens += 1
+        return self.chunks(), self.close
+
+    async def chunks(self):
+        while True:
+            item = await self.queue.get()
+            if item is None:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+
+    async def close(self):
+        self.closed = True
+
+    def send(self, *items):
+        for item in items:
+            self.queue.put_nowait(item)
+
+
+async def collect(subscription):
+    """Every chunk of a subscription, closing it afterwards"""
+    try:
+        return [chunk async for chunk in subscription]
+    finally:
+        subscription.close()
+
+
+def test_concurrent_identical_calls_hit_upstream_once():
+    async def main():
+        coalescer = RequestCoalescer()
+        gate = asyncio.Event()
+        fetches = []
+
+        async def fetch():
+            fetches.append(1)
+            await gate.wait()
+            return {"content": "ok"}
+
+        callers = [asyncio.create_task(coalescer.call(KEY, fetch)) for _ in range(3)]
+        await asyncio.sleep(0)
+        gate.set()
+        results = await asyncio.gather(*callers)
+        assert len(fetches) == 1
+        assert [shared for _, shared in results] == [False, True, True]
+        assert all(response == {"content": "ok"} for response, _ in results)
+        assert coalescer.stats()["upstream_requests_saved"] == 2
+        assert not coalescer.calls  # Forgotten once complete: the next call fetches again
+        await coalescer.call(KEY, fetch)
+        assert len(fetches) == 2
+    asyncio.run(main())
+
+
+def test_call_error_reaches_every_caller():
+    async def main():
+        coalescer = RequestCoalescer()
+        gate = asyncio.Event()
+
+        async def fetch():
+            await gate.wait()
+            raise RuntimeError("upstream down")
+
+        callers = [asyncio.create_task(coalescer.call(KEY, fetch)) for _ in range(2)]
+        await asyncio.sleep(0)
+        gate.set()
+        results = await asyncio.gather(*callers, return_exceptions=True)
+        assert all(isinstance(result, RuntimeError) for result in results)
+    asyncio.run(main())
+
+
+def test_follower_joining_mid_stream_gets_buffered_prefix_then_live_tail():
+    async def main():
+        coalescer = RequestCoalescer()
+        upstream = Upstream()
+        leader, shared = await coalescer.stream(KEY, upstream.open)
+        assert not shared
+        leader_chunks = leader.__aiter__()
+        upstream.send(b"a", b"b")
+        assert [await anext(leader_chunks), await anext(leader_chunks)] == [b"a", b"b"]
+
+        follower, shared = await coalescer.stream(KEY, upstream.open)
+        assert shared and upstream.opens == 1
+        follower_task = asyncio.create_task(collect(follower))
+        upstream.send(b"c", None)
+        assert [chunk async for chunk in leader_chunks] == [b"c"]
+        leader.close()
+        assert await follower_task == [b"a", b"b", b"c"]
+        assert upstream.closed
+        assert not coalescer.streams
+    asyncio.run(main())
+
+
+def test_upstream_aborted_only_when_last_subscriber_leaves():
+    async def main():
+        coalescer = RequestCoalescer()
+        upstream = Upstream()
+        first, _ = await coalescer.stream(KEY, upstream.open)
+        second, _ = await coalescer.stream(KEY, upstream.open)
+        flight = first.flight
+
+        first.close()
+        await asyncio.sleep(0)
+        assert not flight.pump.done() and not upstream.closed
+        upstream.send(b"a")
+        second_chunks = second.__aiter__()
+        assert await anext(second_chunks) == b"a"  # Still live for the remaining subscriber
+
+        second.close()
+        await flight.pump
+        assert upstream.closed
+        assert isinstance(flight.error, ConnectionAbortedError)
+        assert not coalescer.streams
+    asyncio.run(main())
+
+
+def test_upstream_error_reaches_every_subscriber():
+    async def main():
+        coalescer = RequestCoalescer()
+        upstream = Upstream()
+        subscriptions = [(await coalescer.stream(KEY, upstream.open))[0] for _ in range(2)]
+        received = [[] for _ in subscriptions]
+
+        async def consume(subscription, chunks):
+            try:
+                async for chunk in subscription:
+                    chunks.append(chunk)
+            finally:
+                subscription.close()
+
+        consumers = [asyncio.create_task(consume(s, r)) for s, r in zip(subscriptions, received)]
+        upstream.send(b"a", RuntimeError("engine dead"))
+        results = await asyncio.gather(*consumers, return_exceptions=True)
+        assert all(isinstance(result, RuntimeError) for result in results)
+        assert received == [[b"a"], [b"a"]]
+        assert upstream.closed
+    asyncio.run(main())
+
+
+def test_open_error_reaches_waiting_followers():
+    async def main():
+        coalescer = RequestCoalescer()
+        gate = asyncio.Event()
+
+        async def open_stream():
+            await gate.wait()
+            raise RuntimeError("upstream returned 500")
+
+        leader = asyncio.create_task(coalescer.stream(KEY, open_stream))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(coalescer.stream(KEY, open_stream))
+        await asyncio.sleep(0)
+        gate.set()
+        results = await asyncio.gather(leader, follower, return_exceptions=True)
+        assert all(isinstance(result, RuntimeError) for result in results)
+        assert not coalescer.streams
+    asyncio.run(main())
+
+
+def test_close_is_idempotent():
+    async def main():
+        coalescer = RequestCoalescer()
+        upstream = Upstream()
+        first, _ = await coalescer.stream(KEY, upstream.open)
+        second, _ = await coalescer.stream(KEY, upstream.open)
+        flight = first.flight
+
+        for _ in range(3):
+            first.close()
+        assert flight.subscribers == 1
+        await asyncio.sleep(0)
+        assert not flight.pump.done()  # A repeated close must not drop the other subscriber's stream
+
+        upstream.send(b"a", None)
+        assert await collect(second) == [b"a"]
+        second.close()
+        assert flight.subscribers == 0
+    asyncio.run(main())
@@ -0,0 +1,56 @@
+"""
+Retrieval gate: default skip patterns (utils/context.py).
+
+Run: cd RAG && python -m pytest -q tests
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from utils.context import DEFAULT_SKIP_PATTERNS, compile_skip_rules, matching_skip_rule
+
+RULES = compile_skip_rules(DEFAULT_SKIP_PATTERNS)
+
+PASSAGE = "Elena stared at the viewscreen, her jaw tight as the Arcturian fleet dropped out of fold space."
+
+
+@pytest.mark.parametrize("query", [
+    "",
+    "...",
+    "continue",
+    "Please go on.",
+    "keep going please",
+    "Rewrite the following:\n" + PASSAGE,
+    "Please polish this paragraph:\n\n" + PASSAGE,
+    "Fix the grammar:\n" + PASSAGE,
+    "Check the spelling in this text:\n" + PASSAGE,
+    "Translate this to French:\n" + PASSAGE,
+    f'Shorten "{PASSAGE}"',
+    f"Rephrase “{PASSAGE}”",
+    "Edit this scene\n```\n" + PASSAGE + "\n```",
+    "```\n" + PASSAGE + "\n```\nMake it tenser",
+    "```\n" + PASSAGE + "\n```\n\nPlease rewrite this in present tense",
+])
+def test_skips_edits_of_supplied_text(query):
+    assert matching_skip_rule(query, RULES) is not None
+
+
+@pytest.mark.parametrize("query", [
+    "Summarize what we know about Elena's background in this world",
+    "Expand on the Arcturian homeworld section",
+    "Check the spelling of Arcturian names",
+    "Translate the Arcturian greeting text",
+    "Summarize the following: the battle at the outer colonies",
+    'Translate "Shal\'ka ven" into English',
+    "Rewrite the scene where Elena confronts the admiral so it matches her personality",
+    "What are Elena's personality traits?",
+    "Continue the scene where Elena confronts the admiral",
+    "Describe the Arcturian homeworld atmosphere",
+    "```\n" + PASSAGE + "\n```\nIs this consistent with Elena's backstory?",
+    "```\n" + PASSAGE + "\n```",
+])
+def test_lore_questions_retrieve(query):
+    assert matching_skip_rule(query, RULES) is None
@@ -0,0 +1,79 @@
+"""
+Embedding fingerprint check (utils/embedders.py) against an in-memory collection.
+
+Run: cd RAG && python -m pytest -q tests
+"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from utils.embedders import FingerprintError, verify_fingerprint
+
+DIM = 8
+
+
+def unit_vector(text):
+    """Deterministic unit vector per text"""
+    vector = np.random.default_rng(sum(map(ord, text))).normal(size=DIM)
+    return vector / np.linalg.norm(vector)
+
+
+class Embedder:
+    """encode() like SentenceTransformer, mapping each text to unit_vector(text)"""
+
+    def encode(self, texts, batch_size=32, convert_to_numpy=True):
+        return np.array([unit_vector(text) for text in texts])
+
+
+class Collection:
+    """The parts of a ChromaDB collection verify_fingerprint() reads"""
+
+    def __init__(self, documents, metadata):
+        self.name = "scifi_world"
+        self.metadata = metadata
+        self.records = {f"chunk_{i}": document for i, document in enumerate(documents)}
+
+    def get(self, ids=None, include=()):
+        ids = list(self.records) if ids is None else ids
+        return {"ids": ids, "documents": [self.records[i] for i in ids],
+                "embeddings": [unit_vector(self.records[i]).tolist() for i in ids]}
+
+
+def fingerprint(reference_hash="a" * 16, **changes):
+    return {"embedding_model": "BAAI/bge-large-en-v1.5", "embedding_backend": "torch",
+            "embedding_precision": "float32", "embedding_dim": DIM, "embedding_normalized": True,
+            "embedding_reference_hash": reference_hash, **changes}
+
+
+def test_same_reference_hash_matches():
+    report = verify_fingerprint(Collection(["Elena"], fingerprint()), Embedder(), fingerprint())
+    assert report["status"] == "match"
+
+
+def test_different_model_is_rejected():
+    with pytest.raises(FingerprintError):
+        verify_fingerprint(Collection(["Elena"], fingerprint()), Embedder(),
+                           fingerprint(embedding_model="other-model"))
+
+
+def test_different_hash_checks_agreement_with_stored_chunks():
+    collection = Collection(["Elena", "Arcturians", "FTL drive"], fingerprint())
+    report = verify_fingerprint(collection, Embedder(), fingerprint("b" * 16, embedding_backend="onnx-int8"))
+    assert report["status"] == "agreement"
+    assert report["agreement"]["texts"] == 3
+
+
+@pytest.mark.parametrize("metadata", [fingerprint(), {}])
+def test_empty_collection_is_unverified(metadata):
+    report = verify_fingerprint(Collection([], metadata), Embedder(), fingerprint("b" * 16))
+    assert report["status"] == "unverified"
+    assert "empty" in report["reason"]
+
+
+def test_sample_zero_is_unverified():
+    report = verify_fingerprint(Collection(["Elena"], fingerprint()), Embedder(), fingerprint("b" * 16), sample=0)
+    assert report["status"] == "unverified"
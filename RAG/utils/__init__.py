@@ -0,0 +1,23 @@
+"""
+RAG proxy utilities.
+
+Shared components for the RAG proxy server, setup scripts and benchmarks.
+"""
+
+from . import metrics
+from . import embedding
+from . import caches
+from . import embedding_store
+from . import vector_index
+from . import context
+from . import mmr
+from . import lexical_index
+from . import rerank
+from . import admission
+from . import backends
+from . import coalesce
+from . import aliases
+from . import startup
+from . import embedders
+
+__all__ = ['metrics', 'embedding', 'caches', 'embedding_store', 'vector_index', 'context', 'mmr', 'lexical_index', 'rerank', 'admission', 'backends', 'coalesce', 'aliases', 'startup', 'embedders']
@@ -0,0 +1,261 @@
+"""
+Admission control for the RAG proxy, driven by vLLM queue depth.
+
+Without it, a saturated GPU keeps receiving requests that sit in vLLM's
+waiting queue until clients time out. The controller:
+- Polls vLLM /metrics in the background (requests waiting/running, KV-cache usage;
+  with several vLLM servers, queues are summed and the fullest KV cache counts)
+- Limits requests in flight through the proxy; extra requests wait in a
+  bounded internal queue (FIFO)
+- Rejects with a Retry-After hint once vLLM's queue, KV-cache usage, the
+  internal queue or the predicted wait exceeds its limit
+
+Predicted wait = (requests queued ahead, here and in vLLM) x mean service
+time / slots, with the service time an exponential moving average over
+completed requests. Stale vLLM metrics (poll failures) are ignored, so the
+proxy fails open on vLLM signals and falls back to its own queue limits.
+
+Usage:
+    admission = AdmissionController(client, ["http://localhost:8000/metrics"], max_inflight=16)
+    await admission.start()
+    ticket = await admission.admit()   # raises AdmissionRejected
+    ...
+    ticket.release()                   # idempotent
+"""
+
+import asyncio
+import math
+import time
+from typing import Dict, List, Optional, Sequence
+
+from .metrics import Counter, Histogram
+
+ADMISSION_MAX_INFLIGHT = 16      # Requests forwarded at once (~2x vLLM MAX_SEQS keeps its batch full)
+ADMISSION_MAX_QUEUE = 32         # Requests waiting in the proxy for a slot
+ADMISSION_MAX_WAITING = 8        # vLLM num_requests_waiting at which new requests are rejected
+ADMISSION_MAX_KV_USAGE = 0.98    # vLLM KV-cache usage (0-1) at which new requests are rejected
+ADMISSION_MAX_WAIT_S = 30.0      # Max predicted (and actual) queueing time
+ADMISSION_POLL_INTERVAL_S = 0.5  # vLLM /metrics poll interval
+
+STALE_POLLS = 5         # vLLM metrics older than this many intervals are ignored
+SERVICE_EWMA_ALPHA = 0.2
+
+# Gauge names (first present wins; names differ across vLLM versions)
+WAITING_METRICS = ["vllm:num_requests_waiting"]
+RUNNING_METRICS = ["vllm:num_requests_running"]
+KV_USAGE_METRICS = ["vllm:kv_cache_usage_perc", "vllm:gpu_cache_usage_perc"]
+
+QUEUE_WAIT_MS_BUCKETS = [1, 5, 10, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000]
+
+
+def parse_gauge(metrics_text: str, names: List[str]) -> Optional[float]:
+    """Sum a Prometheus metric over all label sets (first name present wins)"""
+    for name in names:
+        values = [
+            float(line.rsplit(" ", 1)[1])
+            for line in metrics_text.splitlines()
+            if line.startswith(name) and line[len(name):len(name) + 1] in ("{", " ")
+        ]
+        if values:
+            return sum(values)
+    return None
+
+
+def _combine(values: List[Optional[float]], reduce) -> Optional[float]:
+    """Reduce the values servers reported (None if none did)"""
+    present = [v for v in values if v is not None]
+    return reduce(present) if present else None
+
+
+class AdmissionRejected(Exception):
+    """Request refused; retry_after is the suggested wait in seconds"""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(f"Server busy ({reason}), retry after {retry_after}s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class Ticket:
+    """An admitted request's slot; release() when its response has been sent"""
+
+    def __init__(self, controller: "AdmissionController"):
+        self.controller = controller
+        self.admitted_at = time.perf_counter()
+        self.released = False
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.controller._release(self)
+
+
+class AdmissionController:
+    """Bounded proxy queue + vLLM-queue-aware rejection"""
+
+    def __init__(self, client, metrics_urls: Sequence[str],
+                 max_inflight: int = ADMISSION_MAX_INFLIGHT, max_queue: int = ADMISSION_MAX_QUEUE,
+                 max_waiting: int = ADMISSION_MAX_WAITING, max_kv_usage: float = ADMISSION_MAX_KV_USAGE,
+                 max_wait_s: float = ADMISSION_MAX_WAIT_S, poll_interval_s: float = ADMISSION_POLL_INTERVAL_S):
+        """
+        Args:
+            client: httpx.AsyncClient used to poll vLLM /metrics
+            metrics_urls: vLLM Prometheus endpoints (one per vLLM server)
+            max_inflight: Requests forwarded at once
+            max_queue: Requests allowed to wait for a slot
+            max_waiting: vLLM waiting-queue depth that triggers rejection
+            max_kv_usage: vLLM KV-cache usage (0-1) that triggers rejection
+            max_wait_s: Predicted wait that triggers rejection (also caps actual queueing)
+            poll_interval_s: Seconds between /metrics polls
+        """
+        self.client = client
+        self.metrics_urls = list(metrics_urls)
+        self.max_inflight = max(1, max_inflight)
+        self.max_queue = max(0, max_queue)
+        self.max_waiting = max_waiting
+        self.max_kv_usage = max_kv_usage
+        self.max_wait_s = max_wait_s
+        self.poll_interval = poll_interval_s
+
+        self.inflight = 0
+        self.queued = 0
+        self.service_s = None  # EWMA of admission-to-release time
+        self.vllm = {"waiting": None, "running": None, "kv_usage": None}
+        self.vllm_updated = None
+        self.poll_failures = 0
+
+        self.outcomes = Counter("admission_total", "Admission decisions by outcome", labels=("outcome",))
+        self.queue_wait_ms = Histogram(
+            "admission_queue_wait_ms", QUEUE_WAIT_MS_BUCKETS,
+            "Time admitted requests waited for a slot (ms)"
+        )
+
+        self._slots = None
+        self._poller = None
+
+    async def start(self):
+        """Create the slot semaphore and start polling vLLM"""
+        self._slots = asyncio.Semaphore(self.max_inflight)
+        self._poller = asyncio.create_task(self._poll())
+
+    async def stop(self):
+        """Stop polling"""
+        if self._poller:
+            self._poller.cancel()
+            try:
+                await self._poller
+            except asyncio.CancelledError:
+                pass
+
+    async def _fetch(self, url: str) -> str:
+        response = await self.client.get(url, timeout=max(1.0, self.poll_interval * 2))
+        response.raise_for_status()
+        return response.text
+
+    async def _poll(self):
+        """Refresh vLLM queue depth and KV-cache usage (servers that fail to answer are left out)"""
+        while True:
+            replies = await asyncio.gather(*(self._fetch(url) for url in self.metrics_urls), return_exceptions=True)
+            texts = [reply for reply in replies if isinstance(reply, str)]
+            self.poll_failures += len(replies) - len(texts)
+            if texts:
+                self.vllm = {
+                    "waiting": _combine([parse_gauge(text, WAITING_METRICS) for text in texts], sum),
+                    "running": _combine([parse_gauge(text, RUNNING_METRICS) for text in texts], sum),
+                    "kv_usage": _combine([parse_gauge(text, KV_USAGE_METRICS) for text in texts], max)
+                }
+                self.vllm_updated = time.monotonic()
+            await asyncio.sleep(self.poll_interval)
+
+    def _vllm_signal(self, name: str) -> Optional[float]:
+        """Last polled vLLM value, or None if missing or stale"""
+        if self.vllm_updated is None or time.monotonic() - self.vllm_updated > STALE_POLLS * self.poll_interval:
+            return None
+        return self.vllm.get(name)
+
+    def predicted_wait(self) -> float:
+        """Estimated seconds until a new request would start (0 until a service time is known)"""
+        if not self.service_s:
+            return 0.0
+        ahead = self.queued + (self._vllm_signal("waiting") or 0)
+        if self.inflight < self.max_inflight and not ahead:
+            return 0.0
+        return (ahead + 1) * self.service_s / self.max_inflight
+
+    def _reject(self, reason: str):
+        retry_after = max(1, math.ceil(self.predicted_wait() or self.poll_interval))
+        self.outcomes.inc(outcome=f"rejected_{reason}")
+        raise AdmissionRejected(reason, retry_after)
+
+    async def admit(self) -> Ticket:
+        """
+        Admit a request, waiting in the bounded queue for a slot if needed.
+
+        Raises:
+            AdmissionRejected: vLLM queue/KV cache saturated, proxy queue full,
+                               or the (predicted) wait exceeds max_wait_s
+        """
+        waiting = self._vllm_signal("waiting")
+        if self.max_waiting is not None and waiting is not None and waiting >= self.max_waiting:
+            self._reject("vllm_queue")
+        kv_usage = self._vllm_signal("kv_usage")
+        if self.max_kv_usage is not None and kv_usage is not None and kv_usage >= self.max_kv_usage:
+            self._reject("kv_cache")
+        if self.inflight >= self.max_inflight and self.queued >= self.max_queue:
+            self._reject("queue_full")
+        if self.predicted_wait() > self.max_wait_s:
+            self._reject("predicted_wait")
+
+        if self.inflight < self.max_inflight and not self.queued:
+            await self._slots.acquire()  # Free slot: returns immediately
+            self.outcomes.inc(outcome="admitted")
+        else:
+            self.queued += 1
+            start = time.perf_counter()
+            try:
+                await asyncio.wait_for(self._slots.acquire(), self.max_wait_s)
+            except asyncio.TimeoutError:
+                self._reject("queue_timeout")
+            finally:
+                self.queued -= 1
+            self.queue_wait_ms.observe((time.perf_counter() - start) * 1000)
+            self.outcomes.inc(outcome="queued")
+
+        self.inflight += 1
+        return Ticket(self)
+
+    def _release(self, ticket: Ticket):
+        """Free the ticket's slot and update the service time estimate"""
+        self.inflight -= 1
+        self._slots.release()
+        elapsed = time.perf_counter() - ticket.admitted_at
+        if self.service_s is None:
+            self.service_s = elapsed
+        else:
+            self.service_s += SERVICE_EWMA_ALPHA * (elapsed - self.service_s)
+
+    def stats(self) -> Dict:
+        """
+        Admission statistics for the /stats endpoint.
+
+        Returns:
+            Dictionary with limits, current load, vLLM signals and outcome counts
+        """
+        return {
+            "limits": {
+                "max_inflight": self.max_inflight,
+                "max_queue": self.max_queue,
+                "max_vllm_waiting": self.max_waiting,
+                "max_kv_usage": self.max_kv_usage,
+                "max_wait_s": self.max_wait_s
+            },
+            "inflight": self.inflight,
+            "queued": self.queued,
+            "service_time_s": round(self.service_s, 3) if self.service_s else None,
+            "predicted_wait_s": round(self.predicted_wait(), 3),
+            "vllm": {name: self._vllm_signal(name) for name in self.vllm},
+            "vllm_metrics_age_s": round(time.monotonic() - self.vllm_updated, 2) if self.vllm_updated else None,
+            "poll_failures": self.poll_failures,
+            "outcomes": self.outcomes.snapshot(),
+            "queue_wait_ms_histogram": self.queue_wait_ms.snapshot()
+        }
@@ -0,0 +1,138 @@
+"""
+Collection aliases for blue/green rebuilds.
+
+setup/2_embed_and_store.py never rebuilds a served collection in place: each
+build goes into a new versioned collection (<name>__g<generation>) with its own
+embedding store and BM25 index, and only then is the logical name pointed at
+it by atomically replacing chroma_db/aliases.json. Readers resolve the logical
+name when they open a collection; the RAG proxy watches the file and swaps
+collections between requests. Names without an alias resolve to themselves
+(collections built before aliases existed).
+
+A proxy may keep serving an older build (e.g. it rejected a new one), so
+each running proxy records the builds it serves in chroma_db/serving/<pid>.json
+and pruning skips them; records of processes that have exited are ignored.
+
+File format (JSON):
+    {"scifi_world": "scifi_world__g7", "characters": "characters__g2"}
+"""
+
+import json
+import os
+import re
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+ALIAS_FILE = "aliases.json"
+SERVING_DIR = "serving"  # <pid>.json: builds a running proxy serves
+GENERATION_SEPARATOR = "__g"
+KEEP_GENERATIONS = 2  # Builds kept per alias: the live one + one to roll back to
+
+
+def alias_path(chroma_dir: Path) -> Path:
+    """Path of the alias file of a ChromaDB directory"""
+    return Path(chroma_dir) / ALIAS_FILE
+
+
+def versioned_name(alias: str, generation: int) -> str:
+    """Collection name of one build of an alias"""
+    return f"{alias}{GENERATION_SEPARATOR}{generation}"
+
+
+def generation_of(alias: str, name: str) -> Optional[int]:
+    """Build generation of a versioned collection name (None if it is not a build of alias)"""
+    match = re.fullmatch(re.escape(alias + GENERATION_SEPARATOR) + r"(\d+)", name)
+    return int(match.group(1)) if match else None
+
+
+def read_aliases(chroma_dir: Path) -> Dict[str, str]:
+    """All aliases (empty if the file does not exist yet)"""
+    path = alias_path(chroma_dir)
+    if not path.exists():
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def resolve_alias(chroma_dir: Path, name: str) -> str:
+    """Collection currently behind a name (the name itself if it is not an alias)"""
+    return read_aliases(chroma_dir).get(name, name)
+
+
+def alias_mtime(chroma_dir: Path) -> Optional[int]:
+    """Modification time of the alias file in ns (None if missing) - cheap change check"""
+    try:
+        return alias_path(chroma_dir).stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def set_alias(chroma_dir: Path, alias: str, collection_name: str) -> Optional[str]:
+    """
+    Point alias at a collection (atomic: readers see the old or the new file, never a partial one).
+
+    Returns:
+        Collection the alias pointed at before (None if it is new)
+    """
+    aliases = read_aliases(chroma_dir)
+    previous = aliases.get(alias)
+    aliases[alias] = collection_name
+    _write_atomic(alias_path(chroma_dir), aliases)
+    return previous
+
+
+def _write_atomic(path: Path, data) -> None:
+    """Write JSON through a temporary file and an atomic rename"""
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def _serving_path(chroma_dir: Path, pid: int) -> Path:
+    return Path(chroma_dir) / SERVING_DIR / f"{pid}.json"
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # Exists, owned by another user
+    return True
+
+
+def record_serving(chroma_dir: Path, collection_names: List[str]) -> None:
+    """Record the builds this process serves (replaces its previous record)"""
+    path = _serving_path(chroma_dir, os.getpid())
+    path.parent.mkdir(exist_ok=True)
+    _write_atomic(path, sorted(collection_names))
+
+
+def clear_serving(chroma_dir: Path) -> None:
+    """Remove this process's record (shutdown)"""
+    _serving_path(chroma_dir, os.getpid()).unlink(missing_ok=True)
+
+
+def serving_builds(chroma_dir: Path) -> Set[str]:
+    """Builds recorded by running processes (records of exited processes are deleted)"""
+    served = set()
+    for path in (Path(chroma_dir) / SERVING_DIR).glob("*.json"):
+        if not path.stem.isdigit() or not _process_alive(int(path.stem)):
+            path.unlink(missing_ok=True)
+            continue
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                served.update(json.load(f))
+        except (OSError, ValueError):
+            continue  # Removed or replaced while reading
+    return served
+
+
+def builds(alias: str, collection_names: List[str]) -> List[Tuple[int, str]]:
+    """(generation, name) of every versioned build of alias, newest first"""
+    found = [(generation_of(alias, name), name) for name in collection_names]
+    return sorted(((g, name) for g, name in found if g is not None), reverse=True)
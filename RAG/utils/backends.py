@@ -0,0 +1,277 @@
+"""
+Model-aware load balancing across several vLLM servers for the RAG proxy.
+
+One proxy can front more than one vLLM process, e.g. the base model on 8000
+and a merged fine-tune on 8002 (fine-tuning/benchmarks/1_voice_comparison.py).
+The pool:
+- Learns which models each backend serves from its /models endpoint
+- Routes a request to a healthy backend serving the request's "model";
+  among several, the one with the fewest outstanding requests wins
+  (ties rotate, so an idle pool still spreads load)
+- Health-checks every backend in the background (GET /models); a backend
+  is ejected after --eject-after consecutive failures (checks or connection
+  errors on real requests) and put back after its next successful check
+- Retries a request on the next backend when the connection could not be
+  opened (nothing was sent, so this is always safe)
+- Starts without any backend up (vLLM still loading): until one answers,
+  checks repeat every RETRY_INTERVAL_S and `available` stays cleared
+
+Usage:
+    pool = BackendPool(["http://localhost:8000/v1", "http://localhost:8002/v1"], make_client)
+    await pool.start()
+    response, lease = await pool.send(payload["model"], "POST", "/chat/completions", json=payload)
+    ...
+    lease.release()   # idempotent
+"""
+
+import asyncio
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+
+from .metrics import Counter
+
+HEALTH_INTERVAL_S = 5.0    # Seconds between active health checks
+HEALTH_TIMEOUT_S = 2.0     # Health check request timeout
+EJECT_AFTER_FAILURES = 2   # Consecutive failures before a backend leaves the rotation
+RETRY_INTERVAL_S = 1.0     # Seconds between health checks while no backend is healthy
+
+
+def metrics_url(base_url: str) -> str:
+    """vLLM Prometheus endpoint of an OpenAI base URL (http://host:8000/v1 -> http://host:8000/metrics)"""
+    root = base_url.rstrip("/")
+    if root.endswith("/v1"):
+        root = root[:-len("/v1")]
+    return f"{root}/metrics"
+
+
+class NoBackendAvailable(Exception):
+    """No healthy backend serves the model; known is False if no backend ever served it"""
+
+    def __init__(self, model: str, known: bool, served: List[str]):
+        if known:
+            message = f"No healthy vLLM backend serves model '{model}'"
+        else:
+            message = f"Model '{model}' is not served by any vLLM backend (available: {served})"
+        super().__init__(message)
+        self.model = model
+        self.known = known
+        self.served = served
+
+    @property
+    def status_code(self) -> int:
+        """HTTP status for the client: 404 for a model no backend serves, 503 while its backends are down"""
+        return 404 if self.served and not self.known else 503
+
+
+class Lease:
+    """One outstanding request on a backend; release() when its response has been read"""
+
+    def __init__(self, backend: "Backend"):
+        self.backend = backend
+        self.released = False
+        backend.outstanding += 1
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.backend.outstanding -= 1
+
+
+class Backend:
+    """One vLLM server: its client, served models and health"""
+
+    def __init__(self, url: str, client: httpx.AsyncClient):
+        self.url = url.rstrip("/")
+        self.name = urlsplit(self.url).netloc or self.url
+        self.client = client
+        self.models: Dict[str, Dict] = {}  # Model id -> /models entry (kept while ejected)
+        self.healthy = False
+        self.failures = 0  # Consecutive
+        self.outstanding = 0
+        self.last_check = None
+        self.last_error = None
+
+    def max_model_len(self, model: str) -> Optional[int]:
+        return self.models.get(model, {}).get("max_model_len")
+
+
+class BackendPool:
+    """Least-outstanding-requests routing by model name, with active health checks"""
+
+    def __init__(self, urls: Sequence[str], client_factory: Callable[[str], httpx.AsyncClient],
+                 health_interval_s: float = HEALTH_INTERVAL_S, health_timeout_s: float = HEALTH_TIMEOUT_S,
+                 eject_after: int = EJECT_AFTER_FAILURES):
+        """
+        Args:
+            urls: OpenAI base URLs of the vLLM servers (http://host:port/v1)
+            client_factory: Creates the pooled client for one base URL
+            health_interval_s: Seconds between health checks
+            health_timeout_s: Health check request timeout
+            eject_after: Consecutive failures before a backend is ejected
+        """
+        self.backends = [Backend(url, client_factory(url)) for url in dict.fromkeys(urls)]
+        self.health_interval = health_interval_s
+        self.health_timeout = health_timeout_s
+        self.eject_after = max(1, eject_after)
+
+        self.requests = Counter("backend_requests_total", "Requests sent per vLLM backend", labels=("backend",))
+        self.failures = Counter("backend_failures_total", "Failed health checks and connection errors per vLLM backend",
+                                labels=("backend",))
+        self.ejections = Counter("backend_ejections_total", "Times a vLLM backend was taken out of rotation",
+                                 labels=("backend",))
+
+        self.available = asyncio.Event()  # Set while at least one backend is healthy
+        self._turn = 0
+        self._checker = None
+
+    async def start(self):
+        """Check every backend once, then keep checking in the background (also if none answered)"""
+        await self.check_all()
+        self._checker = asyncio.create_task(self._check_loop())
+
+    async def stop(self):
+        """Stop health checks and close the backend clients"""
+        if self._checker:
+            self._checker.cancel()
+            try:
+                await self._checker
+            except asyncio.CancelledError:
+                pass
+        for backend in self.backends:
+            await backend.client.aclose()
+
+    async def _check_loop(self):
+        while True:
+            interval = self.health_interval if self.available.is_set() else min(self.health_interval, RETRY_INTERVAL_S)
+            await asyncio.sleep(interval)
+            await self.check_all()
+
+    async def check_all(self):
+        await asyncio.gather(*(self.check(backend) for backend in self.backends))
+
+    async def check(self, backend: Backend) -> bool:
+        """Refresh a backend's model list; eject or re-admit it"""
+        backend.last_check = time.monotonic()
+        try:
+            response = await backend.client.get("/models", timeout=self.health_timeout)
+            response.raise_for_status()
+            models = {entry["id"]: entry for entry in response.json()["data"]}
+        except Exception as e:
+            self._failed(backend, e)
+            return False
+        backend.models = models
+        backend.failures = 0
+        backend.last_error = None
+        if not backend.healthy:
+            backend.healthy = True
+            self.available.set()
+            print(f"[BACKENDS] {backend.name} in rotation ({', '.join(models)})")
+        return True
+
+    def _failed(self, backend: Backend, error: Exception):
+        """Count a failure; eject the backend once it reaches the threshold"""
+        backend.failures += 1
+        backend.last_error = f"{type(error).__name__}: {error}"
+        self.failures.inc(backend=backend.name)
+        if backend.healthy and backend.failures >= self.eject_after:
+            backend.healthy = False
+            self.ejections.inc(backend=backend.name)
+            print(f"[BACKENDS] Ejected {backend.name} after {backend.failures} failure(s): {backend.last_error}")
+            if not any(b.healthy for b in self.backends):
+                self.available.clear()
+
+    def served_models(self) -> List[str]:
+        """Models served by at least one healthy backend"""
+        return list(dict.fromkeys(model for b in self.backends if b.healthy for model in b.models))
+
+    def model_cards(self) -> List[Dict]:
+        """/models entries of the served models (first healthy backend's entry per model)"""
+        cards = {}
+        for backend in self.backends:
+            if backend.healthy:
+                for model, entry in backend.models.items():
+                    cards.setdefault(model, entry)
+        return list(cards.values())
+
+    def max_model_len(self, model: str) -> Optional[int]:
+        """Smallest context window among the backends serving model (None if unknown)"""
+        lengths = [b.max_model_len(model) for b in self.backends if b.max_model_len(model)]
+        return min(lengths) if lengths else None
+
+    def pick(self, model: str, exclude: Sequence[Backend] = ()) -> Backend:
+        """
+        Healthy backend serving model with the fewest outstanding requests.
+
+        Raises:
+            NoBackendAvailable: No healthy backend (outside exclude) serves the model
+        """
+        candidates = [b for b in self.backends if b.healthy and model in b.models and b not in exclude]
+        if not candidates:
+            known = any(model in b.models for b in self.backends)
+            raise NoBackendAvailable(model, known, self.served_models())
+        self._turn += 1
+        start = self._turn % len(candidates)
+        return min(candidates[start:] + candidates[:start], key=lambda b: b.outstanding)
+
+    async def send(self, model: str, method: str, path: str, **kwargs) -> Tuple[httpx.Response, Lease]:
+        """
+        Send a streamed request to the best backend for model.
+
+        Connection failures count against the backend and the request moves
+        on to the next candidate; the caller reads and closes the response and
+        releases the lease.
+
+        Raises:
+            NoBackendAvailable: No (remaining) healthy backend serves the model
+            httpx.HTTPError: Request failed after the connection was opened
+        """
+        tried = []
+        while True:
+            backend = self.pick(model, exclude=tried)
+            lease = Lease(backend)
+            try:
+                response = await backend.client.send(
+                    backend.client.build_request(method, path, **kwargs), stream=True
+                )
+            except httpx.ConnectError as e:
+                lease.release()
+                self._failed(backend, e)
+                tried.append(backend)
+                continue
+            except Exception as e:
+                lease.release()
+                if isinstance(e, httpx.TransportError):
+                    self._failed(backend, e)
+                raise
+            backend.failures = 0
+            self.requests.inc(backend=backend.name)
+            return response, lease
+
+    def stats(self) -> Dict:
+        """
+        Backend statistics for the /stats endpoint.
+
+        Returns:
+            Dictionary with per-backend health, models, load and failure counts
+        """
+        return {
+            "health_interval_s": self.health_interval,
+            "eject_after": self.eject_after,
+            "backends": {
+                b.name: {
+                    "url": b.url,
+                    "healthy": b.healthy,
+                    "models": list(b.models),
+                    "outstanding": b.outstanding,
+                    "requests": self.requests.value(backend=b.name),
+                    "failures": self.failures.value(backend=b.name),
+                    "ejections": self.ejections.value(backend=b.name),
+                    "last_error": b.last_error,
+                    "last_check_age_s": round(time.monotonic() - b.last_check, 2) if b.last_check else None
+                }
+                for b in self.backends
+            }
+        }
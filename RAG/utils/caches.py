@@ -0,0 +1,272 @@
+"""
+Bounded in-process caches for the RAG proxy.
+
+Provides a size-bounded LRU cache with optional time-to-live:
+- Least-recently-used eviction once max_entries is reached
+- Entries older than ttl_seconds are treated as misses and dropped
+- Hit/miss/eviction counters for the /stats endpoint
+
+Also provides key helpers shared by the proxy caches, a per-conversation
+retrieval cache that lets follow-up turns about the same scene skip the search,
+and a semantic response cache for near-identical deterministic requests.
+Streamed responses are only cacheable once complete (complete_sse).
+"""
+
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional, Sequence
+
+import numpy as np
+
+
+def normalize_query(text: str) -> str:
+    """Normalize query text for cache keys (trim and collapse whitespace)"""
+    return " ".join(text.split())
+
+
+def complete_sse(chunks: Sequence[bytes]) -> bool:
+    """
+    Whether relayed SSE bytes form a complete, successful stream.
+
+    vLLM can fail after the 200 status line was sent: the stream then carries
+    an error frame (data: {"error": ...} or {"object": "error"}, or an
+    "event: error") and may stop without the terminating "data: [DONE]".
+    Such streams must not be replayed from a cache.
+    """
+    payloads = []
+    for line in b"".join(chunks).decode("utf-8", errors="replace").splitlines():
+        line = line.strip()
+        if line.startswith("event:") and line[len("event:"):].strip() == "error":
+            return False
+        if not line.startswith("data:"):
+            continue
+        payload = line[len("data:"):].strip()
+        if '"error"' in payload:
+            try:
+                frame = json.loads(payload)
+            except ValueError:
+                frame = None
+            if isinstance(frame, dict) and ("error" in frame or frame.get("object") == "error"):
+                return False
+        payloads.append(payload)
+    return bool(payloads) and payloads[-1] == "[DONE]"
+
+
+class LRUCache:
+    """Size-bounded LRU cache with per-entry TTL"""
+
+    def __init__(self, name: str, max_entries: int = 1024, ttl_seconds: Optional[float] = None):
+        """
+        Args:
+            name: Cache name (for stats output)
+            max_entries: Maximum entries kept (0 disables the cache)
+            ttl_seconds: Entry lifetime in seconds (None or 0 = no expiry)
+        """
+        self.name = name
+        self.max_entries = max(0, max_entries)
+        self.ttl = ttl_seconds or None
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """
+        Look up a cached value.
+
+        Returns:
+            Cached value, or None on miss/expiry
+        """
+        if not self.enabled:
+            return None
+        value = self._lookup(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def _lookup(self, key: Hashable) -> Optional[Any]:
+        """Live value for key, marked recently used (expired entries are dropped); hits/misses not counted"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, stored_at = entry
+        if self.ttl is not None and time.monotonic() - stored_at > self.ttl:
+            del self._entries[key]
+            self.expirations += 1
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def put(self, key: Hashable, value: Any):
+        """Store a value, evicting the least recently used entry if full"""
+        if not self.enabled:
+            return
+        self._entries[key] = (value, time.monotonic())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        """Drop all entries (counters are kept)"""
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        """
+        Cache statistics for the /stats endpoint.
+
+        Returns:
+            Dictionary with size, limits, counters and hit rate
+        """
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations
+        }
+
+
+class SessionRetrievalCache(LRUCache):
+    """
+    Conversation-scoped retrieval reuse.
+    
+    Keeps, per session, the query embedding that produced the session's last
+    searched chunk set. A later turn whose query embedding is within the cosine
+    threshold of that anchor reuses the chunk set instead of searching again.
+    The anchor is only replaced by a real search, so small steps across many
+    turns cannot drift away from the chunks being reused.
+    """
+    
+    def __init__(self, max_entries: int = 256, ttl_seconds: Optional[float] = None,
+                 threshold: float = 0.9):
+        """
+        Args:
+            max_entries: Sessions kept (0 disables reuse)
+            ttl_seconds: Session lifetime since its last search (None or 0 = no expiry)
+            threshold: Minimum cosine similarity to the anchor query for reuse
+        """
+        super().__init__("session_retrieval", max_entries=max_entries, ttl_seconds=ttl_seconds)
+        self.threshold = threshold
+        self.lookups = 0
+        self.reuses = 0
+        self.search_ms_saved = 0.0
+    
+    def reuse(self, session: Hashable, query_embedding: np.ndarray, scope: Hashable) -> Optional[Any]:
+        """
+        Chunk set of the session's last search, if the new query is close enough.
+        
+        Args:
+            session: Conversation key
+            query_embedding: Embedding of the new query
+            scope: Search parameters the results must match (top_k, collection version, ...)
+        
+        Returns:
+            Reused search results, or None (search needed)
+        """
+        if not self.enabled:
+            return None
+        self.lookups += 1
+        entry = self.get(session)
+        if entry is None:
+            return None
+        anchor, results, entry_scope, search_ms = entry
+        if entry_scope != scope:
+            return None
+        query = np.asarray(query_embedding, dtype=np.float32).ravel()
+        similarity = float(anchor @ query) / max(float(np.linalg.norm(query)), 1e-12)
+        if similarity < self.threshold:
+            return None
+        self.reuses += 1
+        self.search_ms_saved += search_ms
+        return results
+    
+    def remember(self, session: Hashable, query_embedding: np.ndarray, results: Any,
+                 scope: Hashable, search_ms: float):
+        """Store a session's latest search (new anchor query and its results)"""
+        anchor = np.asarray(query_embedding, dtype=np.float32).ravel()
+        anchor = anchor / max(float(np.linalg.norm(anchor)), 1e-12)
+        self.put(session, (anchor, results, scope, search_ms))
+    
+    def stats(self) -> dict:
+        """Session statistics for the /stats endpoint (reuse rate, search time saved)"""
+        return {
+            **super().stats(),
+            "threshold": self.threshold,
+            "lookups": self.lookups,
+            "reuses": self.reuses,
+            "reuse_rate": round(self.reuses / self.lookups, 4) if self.lookups else 0.0,
+            "search_ms_saved": round(self.search_ms_saved, 3),
+            "mean_search_ms_saved": round(self.search_ms_saved / self.reuses, 3) if self.reuses else 0.0
+        }
+
+
+class SemanticResponseCache(LRUCache):
+    """
+    Response reuse for near-identical deterministic requests.
+    
+    Entries are grouped by scope: everything about a request except its query
+    text, including the ids of the chunks retrieved for it. A request reuses a
+    cached response only if its scope matches exactly and its query embedding
+    is within the (strict) cosine threshold of a cached query's embedding.
+    """
+    
+    def __init__(self, max_entries: int = 256, threshold: float = 0.97, per_scope: int = 4):
+        """
+        Args:
+            max_entries: Scopes kept (0 disables the cache)
+            threshold: Minimum cosine similarity to a cached query for reuse
+            per_scope: Responses kept per scope (most recent first)
+        """
+        super().__init__("responses_semantic", max_entries=max_entries)
+        self.threshold = threshold
+        self.per_scope = max(1, per_scope)
+    
+    def lookup(self, scope: Hashable, query_embedding: np.ndarray) -> Optional[Any]:
+        """
+        Cached response for a query close enough to one answered in this scope.
+        
+        Returns:
+            Cached response, or None
+        """
+        if not self.enabled:
+            return None
+        entries = self._lookup(scope) or []
+        query = np.asarray(query_embedding, dtype=np.float32).ravel()
+        query = query / max(float(np.linalg.norm(query)), 1e-12)
+        for anchor, response in entries:
+            if float(anchor @ query) >= self.threshold:
+                self.hits += 1
+                return response
+        # No scope, or no query in it close enough
+        self.misses += 1
+        return None
+    
+    def store(self, scope: Hashable, query_embedding: np.ndarray, response: Any):
+        """Remember a response for its scope (oldest response in the scope dropped when full)"""
+        if not self.enabled:
+            return
+        anchor = np.asarray(query_embedding, dtype=np.float32).ravel()
+        anchor = anchor / max(float(np.linalg.norm(anchor)), 1e-12)
+        entry = self._entries.get(scope)
+        entries = entry[0] if entry else []
+        self.put(scope, [(anchor, response)] + entries[:self.per_scope - 1])
+    
+    def stats(self) -> dict:
+        """Cache statistics plus the similarity threshold"""
+        return {**super().stats(), "threshold": self.threshold, "per_scope": self.per_scope}
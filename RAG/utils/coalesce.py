@@ -0,0 +1,214 @@
+"""
+Single-flight coalescing of identical in-flight upstream requests.
+
+Benchmarks and editor retries sometimes send the same deterministic request
+(temperature 0, same messages) several times at once; without coalescing
+every copy takes its own vLLM slot and generates the same tokens. Requests
+are keyed by a canonical hash of the upstream body:
+- Non-streaming: the first request (leader) runs the upstream call; identical
+  requests arriving before it finishes await the same result
+- Streaming: the leader's upstream stream is read by one pump task into a
+  buffer; every subscriber (leader included) first receives the chunks
+  already buffered, then follows the live stream. When the last subscriber
+  disconnects, the upstream request is closed (vLLM aborts the generation)
+
+Only in-flight requests are shared - a flight is forgotten as soon as its
+upstream response is complete, so nothing is cached.
+
+Usage:
+    coalescer = RequestCoalescer()
+    response, shared = await coalescer.call(request_key(endpoint, payload), fetch)
+    subscription, shared = await coalescer.stream(request_key(endpoint, payload), open_stream)
+    async for chunk in subscription: ...
+    subscription.close()   # idempotent
+"""
+
+import asyncio
+import hashlib
+import json
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from .metrics import Counter
+
+
+def request_key(endpoint: str, payload: Dict[str, Any]) -> str:
+    """Canonical hash of an upstream request (key order and whitespace do not matter)"""
+    canonical = json.dumps([endpoint, payload], sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def is_deterministic(payload: Dict[str, Any]) -> bool:
+    """Greedy sampling (temperature 0): identical requests produce identical output"""
+    return payload.get("temperature") == 0
+
+
+class StreamFlight:
+    """One upstream stream shared by its subscribers"""
+
+    def __init__(self, key: str):
+        self.key = key
+        self.chunks: List[bytes] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.opened = asyncio.get_running_loop().create_future()  # Upstream open (or failed)
+        self.changed = asyncio.Condition()
+        self.pump: Optional[asyncio.Task] = None
+
+    @property
+    def nbytes(self) -> int:
+        return sum(len(chunk) for chunk in self.chunks)
+
+
+class Subscription:
+    """A subscriber's view of a shared stream: buffered chunks first, then live ones"""
+
+    def __init__(self, coalescer: "RequestCoalescer", flight: StreamFlight):
+        self.coalescer = coalescer
+        self.flight = flight
+        self.closed = False
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        flight = self.flight
+        sent = 0
+        while True:
+            async with flight.changed:
+                await flight.changed.wait_for(lambda: len(flight.chunks) > sent or flight.done)
+                chunks = flight.chunks[sent:]
+                finished = flight.done
+            for chunk in chunks:
+                yield chunk
+            sent += len(chunks)
+            if finished and sent == len(flight.chunks):
+                break
+        if flight.error is not None:
+            raise flight.error
+
+    def close(self):
+        """Leave the flight; the last subscriber out closes the upstream stream"""
+        if not self.closed:
+            self.closed = True
+            self.coalescer._leave(self.flight)
+
+
+class RequestCoalescer:
+    """Shares one upstream request among identical concurrent requests"""
+
+    def __init__(self):
+        self.calls: Dict[str, asyncio.Future] = {}
+        self.streams: Dict[str, StreamFlight] = {}
+        self.requests = Counter("coalesce_requests_total", "Coalescable requests by mode and role "
+                                "(follower = upstream request saved)", labels=("mode", "role"))
+
+    async def call(self, key: str, fetch: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        Run fetch() once for all concurrent callers with the same key.
+
+        Returns:
+            (fetch result, shared) - shared is True for followers; the leader's
+            exception is raised in every caller
+        """
+        task = self.calls.get(key)
+        shared = task is not None
+        if task is None:
+            task = asyncio.ensure_future(fetch())
+            self.calls[key] = task
+            task.add_done_callback(lambda t: self._call_done(key, t))
+        self.requests.inc(mode="call", role="follower" if shared else "leader")
+        # Shielded: a caller that goes away does not cancel the others' request
+        return await asyncio.shield(task), shared
+
+    def _call_done(self, key: str, task: asyncio.Future):
+        if self.calls.get(key) is task:
+            del self.calls[key]
+        if not task.cancelled():
+            task.exception()  # Retrieved here so an unawaited failure is not logged as lost
+
+    async def stream(self, key: str,
+                     open_stream: Callable[[], Awaitable[Tuple[AsyncIterator[bytes], Callable[[], Awaitable[None]]]]]
+                     ) -> Tuple[Subscription, bool]:
+        """
+        Subscribe to the in-flight stream for key, opening it if there is none.
+
+        Args:
+            key: request_key() of the upstream request
+            open_stream: Opens the upstream stream; returns (raw chunk iterator,
+                         async close function). Errors (e.g. non-200 upstream
+                         status) are raised in every subscriber waiting for it.
+
+        Returns:
+            (Subscription, shared) - shared is True for followers
+        """
+        flight = self.streams.get(key)
+        shared = flight is not None
+        if flight is None:
+            flight = StreamFlight(key)
+            self.streams[key] = flight
+        flight.subscribers += 1
+        self.requests.inc(mode="stream", role="follower" if shared else "leader")
+
+        if not shared:
+            try:
+                chunks, close = await open_stream()
+            except BaseException as e:
+                self._forget(flight)
+                flight.subscribers -= 1
+                flight.opened.set_exception(e)
+                flight.opened.exception()  # Followers re-raise it; nobody else has to
+                raise
+            flight.pump = asyncio.create_task(self._pump(flight, chunks, close))
+            flight.opened.set_result(None)
+        else:
+            try:
+                await asyncio.shield(flight.opened)
+            except BaseException:
+                flight.subscribers -= 1
+                raise
+        return Subscription(self, flight), shared
+
+    async def _pump(self, flight: StreamFlight, chunks: AsyncIterator[bytes],
+                    close: Callable[[], Awaitable[None]]):
+        """Read the upstream stream into the flight's buffer, waking subscribers per chunk"""
+        try:
+            async for chunk in chunks:
+                async with flight.changed:
+                    flight.chunks.append(chunk)
+                    flight.changed.notify_all()
+        except asyncio.CancelledError:
+            flight.error = ConnectionAbortedError("Shared stream closed: no subscribers left")
+        except Exception as e:
+            flight.error = e
+        finally:
+            self._forget(flight)
+            await close()
+            async with flight.changed:
+                flight.done = True
+                flight.changed.notify_all()
+
+    def _forget(self, flight: StreamFlight):
+        """Stop routing new subscribers to a finished flight"""
+        if self.streams.get(flight.key) is flight:
+            del self.streams[flight.key]
+
+    def _leave(self, flight: StreamFlight):
+        flight.subscribers -= 1
+        if flight.subscribers <= 0 and not flight.done and flight.pump:
+            flight.pump.cancel()
+
+    def stats(self) -> Dict:
+        """
+        Coalescing statistics for the /stats endpoint.
+
+        Returns:
+            Dictionary with in-flight counts and leader/follower totals per mode
+        """
+        return {
+            "inflight_calls": len(self.calls),
+            "inflight_streams": len(self.streams),
+            "stream_subscribers": sum(flight.subscribers for flight in self.streams.values()),
+            "buffered_bytes": sum(flight.nbytes for flight in self.streams.values()),
+            "requests": self.requests.snapshot(),
+            "upstream_requests_saved": sum(
+                self.requests.value(mode=mode, role="follower") for mode in ("call", "stream")
+            )
+        }
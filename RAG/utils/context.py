@@ -0,0 +1,109 @@
+"""
+Token-budgeted context assembly for the RAG proxy and benchmarks.
+
+Chunk token counts are computed once by setup/2_embed_and_store.py with the
+served model's tokenizer and stored in each chunk's metadata ("tokens"), so
+filling a budget at query time is a sum over metadata - nothing is tokenized
+on the hot path. Chunks from collections built before token counts were
+stored fall back to a character-based estimate.
+
+Also provides the retrieval gate: message-shape rules for requests that gain
+nothing from retrieved lore ("continue", rewrite/edit commands), and a
+distance cutoff that drops weak chunks.
+"""
+
+import re
+from typing import Dict, List, Optional, Pattern, Sequence, Tuple
+
+CHARS_PER_TOKEN = 4           # Estimate for text without a stored token count
+SOURCE_HEADER_TOKENS = 12     # "[Source i: path]" line + separator per chunk
+MESSAGE_OVERHEAD_TOKENS = 4   # Chat template tokens per message
+
+# Edit commands (rewrite, translate, fix the spelling, ...) at the start of the query
+EDIT_COMMAND = (
+    r"(please\s+)?(rewrite|rephrase|reword|paraphrase|shorten|condense|expand|tighten|proofread|polish|"
+    r"edit|translate|summari[sz]e|(fix|correct|check)\s+(the\s+)?(grammar|spelling|typos?|punctuation))\b"
+)
+# Instruction after a pasted block: an edit command, or "make it ..." / "fix this" style
+BLOCK_EDIT = r"(" + EDIT_COMMAND + r"|(please\s+)?(make|turn|fix|improve|clean\s+up)\s+(it|this|that)\b)"
+
+# Queries that skip retrieval (matched case-insensitively at the start of the query).
+# Edit commands only skip when the text to work on is in the message: "Summarize
+# what we know about Elena" or "Check the spelling of Arcturian names" ask about
+# the lore and must retrieve.
+DEFAULT_SKIP_PATTERNS = [
+    # Empty / punctuation only
+    r"\W*$",
+    # Continuation
+    r"(please\s+)?(continue|go on|keep going|more)(\s+please)?\W*$",
+    # Edit command line ending in ":" with the text on the following lines
+    EDIT_COMMAND + r"[^\n]*:[ \t]*\n\s*\S",
+    # Edit command on a fenced block or a quoted passage (one sentence or more)
+    EDIT_COMMAND + r"[^\n]*(\n\s*)?(```|\"[^\"]{40,}\"|\u201c[^\u201d]{40,}\u201d)",
+    # Continue.dev edit requests: the fenced text block first, then the edit
+    # instruction ("```...``` Is this consistent with Elena's backstory?" retrieves)
+    r"```.*?```\s*" + BLOCK_EDIT,
+]
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate token count of text (no tokenizer)"""
+    return len(text) // CHARS_PER_TOKEN
+
+
+def chunk_tokens(document: str, metadata: Optional[Dict]) -> int:
+    """Token count of a chunk: precomputed at embed time, estimated otherwise"""
+    tokens = (metadata or {}).get("tokens")
+    return int(tokens) if tokens is not None else estimate_tokens(document)
+
+
+def conversation_tokens(texts: Sequence[str]) -> int:
+    """Approximate prompt tokens of a conversation (message contents + template)"""
+    return sum(estimate_tokens(t) + MESSAGE_OVERHEAD_TOKENS for t in texts)
+
+
+def select_within_budget(documents: Sequence[str], metadatas: Sequence[Dict],
+                         budget: Optional[int]) -> Tuple[List[int], int]:
+    """
+    Pick ranked chunks that fit a token budget.
+
+    Chunks are taken in rank order; a chunk that does not fit is skipped so a
+    smaller, lower-ranked chunk can still use the remaining budget.
+
+    Args:
+        documents: Chunk texts, best first
+        metadatas: Chunk metadata (with "tokens" from Step 2)
+        budget: Maximum context tokens (None = no limit)
+
+    Returns:
+        (indices of selected chunks in rank order, total context tokens)
+    """
+    selected, total = [], 0
+    for i, (doc, metadata) in enumerate(zip(documents, metadatas)):
+        cost = chunk_tokens(doc, metadata) + SOURCE_HEADER_TOKENS
+        if budget is not None and total + cost > budget:
+            continue
+        selected.append(i)
+        total += cost
+    return selected, total
+
+
+def compile_skip_rules(patterns: Sequence[str]) -> List[Pattern]:
+    """Compile skip-retrieval patterns (case-insensitive, anchored at the query start)"""
+    return [re.compile(p, re.IGNORECASE | re.DOTALL) for p in patterns]
+
+
+def matching_skip_rule(query: str, rules: Sequence[Pattern]) -> Optional[str]:
+    """Pattern of the first skip rule the query matches, or None (retrieve)"""
+    text = query.strip()
+    for rule in rules:
+        if rule.match(text):
+            return rule.pattern
+    return None
+
+
+def within_distance(distances: Sequence[Optional[float]], max_distance: Optional[float]) -> List[int]:
+    """Indices of hits at or below the distance cutoff (all hits if no cutoff; lexical-only hits have no distance and pass)"""
+    if max_distance is None:
+        return list(range(len(distances)))
+    return [i for i, d in enumerate(distances) if d is None or d <= max_distance]
@@ -0,0 +1,262 @@
+"""
+Embedding backends for the RAG proxy, setup and benchmark scripts.
+
+bge-large-en-v1.5 in fp32 PyTorch takes tens of milliseconds of CPU per
+query - the same cores that feed vLLM. All backends return a
+SentenceTransformer (same encode() API, pooling and normalization), only the
+transformer forward pass changes:
+- torch:     fp32 PyTorch (reference)
+- onnx:      ONNX Runtime, fp32 weights
+- onnx-int8: ONNX Runtime with dynamically quantized int8 weights (kernels
+             for this CPU: avx512_vnni / avx512 / avx2 / arm64)
+
+ONNX exports are written once under embeddings/onnx/<model>/ and reused;
+they need sentence-transformers[onnx] (optimum + onnxruntime).
+
+A quantized backend is only trustworthy if its vectors stay close to the
+fp32 ones the collection was built with: check_agreement() encodes chunk
+texts and compares them with their fp32 embeddings (per-text cosine).
+
+Step 2 stores an embedding fingerprint in the collection metadata: model,
+backend, precision, dimension, normalization and a hash of the embeddings
+of FINGERPRINT_TEXTS. verify_fingerprint() checks a query embedder against
+it at load time:
+- model / dimension / normalization differ -> FingerprintError (searching
+  would return unrelated chunks without any error)
+- reference hash equal -> same embeddings, nothing else to check
+- otherwise (other backend or precision, other CPU kernels, collection built
+  before fingerprints) -> agreement check against a sample of the stored
+  chunk embeddings (AgreementError below min_agreement); an empty
+  collection has nothing to compare and is reported "unverified"
+
+Usage:
+    embedder = load_embedding_model(EMBEDDING_MODEL, "onnx-int8")
+    vectors = embedder.encode(texts, batch_size=32, convert_to_numpy=True)
+    report = check_agreement(embedder, texts, reference_vectors)   # raises AgreementError below MIN_AGREEMENT
+    fingerprint = embedding_fingerprint(embedder, EMBEDDING_MODEL, "onnx-int8")
+    report = verify_fingerprint(collection, embedder, fingerprint)   # raises FingerprintError / AgreementError
+"""
+
+import hashlib
+import platform
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from sentence_transformers import SentenceTransformer
+
+# Embedding model - optimized for science fiction writing
+# Using bge-large-en-v1.5 for best semantic understanding of:
+# - Character personality nuances
+# - Thematic connections
+# - Worldbuilding details
+# - Plot coherence
+EMBEDDING_MODEL = "BAAI/bge-large-en-v1.5"  # 1024 dims, unit-norm output
+
+EMBEDDING_BACKENDS = ["torch", "onnx", "onnx-int8"]
+BACKEND_PRECISION = {"torch": "float32", "onnx": "float32", "onnx-int8": "int8"}  # Weight precision
+ONNX_DIR = Path(__file__).parent.parent / "embeddings" / "onnx"
+MIN_AGREEMENT = 0.97     # Lowest acceptable per-text cosine to the fp32 embedding
+AGREEMENT_SAMPLE = 256   # Chunks encoded for the agreement check (0 = skip)
+
+# Embedding fingerprint (collection metadata keys written by Step 2)
+FINGERPRINT_TEXTS = [
+    "Captain Elena Vasquez stood on the bridge of the Prometheus.",
+    "The Arcturian homeworld has a dense, nitrogen-rich atmosphere.",
+    "The FTL drive folds space around the ship.",
+    "Chapter 12: The battle at the outer colonies.",
+]
+FINGERPRINT_KEYS = ["embedding_model", "embedding_backend", "embedding_precision", "embedding_dim",
+                    "embedding_normalized", "embedding_reference_hash"]
+IDENTITY_KEYS = ["embedding_model", "embedding_dim", "embedding_normalized"]  # Must match exactly
+HASH_DECIMALS = 3  # Reference embeddings are rounded before hashing
+
+
+class AgreementError(ValueError):
+    """Backend embeddings drift too far from the fp32 reference"""
+
+
+class FingerprintError(ValueError):
+    """Query embedder incompatible with the embeddings stored in a collection"""
+
+
+def quantization_config() -> str:
+    """ONNX Runtime dynamic quantization target for this CPU"""
+    if platform.machine().lower() in ("arm64", "aarch64"):
+        return "arm64"
+    try:
+        flags = Path("/proc/cpuinfo").read_text()
+    except OSError:
+        flags = ""
+    if "avx512_vnni" in flags:
+        return "avx512_vnni"
+    if "avx512f" in flags:
+        return "avx512"
+    return "avx2"
+
+
+def onnx_model_dir(model_name: str) -> Path:
+    """Local directory of a model's ONNX exports"""
+    return ONNX_DIR / model_name.replace("/", "__")
+
+
+def load_embedding_model(model_name: str, backend: str = "torch") -> "SentenceTransformer":
+    """
+    Load an embedding model on one backend (exporting/quantizing to ONNX on first use).
+
+    Raises:
+        ValueError: Unknown backend
+    """
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unknown embedding backend '{backend}' (choose from {EMBEDDING_BACKENDS})")
+    # Imported here so `import utils` stays light; only the ONNX backends need optimum + onnxruntime
+    from sentence_transformers import SentenceTransformer
+    if backend == "torch":
+        return SentenceTransformer(model_name)
+    from sentence_transformers import export_dynamic_quantized_onnx_model
+
+    directory = onnx_model_dir(model_name)
+    if not (directory / "onnx" / "model.onnx").exists():
+        print(f"[EMBED] Exporting {model_name} to ONNX: {directory}")
+        SentenceTransformer(model_name, backend="onnx").save_pretrained(str(directory))
+    if backend == "onnx":
+        return SentenceTransformer(str(directory), backend="onnx")
+
+    config = quantization_config()
+    file_name = f"onnx/model_qint8_{config}.onnx"
+    if not (directory / file_name).exists():
+        print(f"[EMBED] Quantizing {model_name} to int8 ({config}): {directory / file_name}")
+        export_dynamic_quantized_onnx_model(SentenceTransformer(str(directory), backend="onnx"),
+                                            config, str(directory))
+    return SentenceTransformer(str(directory), backend="onnx", model_kwargs={"file_name": file_name})
+
+
+def sample_rows(total: int, sample: int) -> List[int]:
+    """Evenly spaced rows (deterministic, covers every part of the corpus); all rows if sample >= total"""
+    if sample <= 0 or sample >= total:
+        return list(range(total))
+    return sorted(set(np.linspace(0, total - 1, sample).astype(int).tolist()))
+
+
+def cosine_agreement(embeddings: np.ndarray, reference: np.ndarray) -> Dict[str, float]:
+    """Per-row cosine between two encodings of the same texts: min / 1st percentile / mean"""
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    reference = np.asarray(reference, dtype=np.float32)
+    cosines = (embeddings * reference).sum(axis=1) / (
+        np.linalg.norm(embeddings, axis=1) * np.linalg.norm(reference, axis=1) + 1e-12
+    )
+    return {
+        "texts": int(len(cosines)),
+        "min": float(cosines.min()),
+        "p01": float(np.percentile(cosines, 1)),
+        "mean": float(cosines.mean())
+    }
+
+
+def check_agreement(embedder: "SentenceTransformer", texts: Sequence[str], reference: np.ndarray,
+                    min_agreement: float = MIN_AGREEMENT, batch_size: int = 32) -> Dict[str, float]:
+    """
+    Encode texts and compare them with their fp32 reference embeddings.
+
+    Returns:
+        cosine_agreement() report plus the threshold
+
+    Raises:
+        AgreementError: Lowest per-text cosine below min_agreement
+    """
+    embeddings = embedder.encode(list(texts), batch_size=batch_size, convert_to_numpy=True)
+    report = {**cosine_agreement(embeddings, reference), "threshold": min_agreement}
+    if report["min"] < min_agreement:
+        raise AgreementError(f"Embedding agreement with fp32 too low: min cosine {report['min']:.4f} "
+                             f"< {min_agreement} over {report['texts']} chunks (mean {report['mean']:.4f})")
+    return report
+
+
+def reference_hash(embeddings: np.ndarray) -> str:
+    """Short hash of rounded reference embeddings (equal for the same model, backend and kernels)"""
+    rounded = np.round(np.asarray(embeddings, dtype=np.float32), HASH_DECIMALS) + 0.0  # -0.0 -> 0.0
+    return hashlib.sha256(rounded.astype(np.float32).tobytes()).hexdigest()[:16]
+
+
+def embedding_fingerprint(embedder: "SentenceTransformer", model_name: str, backend: str) -> Dict[str, Any]:
+    """Fingerprint of an embedder (FINGERPRINT_KEYS; values fit ChromaDB metadata)"""
+    reference = np.asarray(embedder.encode(FINGERPRINT_TEXTS, convert_to_numpy=True), dtype=np.float32)
+    return {
+        "embedding_model": model_name,
+        "embedding_backend": backend,
+        "embedding_precision": BACKEND_PRECISION[backend],
+        "embedding_dim": int(reference.shape[1]),
+        "embedding_normalized": bool(np.allclose(np.linalg.norm(reference, axis=1), 1.0, atol=1e-3)),
+        "embedding_reference_hash": reference_hash(reference)
+    }
+
+
+def stored_fingerprint(metadata: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Fingerprint from collection metadata (None for collections built before fingerprints)"""
+    metadata = metadata or {}
+    if "embedding_model" not in metadata:
+        return None
+    return {key: metadata.get(key) for key in FINGERPRINT_KEYS}
+
+
+def describe_fingerprint(fingerprint: Optional[Dict[str, Any]]) -> str:
+    """One-line summary, e.g. 'BAAI/bge-large-en-v1.5 (onnx-int8, int8, 1024 dims, normalized)'"""
+    if fingerprint is None:
+        return "unknown embedder (no fingerprint)"
+    normalized = ", normalized" if fingerprint["embedding_normalized"] else ""
+    return (f"{fingerprint['embedding_model']} ({fingerprint['embedding_backend']}, "
+            f"{fingerprint['embedding_precision']}, {fingerprint['embedding_dim']} dims{normalized})")
+
+
+def verify_fingerprint(collection, embedder: "SentenceTransformer", fingerprint: Dict[str, Any],
+                       min_agreement: float = MIN_AGREEMENT, sample: int = AGREEMENT_SAMPLE) -> Dict[str, Any]:
+    """
+    Check that a query embedder produces the embedding space a collection was built in.
+
+    Args:
+        collection: ChromaDB collection (metadata + stored documents/embeddings)
+        embedder: Query embedder
+        fingerprint: embedding_fingerprint() of the query embedder
+        min_agreement: Lowest acceptable cosine to a stored chunk embedding
+        sample: Chunks re-encoded when the reference hashes differ (0 = skip)
+
+    Returns:
+        Report: status "match" (same reference hash), "agreement" (checked
+        against stored chunks) or "unverified" (hashes differ and sample 0 or
+        no stored chunks; "reason" says which)
+
+    Raises:
+        FingerprintError: Different model, dimension or normalization
+        AgreementError: Stored chunk embeddings not reproduced within min_agreement
+    """
+    stored = stored_fingerprint(collection.metadata)
+    report = {"collection": collection.name, "stored": describe_fingerprint(stored),
+              "query": describe_fingerprint(fingerprint), "status": "match", "agreement": None, "reason": None}
+    if stored is not None:
+        mismatched = [key for key in IDENTITY_KEYS if stored[key] != fingerprint[key]]
+        if mismatched:
+            raise FingerprintError(f"{collection.name} was embedded with {report['stored']}, the query embedder "
+                                   f"is {report['query']} (differs in {', '.join(mismatched)}) - use the same "
+                                   f"model or rebuild the collection with setup/2_embed_and_store.py")
+        if stored["embedding_reference_hash"] == fingerprint["embedding_reference_hash"]:
+            return report
+    if sample <= 0:
+        report.update(status="unverified", reason="agreement check disabled (sample 0)")
+        return report
+
+    ids = collection.get(include=[])["ids"]
+    if not ids:
+        report.update(status="unverified", reason="collection is empty, no stored chunks to compare")
+        return report
+    records = collection.get(ids=[ids[row] for row in sample_rows(len(ids), sample)],
+                             include=["documents", "embeddings"])
+    stored_dim = len(records["embeddings"][0]) if len(records["embeddings"]) else fingerprint["embedding_dim"]
+    if stored_dim != fingerprint["embedding_dim"]:
+        raise FingerprintError(f"{collection.name} stores {stored_dim}-dim embeddings, the query embedder "
+                               f"is {report['query']}")
+    report["status"] = "agreement"
+    report["agreement"] = check_agreement(embedder, records["documents"], np.asarray(records["embeddings"]),
+                                          min_agreement)
+    return report
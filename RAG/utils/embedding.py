@@ -0,0 +1,175 @@
+"""
+Query embedding for the RAG proxy.
+
+Runs the CPU-bound embedding forward pass off the event loop:
+- Dedicated thread pool for encode calls (torch releases the GIL)
+- Cross-request micro-batching: queries arriving within a short window
+  are coalesced into a single encode() batch
+- Batch-size and queue-wait histograms for tuning
+
+Usage:
+    batcher = EmbeddingBatcher(lambda texts: embedder.encode(texts), max_batch_size=16)
+    await batcher.start()
+    vector = await batcher.encode("What are Elena's personality traits?")
+"""
+
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Sequence
+
+import numpy as np
+
+from .metrics import Histogram
+
+BATCH_SIZE_BUCKETS = [1, 2, 4, 8, 16, 32, 64]
+QUEUE_WAIT_MS_BUCKETS = [0.5, 1, 2, 5, 10, 25, 50, 100, 250, 1000]
+
+
+class EmbeddingBatcher:
+    """Coalesce concurrent query encodes into batched forward passes on a worker pool"""
+
+    def __init__(self, encode_fn: Callable[[List[str]], np.ndarray],
+                 max_batch_size: int = 16, max_wait_ms: float = 5.0,
+                 num_workers: int = 1):
+        """
+        Args:
+            encode_fn: Blocking function mapping a list of texts to an (n, dim) array
+            max_batch_size: Maximum queries per encode() call
+            max_wait_ms: How long the first query in a batch waits for companions
+            num_workers: Encode calls allowed to run in parallel
+        """
+        self.encode_fn = encode_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self.num_workers = max(1, num_workers)
+
+        self.batch_sizes = Histogram(
+            "embed_batch_size", BATCH_SIZE_BUCKETS,
+            "Queries per encode() call"
+        )
+        self.queue_wait_ms = Histogram(
+            "embed_queue_wait_ms", QUEUE_WAIT_MS_BUCKETS,
+            "Time a query waited before its batch was dispatched (ms)"
+        )
+        self.encode_ms = Histogram(
+            "embed_encode_ms", QUEUE_WAIT_MS_BUCKETS,
+            "Duration of one batched encode() call (ms)"
+        )
+        self.total_queries = 0
+        self.total_batches = 0
+
+        self._executor = None
+        self._queue = None
+        self._slots = None
+        self._collector = None
+        self._inflight = set()
+
+    async def start(self):
+        """Start the worker pool and the batch collector task"""
+        self._executor = ThreadPoolExecutor(max_workers=self.num_workers, thread_name_prefix="embed")
+        self._queue = asyncio.Queue()
+        self._slots = asyncio.Semaphore(self.num_workers)
+        self._collector = asyncio.create_task(self._collect_batches())
+
+    async def stop(self):
+        """Stop collecting and shut down the worker pool"""
+        if self._collector:
+            self._collector.cancel()
+            try:
+                await self._collector
+            except asyncio.CancelledError:
+                pass
+        if self._inflight:
+            await asyncio.gather(*self._inflight, return_exceptions=True)
+        if self._executor:
+            self._executor.shutdown(wait=False)
+
+    async def encode(self, text: str) -> np.ndarray:
+        """
+        Embed one query, batched with any concurrent callers.
+
+        Args:
+            text: Query text
+
+        Returns:
+            1-D embedding vector
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((text, future, time.perf_counter()))
+        return await future
+
+    async def encode_many(self, texts: Sequence[str]) -> List[np.ndarray]:
+        """Embed several queries (each joins the shared batching queue)"""
+        return list(await asyncio.gather(*[self.encode(t) for t in texts]))
+
+    async def _collect_batches(self):
+        """Group queued queries into batches and dispatch them to the pool"""
+        loop = asyncio.get_running_loop()
+        while True:
+            # Wait for a free worker first: while all workers are busy, new
+            # queries accumulate in the queue and form larger batches
+            await self._slots.acquire()
+            try:
+                batch = [await self._queue.get()]
+                deadline = loop.time() + self.max_wait
+                while len(batch) < self.max_batch_size:
+                    if not self._queue.empty():
+                        batch.append(self._queue.get_nowait())
+                        continue
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                    except asyncio.TimeoutError:
+                        break
+            except BaseException:
+                self._slots.release()
+                raise
+
+            task = asyncio.create_task(self._run_batch(batch))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _run_batch(self, batch):
+        """Encode one batch on the worker pool and resolve its futures"""
+        dispatched = time.perf_counter()
+        for _, _, enqueued in batch:
+            self.queue_wait_ms.observe((dispatched - enqueued) * 1000)
+        self.batch_sizes.observe(len(batch))
+
+        texts = [text for text, _, _ in batch]
+        try:
+            vectors = await asyncio.get_running_loop().run_in_executor(self._executor, self.encode_fn, texts)
+            self.encode_ms.observe((time.perf_counter() - dispatched) * 1000)
+            self.total_batches += 1
+            self.total_queries += len(batch)
+            for (_, future, _), vector in zip(batch, vectors):
+                if not future.done():
+                    future.set_result(vector)
+        except Exception as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            self._slots.release()
+
+    def stats(self) -> dict:
+        """
+        Batching statistics for the /stats endpoint.
+
+        Returns:
+            Dictionary with totals, configuration and histogram snapshots
+        """
+        return {
+            "queries": self.total_queries,
+            "batches": self.total_batches,
+            "mean_batch_size": round(self.total_queries / self.total_batches, 2) if self.total_batches else 0.0,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "workers": self.num_workers,
+            "batch_size_histogram": self.batch_sizes.snapshot(),
+            "queue_wait_ms_histogram": self.queue_wait_ms.snapshot(),
+            "encode_ms_histogram": self.encode_ms.snapshot()
+        }
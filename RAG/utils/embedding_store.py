@@ -0,0 +1,205 @@
+"""
+Memory-mappable embedding store written by setup/2_embed_and_store.py.
+
+One binary file per collection, readable zero-copy with np.memmap so several
+proxy processes share a single page-cached copy and cold start does not
+depend on collection size.
+
+File layout (little-endian):
+    [0:8]    magic b"RAGSTORE"
+    [8:16]   uint64 header length in bytes
+    [16:..]  header JSON (format version, name, count, dim, dtype, space,
+             collection metadata, section table)
+    padding to 64-byte boundary, then the data sections, each 64-byte aligned:
+      matrix        (count, dim) float32 or float16, row-major
+      sq_norms      (count,) float32 squared L2 norm of each row
+      id_offsets    (count + 1,) uint64 offsets into ids blob
+      ids           UTF-8 chunk ids, concatenated
+      text_offsets  (count + 1,) uint64 offsets into texts blob
+      texts         UTF-8 chunk texts, concatenated
+      meta_offsets  (count + 1,) uint64 offsets into metas blob
+      metas         UTF-8 JSON metadata per chunk, concatenated
+
+Section offsets in the header are relative to the start of the data area.
+Texts and metadata are decoded only for the rows a query returns.
+"""
+
+import json
+import os
+import struct
+from pathlib import Path
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+
+MAGIC = b"RAGSTORE"
+FORMAT_VERSION = 1
+ALIGNMENT = 64
+STORE_SUFFIX = ".store"
+
+DTYPES = {"float32": "<f4", "float16": "<f2"}
+
+
+def store_path(store_dir: Path, collection_name: str) -> Path:
+    """Path of the embedding store file for a collection"""
+    return Path(store_dir) / f"{collection_name}{STORE_SUFFIX}"
+
+
+def _align(offset: int) -> int:
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def _string_table(strings: Sequence[str]):
+    """Encode strings as (uint64 offsets, concatenated UTF-8 blob)"""
+    encoded = [s.encode("utf-8") for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype="<u8")
+    if encoded:
+        offsets[1:] = np.cumsum([len(e) for e in encoded])
+    return offsets.tobytes(), b"".join(encoded)
+
+
+def write_store(path: Path, name: str, ids: Sequence[str], embeddings: np.ndarray,
+                documents: Sequence[str], metadatas: Sequence[Dict],
+                metadata: Optional[Dict] = None, space: str = "l2",
+                dtype: str = "float32") -> Dict:
+    """
+    Write an embedding store file (atomically, via a temporary file).
+
+    Args:
+        path: Output file path
+        name: Collection name
+        ids: Chunk ids (row order)
+        embeddings: (n, dim) embedding matrix
+        documents: Chunk texts (row order)
+        metadatas: Chunk metadata dicts (row order)
+        metadata: Collection-level metadata (generation, created_at, ...)
+        space: Distance space of the collection ("l2", "cosine" or "ip")
+        dtype: Matrix storage dtype ("float32" or "float16")
+
+    Returns:
+        Header dictionary that was written
+    """
+    if dtype not in DTYPES:
+        raise ValueError(f"Unsupported store dtype: {dtype}")
+
+    matrix = np.ascontiguousarray(embeddings, dtype=DTYPES[dtype])
+    if matrix.ndim != 2 or len(matrix) != len(ids):
+        raise ValueError(f"Embedding matrix shape {matrix.shape} does not match {len(ids)} ids")
+    sq_norms = (matrix.astype(np.float32) ** 2).sum(axis=1).astype("<f4")
+
+    id_offsets, id_blob = _string_table(ids)
+    text_offsets, text_blob = _string_table(documents)
+    meta_offsets, meta_blob = _string_table(
+        [json.dumps(m, ensure_ascii=False, sort_keys=True) for m in metadatas]
+    )
+
+    sections = [
+        ("matrix", matrix.tobytes()),
+        ("sq_norms", sq_norms.tobytes()),
+        ("id_offsets", id_offsets),
+        ("ids", id_blob),
+        ("text_offsets", text_offsets),
+        ("texts", text_blob),
+        ("meta_offsets", meta_offsets),
+        ("metas", meta_blob),
+    ]
+
+    table = {}
+    offset = 0
+    for section_name, data in sections:
+        table[section_name] = [offset, len(data)]
+        offset = _align(offset + len(data))
+
+    header = {
+        "format_version": FORMAT_VERSION,
+        "name": name,
+        "count": int(matrix.shape[0]),
+        "dim": int(matrix.shape[1]),
+        "dtype": dtype,
+        "space": space,
+        "metadata": metadata or {},
+        "sections": table,
+    }
+    header_bytes = json.dumps(header, ensure_ascii=False).encode("utf-8")
+    data_start = _align(16 + len(header_bytes))
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<Q", len(header_bytes)))
+        f.write(header_bytes)
+        for section_name, data in sections:
+            f.seek(data_start + table[section_name][0])
+            f.write(data)
+        f.truncate(data_start + offset)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+    return header
+
+
+def read_header(path: Path) -> Dict:
+    """Read and validate the header of an embedding store file"""
+    with open(path, "rb") as f:
+        if f.read(8) != MAGIC:
+            raise ValueError(f"Not an embedding store file: {path}")
+        (header_len,) = struct.unpack("<Q", f.read(8))
+        header = json.loads(f.read(header_len).decode("utf-8"))
+    if header.get("format_version") != FORMAT_VERSION:
+        raise ValueError(f"Unsupported embedding store format {header.get('format_version')} in {path}")
+    header["data_start"] = _align(16 + header_len)
+    return header
+
+
+class StringTable(Sequence):
+    """Lazy view of strings stored as offsets + UTF-8 blob (decoded on access)"""
+
+    def __init__(self, offsets: np.ndarray, blob: np.ndarray, decode=None):
+        self.offsets = offsets
+        self.blob = blob
+        self.decode = decode
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        text = self.blob[int(self.offsets[i]):int(self.offsets[i + 1])].tobytes().decode("utf-8")
+        return self.decode(text) if self.decode else text
+
+
+class EmbeddingStore:
+    """Zero-copy view of an embedding store file (np.memmap)"""
+
+    def __init__(self, path: Path):
+        """
+        Args:
+            path: Store file written by write_store()
+        """
+        self.path = Path(path)
+        self.header = read_header(self.path)
+        self.name = self.header["name"]
+        self.metadata = self.header.get("metadata", {})
+        self.space = self.header["space"]
+        self._buffer = np.memmap(self.path, dtype=np.uint8, mode="r")
+
+        count, dim = self.header["count"], self.header["dim"]
+        self.matrix = self._section("matrix", DTYPES[self.header["dtype"]]).reshape(count, dim)
+        self.sq_norms = self._section("sq_norms", "<f4")
+        self.ids = StringTable(self._section("id_offsets", "<u8"), self._section("ids", np.uint8))
+        self.documents = StringTable(self._section("text_offsets", "<u8"), self._section("texts", np.uint8))
+        self.metadatas = StringTable(
+            self._section("meta_offsets", "<u8"), self._section("metas", np.uint8), decode=json.loads
+        )
+
+    def _section(self, name: str, dtype) -> np.ndarray:
+        offset, nbytes = self.header["sections"][name]
+        start = self.header["data_start"] + offset
+        return self._buffer[start:start + nbytes].view(dtype)
+
+    def __len__(self) -> int:
+        return self.header["count"]
@@ -0,0 +1,239 @@
+"""
+BM25 inverted index for hybrid (lexical + dense) retrieval.
+
+Character names, ship names and invented terms ("Arcturian", "Prometheus")
+are matched poorly by dense embeddings alone. setup/2_embed_and_store.py
+builds this index next to the embedding store (embeddings/<collection>.bm25.npz)
+and the proxy fuses both rankings with reciprocal rank fusion (RRF).
+
+Layout (NumPy .npz, array-backed postings):
+    term_offsets  (V + 1,) int64   postings of term t: [term_offsets[t], term_offsets[t + 1])
+    doc_rows      (P,) int32       chunk row of each posting
+    weights       (P,) float32     precomputed BM25 term weight of each posting
+    vocab_*       sorted vocabulary (UTF-8 blob + offsets)
+    ids_*         chunk ids in row order (UTF-8 blob + offsets)
+    header        JSON (count, k1, b, collection metadata)
+
+BM25 weights depend only on the corpus, so a query is a handful of array
+slices added into one score vector - well under a millisecond at our size.
+"""
+
+import json
+import math
+import os
+import re
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+LEXICAL_SUFFIX = ".bm25.npz"
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+RRF_K = 60  # Reciprocal rank fusion constant
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset("""
+a an and are as at be but by do does for from had has have he her his how i in is it its
+me my of on or our she so that the their them then there they this to was we were what
+when where which who why will with you your about tell describe
+""".split())
+
+
+def lexical_index_path(store_dir: Path, collection_name: str) -> Path:
+    """Path of the BM25 index file for a collection"""
+    return Path(store_dir) / f"{collection_name}{LEXICAL_SUFFIX}"
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens without stopwords and single characters"""
+    return [t for t in TOKEN_PATTERN.findall(text.lower()) if len(t) > 1 and t not in STOPWORDS]
+
+
+def _pack_strings(strings: Sequence[str]):
+    encoded = [s.encode("utf-8") for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    if encoded:
+        offsets[1:] = np.cumsum([len(e) for e in encoded])
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+
+def _unpack_strings(blob: np.ndarray, offsets: np.ndarray) -> List[str]:
+    data = blob.tobytes()
+    return [data[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(len(offsets) - 1)]
+
+
+class LexicalIndex:
+    """BM25 inverted index with array-backed postings"""
+
+    def __init__(self, ids: List[str], vocab: List[str], term_offsets: np.ndarray,
+                 doc_rows: np.ndarray, weights: np.ndarray, metadata: Optional[Dict] = None,
+                 k1: float = BM25_K1, b: float = BM25_B):
+        """
+        Args:
+            ids: Chunk ids (row order)
+            vocab: Sorted vocabulary
+            term_offsets: (V + 1,) postings offsets per term
+            doc_rows: (P,) chunk row per posting
+            weights: (P,) BM25 weight per posting
+            metadata: Collection-level metadata (generation, created_at, ...)
+        """
+        self.ids = ids
+        self.vocab = vocab
+        self.term_ids = {term: i for i, term in enumerate(vocab)}
+        self.term_offsets = term_offsets
+        self.doc_rows = doc_rows
+        self.weights = weights
+        self.metadata = metadata or {}
+        self.k1 = k1
+        self.b = b
+
+    def count(self) -> int:
+        return len(self.ids)
+
+    @property
+    def nbytes(self) -> int:
+        return self.term_offsets.nbytes + self.doc_rows.nbytes + self.weights.nbytes
+
+    @classmethod
+    def build(cls, ids: Sequence[str], documents: Sequence[str], metadata: Optional[Dict] = None,
+              k1: float = BM25_K1, b: float = BM25_B) -> "LexicalIndex":
+        """
+        Build the index over chunk texts.
+
+        Args:
+            ids: Chunk ids (row order)
+            documents: Chunk texts (row order)
+            metadata: Collection-level metadata stored with the index
+            k1, b: BM25 parameters
+
+        Returns:
+            LexicalIndex
+        """
+        term_freqs = [Counter(tokenize(doc)) for doc in documents]
+        doc_lengths = np.array([sum(tf.values()) for tf in term_freqs], dtype=np.float32)
+        avg_length = float(doc_lengths.mean()) if len(doc_lengths) and doc_lengths.mean() > 0 else 1.0
+
+        postings: Dict[str, List[Tuple[int, int]]] = {}
+        for row, tf in enumerate(term_freqs):
+            for term, freq in tf.items():
+                postings.setdefault(term, []).append((row, freq))
+
+        vocab = sorted(postings)
+        n = len(documents)
+        term_offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+        doc_rows, weights = [], []
+        for t, term in enumerate(vocab):
+            rows = np.array([row for row, _ in postings[term]], dtype=np.int32)
+            freqs = np.array([freq for _, freq in postings[term]], dtype=np.float32)
+            idf = math.log(1 + (n - len(rows) + 0.5) / (len(rows) + 0.5))
+            norm = k1 * (1 - b + b * doc_lengths[rows] / avg_length)
+            doc_rows.append(rows)
+            weights.append((idf * freqs * (k1 + 1) / (freqs + norm)).astype(np.float32))
+            term_offsets[t + 1] = term_offsets[t] + len(rows)
+
+        return cls(
+            list(ids), vocab, term_offsets,
+            np.concatenate(doc_rows) if doc_rows else np.zeros(0, dtype=np.int32),
+            np.concatenate(weights) if weights else np.zeros(0, dtype=np.float32),
+            metadata=metadata, k1=k1, b=b
+        )
+
+    def save(self, path: Path):
+        """Write the index (atomically, via a temporary file)"""
+        vocab_blob, vocab_offsets = _pack_strings(self.vocab)
+        ids_blob, ids_offsets = _pack_strings(self.ids)
+        header = {"count": len(self.ids), "k1": self.k1, "b": self.b, "metadata": self.metadata}
+
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(path.name + ".tmp")
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f,
+                header=np.frombuffer(json.dumps(header).encode("utf-8"), dtype=np.uint8),
+                term_offsets=self.term_offsets,
+                doc_rows=self.doc_rows,
+                weights=self.weights,
+                vocab_blob=vocab_blob,
+                vocab_offsets=vocab_offsets,
+                ids_blob=ids_blob,
+                ids_offsets=ids_offsets
+            )
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: Path) -> "LexicalIndex":
+        """Load an index written by save()"""
+        with np.load(path) as data:
+            header = json.loads(data["header"].tobytes().decode("utf-8"))
+            return cls(
+                _unpack_strings(data["ids_blob"], data["ids_offsets"]),
+                _unpack_strings(data["vocab_blob"], data["vocab_offsets"]),
+                data["term_offsets"], data["doc_rows"], data["weights"],
+                metadata=header.get("metadata"), k1=header["k1"], b=header["b"]
+            )
+
+    def search(self, query: str, top_k: int):
+        """
+        BM25 top-k for a query.
+
+        Returns:
+            (row indices, scores), best first; only chunks sharing a term with the query
+        """
+        term_ids = [self.term_ids[t] for t in set(tokenize(query)) if t in self.term_ids]
+        if not term_ids:
+            return np.array([], dtype=np.int64), np.array([], dtype=np.float32)
+
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        for t in term_ids:
+            start, end = self.term_offsets[t], self.term_offsets[t + 1]
+            scores[self.doc_rows[start:end]] += self.weights[start:end]
+
+        matched = np.flatnonzero(scores)
+        k = min(top_k, len(matched))
+        top = matched[np.argpartition(-scores[matched], k - 1)[:k]] if k < len(matched) else matched
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return top, scores[top]
+
+    def query_ids(self, query: str, top_k: int) -> List[str]:
+        """Chunk ids of the BM25 top-k, best first"""
+        rows, _ = self.search(query, top_k)
+        return [self.ids[i] for i in rows]
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[str]], k: int = RRF_K) -> List[Tuple[str, float]]:
+    """
+    Fuse ranked id lists: score(id) = sum over lists of 1 / (k + rank).
+
+    Returns:
+        (id, fused score) pairs, best first (ties keep first-seen order)
+    """
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, chunk_id in enumerate(ranking, 1):
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: -item[1])
+
+
+def load_lexical_index(collection, store_dir: Path) -> LexicalIndex:
+    """
+    Load a collection's BM25 index, checking it belongs to the same Step 2 build.
+
+    Raises:
+        ValueError: Index missing or out of date
+    """
+    path = lexical_index_path(store_dir, collection.name)
+    if not path.exists():
+        raise ValueError(f"Lexical index not found: {path}. Run setup/2_embed_and_store.py first.")
+    index = LexicalIndex.load(path)
+    expected = {k: (collection.metadata or {}).get(k) for k in ("generation", "created_at")}
+    found = {k: index.metadata.get(k) for k in ("generation", "created_at")}
+    if expected != found:
+        raise ValueError(f"Lexical index {path.name} is out of date (index {found}, "
+                         f"collection {expected}). Re-run setup/2_embed_and_store.py.")
+    return index
@@ -0,0 +1,188 @@
+"""
+Lightweight in-process metrics for the RAG proxy.
+
+Provides histograms and counters for latency, size and event counts:
+- Cumulative bucket counts (Prometheus-style "le" buckets)
+- Running sum and count for means
+- JSON-friendly snapshots for the /stats endpoint
+- Prometheus text exposition for the /metrics endpoint (same format vLLM
+  serves, so monitoring can scrape and chart both side by side)
+
+No external dependencies; safe to update from the event loop and worker threads.
+"""
+
+import threading
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Metric name prefix, mirrors vLLM's "vllm:" namespace
+NAMESPACE = "rag"
+
+
+def _format_labels(labels: Dict[str, str], extra: Optional[Dict[str, str]] = None) -> str:
+    merged = {**labels, **(extra or {})}
+    if not merged:
+        return ""
+    escaped = {k: str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+               for k, v in merged.items()}
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value))
+
+
+def format_metric(name: str, metric_type: str, description: str,
+                  samples: Iterable[Tuple[Dict[str, str], float]],
+                  namespace: str = NAMESPACE) -> str:
+    """
+    Prometheus text exposition for a metric computed at scrape time.
+
+    Args:
+        name: Metric name without namespace
+        metric_type: "counter" or "gauge"
+        description: HELP text
+        samples: (labels, value) pairs
+
+    Returns:
+        Exposition text block (HELP, TYPE and sample lines)
+    """
+    full_name = f"{namespace}:{name}"
+    lines = [f"# HELP {full_name} {description}", f"# TYPE {full_name} {metric_type}"]
+    for labels, value in samples:
+        lines.append(f"{full_name}{_format_labels(labels)} {_format_value(value)}")
+    return "\n".join(lines)
+
+
+class Histogram:
+    """Fixed-bucket histogram with cumulative counts"""
+
+    def __init__(self, name: str, buckets: Sequence[float], description: str = ""):
+        """
+        Args:
+            name: Metric name (e.g. "embed_batch_size")
+            buckets: Upper bounds in increasing order (+Inf is implicit)
+            description: Human-readable description
+        """
+        self.name = name
+        self.description = description
+        self.buckets: List[float] = sorted(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)  # Last slot = +Inf
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        """Record one observation"""
+        with self._lock:
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self._counts[i] += 1
+                    break
+            else:
+                self._counts[-1] += 1
+            self._sum += value
+            self._count += 1
+
+    @property
+    def count(self) -> int:
+        return self._count
+
+    @property
+    def sum(self) -> float:
+        return self._sum
+
+    def cumulative_counts(self) -> List[int]:
+        """Cumulative counts per bucket, last entry is +Inf (== count)"""
+        with self._lock:
+            counts = list(self._counts)
+        cumulative = []
+        running = 0
+        for c in counts:
+            running += c
+            cumulative.append(running)
+        return cumulative
+
+    def snapshot(self) -> Dict:
+        """
+        JSON-friendly view of the histogram.
+
+        Returns:
+            Dictionary with count, sum, mean and cumulative bucket counts
+        """
+        cumulative = self.cumulative_counts()
+        labels = [f"{b:g}" for b in self.buckets] + ["+Inf"]
+        return {
+            "count": self._count,
+            "sum": round(self._sum, 4),
+            "mean": round(self._sum / self._count, 4) if self._count else 0.0,
+            "buckets": dict(zip(labels, cumulative))
+        }
+
+    def render(self, namespace: str = NAMESPACE) -> str:
+        """Prometheus text exposition (_bucket, _sum, _count series)"""
+        full_name = f"{namespace}:{self.name}"
+        cumulative = self.cumulative_counts()
+        lines = [f"# HELP {full_name} {self.description}", f"# TYPE {full_name} histogram"]
+        for bound, count in zip(self.buckets + [float("inf")], cumulative):
+            le = "+Inf" if bound == float("inf") else f"{bound:g}"
+            lines.append(f'{full_name}_bucket{{le="{le}"}} {count}')
+        lines.append(f"{full_name}_sum {_format_value(self._sum)}")
+        lines.append(f"{full_name}_count {self._count}")
+        return "\n".join(lines)
+
+
+class Counter:
+    """Monotonic counter with optional labels"""
+
+    def __init__(self, name: str, description: str = "", labels: Sequence[str] = ()):
+        """
+        Args:
+            name: Metric name (e.g. "requests_total")
+            description: Human-readable description
+            labels: Label names; inc() must supply a value for each
+        """
+        self.name = name
+        self.description = description
+        self.label_names = tuple(labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        """Increase the counter (per label combination)"""
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        return self._values.get(key, 0.0)
+
+    def samples(self) -> List[Tuple[Dict[str, str], float]]:
+        with self._lock:
+            items = list(self._values.items())
+        if not items and not self.label_names:
+            items = [((), 0.0)]
+        return [(dict(zip(self.label_names, key)), value) for key, value in items]
+
+    def snapshot(self) -> Dict:
+        """JSON-friendly view (label values joined with '/')"""
+        return {"/".join(labels.values()) or "total": value for labels, value in self.samples()}
+
+    def render(self, namespace: str = NAMESPACE) -> str:
+        """Prometheus text exposition"""
+        return format_metric(self.name, "counter", self.description, self.samples(), namespace)
+
+
+def render_prometheus(metrics: Iterable, extra_blocks: Iterable[str] = ()) -> str:
+    """
+    Render histograms/counters plus precomputed blocks as one exposition document.
+
+    Args:
+        metrics: Histogram and Counter instances
+        extra_blocks: Text blocks from format_metric() (scrape-time values)
+
+    Returns:
+        Prometheus text exposition (text/plain; version=0.0.4)
+    """
+    blocks = [m.render() for m in metrics] + list(extra_blocks)
+    return "\n".join(blocks) + "\n"
@@ -0,0 +1,84 @@
+"""
+Maximal marginal relevance (MMR) re-selection of retrieved chunks.
+
+Neighbouring chunks share their 200-character overlap (setup/1_ingest.py), so
+plain top-k often returns near-duplicates. MMR over-fetches candidates and
+greedily picks chunks that are relevant to the query but dissimilar to the
+chunks already picked:
+
+    score(c) = lambda * sim(q, c) - (1 - lambda) * max_{s in selected} sim(c, s)
+
+All similarities come from one normalized candidate matrix product; each
+greedy step is a vector update, so 50 candidates -> 5 costs well under a
+millisecond.
+"""
+
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+MMR_CANDIDATES = 50   # Candidates fetched before re-selection
+MMR_LAMBDA = 0.5      # 1.0 = pure relevance, 0.0 = pure diversity
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def mmr_select(query_embedding: np.ndarray, candidate_embeddings: np.ndarray,
+               k: int, lambda_mult: float = MMR_LAMBDA) -> List[int]:
+    """
+    Pick k diverse, relevant candidates.
+
+    Args:
+        query_embedding: (dim,) query vector
+        candidate_embeddings: (n, dim) candidate vectors, in rank order
+        k: Number of candidates to keep
+        lambda_mult: Relevance/diversity trade-off (1.0 = plain top-k)
+
+    Returns:
+        Selected candidate indices, in selection order
+    """
+    candidates = _normalize(np.asarray(candidate_embeddings, dtype=np.float32))
+    n = len(candidates)
+    k = min(k, n)
+    if k <= 0:
+        return []
+
+    query = _normalize(np.asarray(query_embedding, dtype=np.float32).ravel())
+    relevance = candidates @ query
+    similarity = candidates @ candidates.T
+
+    selected = [int(np.argmax(relevance))]
+    max_similarity = similarity[selected[0]].copy()
+    available = np.ones(n, dtype=bool)
+    available[selected[0]] = False
+
+    while len(selected) < k:
+        scores = lambda_mult * relevance - (1 - lambda_mult) * max_similarity
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        np.maximum(max_similarity, similarity[best], out=max_similarity)
+
+    return selected
+
+
+def select_results(results: Dict, rows: Sequence[int]) -> Dict:
+    """
+    Subset of a ChromaDB-style single-query result (drops candidate embeddings).
+
+    Args:
+        results: query() result with one query (nested lists)
+        rows: Candidate indices to keep, in output order
+
+    Returns:
+        Result dict with ids/documents/metadatas/distances for the kept rows
+    """
+    return {
+        key: [[results[key][0][i] for i in rows]]
+        for key in ("ids", "documents", "metadatas", "distances")
+        if results.get(key) is not None
+    }
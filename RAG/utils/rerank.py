@@ -0,0 +1,152 @@
+"""
+Latency-bounded cross-encoder reranking for the RAG proxy.
+
+Second retrieval stage: the proxy over-fetches candidates from the search
+backend and a small cross-encoder scores every (query, chunk) pair in one
+batched forward pass on a dedicated CPU worker. The request waits at most
+the latency budget; if scoring has not finished by then, the first-stage
+order is used and the late scores are still cached for the next identical
+request. When every worker is busy, reranking is skipped outright so a
+backlog can never build up behind slow forward passes.
+
+Usage:
+    reranker = Reranker(lambda pairs: cross_encoder.predict(pairs), "cross-encoder/...", budget_ms=150)
+    await reranker.start()
+    results, outcome = await reranker.rerank(query, candidates, top_k=5)
+"""
+
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from .caches import LRUCache, normalize_query
+from .metrics import Counter, Histogram
+from .mmr import select_results
+
+RERANK_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+RERANK_CANDIDATES = 20     # First-stage hits scored by the cross-encoder
+RERANK_BUDGET_MS = 150.0   # Max time a request waits for scores
+RERANK_CACHE_SIZE = 1024   # Entries (candidate order per query + candidate set); 0 disables
+
+SCORE_MS_BUCKETS = [5, 10, 25, 50, 100, 150, 250, 500, 1000, 2500]
+
+OUTCOMES = ["reranked", "cached", "timeout", "busy", "error"]
+
+
+class Reranker:
+    """Cross-encoder reranking on a worker pool, with a per-request latency budget"""
+
+    def __init__(self, score_fn: Callable[[List[Tuple[str, str]]], np.ndarray], model_name: str,
+                 budget_ms: float = RERANK_BUDGET_MS, cache_size: int = RERANK_CACHE_SIZE,
+                 num_workers: int = 1):
+        """
+        Args:
+            score_fn: Blocking function mapping (query, document) pairs to relevance scores
+            model_name: Cross-encoder name (part of the cache key)
+            budget_ms: Max time a request waits for scores before falling back
+            cache_size: Cached candidate orders, 0 disables
+            num_workers: Scoring calls allowed to run (or wait past their budget) at once
+        """
+        self.score_fn = score_fn
+        self.model_name = model_name
+        self.budget = max(0.0, budget_ms) / 1000
+        self.num_workers = max(1, num_workers)
+        self.cache = LRUCache("rerank", max_entries=cache_size)
+
+        self.score_ms = Histogram(
+            "rerank_score_ms", SCORE_MS_BUCKETS,
+            "Duration of one batched cross-encoder forward pass (ms, incl. late ones)"
+        )
+        self.outcomes = Counter("rerank_total", "Rerank attempts by outcome", labels=("outcome",))
+
+        self._executor = None
+        self._running = 0
+
+    async def start(self):
+        """Start the worker pool"""
+        self._executor = ThreadPoolExecutor(max_workers=self.num_workers, thread_name_prefix="rerank")
+
+    async def stop(self):
+        """Shut down the worker pool (late scoring calls are abandoned)"""
+        if self._executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _score(self, query: str, documents: Sequence[str]) -> List[int]:
+        """Candidate indices ordered by cross-encoder score (blocking, runs on the pool)"""
+        start = time.perf_counter()
+        scores = np.asarray(self.score_fn([(query, doc) for doc in documents]), dtype=np.float32).ravel()
+        self.score_ms.observe((time.perf_counter() - start) * 1000)
+        return [int(i) for i in np.argsort(-scores, kind="stable")]
+
+    def _finish(self, key, task: asyncio.Future):
+        """Release the worker slot and cache the order (also for calls that overran the budget)"""
+        self._running -= 1
+        if not task.cancelled() and task.exception() is None:
+            self.cache.put(key, task.result())
+
+    async def rerank(self, query: str, results: Dict, top_k: int) -> Tuple[Dict, str]:
+        """
+        Rerank first-stage candidates within the latency budget.
+
+        Args:
+            query: Query text
+            results: ChromaDB-style single-query result (candidates, best first)
+            top_k: Number of chunks to keep
+
+        Returns:
+            (top_k results, outcome) - outcome is one of OUTCOMES; anything but
+            "reranked"/"cached" keeps the first-stage order
+        """
+        documents = results['documents'][0]
+        first_stage = list(range(min(top_k, len(documents))))
+        if len(documents) <= 1:
+            return select_results(results, first_stage), "reranked"
+
+        key = (self.model_name, normalize_query(query), tuple(results['ids'][0]))
+        order = self.cache.get(key)
+        if order is not None:
+            self.outcomes.inc(outcome="cached")
+            return select_results(results, order[:top_k]), "cached"
+
+        if self._running >= self.num_workers:
+            self.outcomes.inc(outcome="busy")
+            return select_results(results, first_stage), "busy"
+
+        self._running += 1
+        task = asyncio.get_running_loop().run_in_executor(self._executor, self._score, query, documents)
+        task.add_done_callback(lambda t: self._finish(key, t))
+        try:
+            order = await asyncio.wait_for(asyncio.shield(task), self.budget)
+        except asyncio.TimeoutError:
+            self.outcomes.inc(outcome="timeout")
+            return select_results(results, first_stage), "timeout"
+        except Exception as e:
+            print(f"[RERANK] Scoring failed, keeping first-stage order: {e}")
+            self.outcomes.inc(outcome="error")
+            return select_results(results, first_stage), "error"
+
+        self.outcomes.inc(outcome="reranked")
+        return select_results(results, order[:top_k]), "reranked"
+
+    def stats(self) -> dict:
+        """
+        Reranking statistics for the /stats endpoint.
+
+        Returns:
+            Dictionary with configuration, outcome counts, cache and timing snapshots
+        """
+        outcomes = {outcome: self.outcomes.value(outcome=outcome) for outcome in OUTCOMES}
+        attempts = sum(outcomes.values())
+        return {
+            "model": self.model_name,
+            "budget_ms": self.budget * 1000,
+            "workers": self.num_workers,
+            "outcomes": outcomes,
+            "fallback_rate": round((outcomes["timeout"] + outcomes["busy"] + outcomes["error"]) / attempts, 4)
+            if attempts else 0.0,
+            "cache": self.cache.stats(),
+            "score_ms_histogram": self.score_ms.snapshot()
+        }
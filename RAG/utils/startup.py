@@ -0,0 +1,86 @@
+"""
+Startup phase timing and readiness for the RAG proxy.
+
+The proxy accepts connections as soon as the process is up (GET /live) and
+loads its components in the background: the embedding model, the vector
+store with its search indexes, and the optional reranker load concurrently
+on worker threads, while vLLM is probed independently. A warm-up encode and
+search per collection then pays for lazy initialization (torch kernels, HNSW
+segment reads, page cache) before the first real query. Until loading is
+done and a vLLM backend answers, GET /ready and completion requests return
+503 + Retry-After.
+
+Usage:
+    startup = StartupTracker()
+    embedder, store = await asyncio.gather(startup.run("embedder", load_embedder),
+                                           startup.run("vector_store", load_store))
+    with startup.phase("warmup"):
+        ...
+    startup.mark_loaded()
+    startup.stats()   # start offset + duration per phase, time to loaded / ready
+"""
+
+import asyncio
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional
+
+
+class StartupTracker:
+    """Per-phase startup timings (relative to process start) and load/ready state"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases: Dict[str, Dict[str, float]] = {}  # Name -> start offset + duration (s)
+        self.loaded_s: Optional[float] = None  # Components loaded and warmed up
+        self.ready_s: Optional[float] = None   # First time loaded with a vLLM backend up
+        self.error: Optional[str] = None
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    @contextmanager
+    def phase(self, name: str):
+        """Time one startup phase (phases may overlap)"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = {
+                "start_s": round(start - self.started, 3),
+                "seconds": round(time.perf_counter() - start, 3)
+            }
+
+    async def run(self, name: str, load: Callable[..., Any], *args) -> Any:
+        """Run a blocking loader on a worker thread as one phase"""
+        with self.phase(name):
+            return await asyncio.to_thread(load, *args)
+
+    @property
+    def loaded(self) -> bool:
+        return self.loaded_s is not None
+
+    def mark_loaded(self):
+        self.loaded_s = round(self.elapsed(), 3)
+
+    def mark_ready(self):
+        """Record the first time the proxy became ready (later calls are no-ops)"""
+        if self.ready_s is None:
+            self.ready_s = round(self.elapsed(), 3)
+
+    def mark_failed(self, error: BaseException):
+        self.error = f"{type(error).__name__}: {error}"
+
+    def stats(self) -> Dict:
+        """
+        Startup statistics for the /ready and /stats endpoints.
+
+        Returns:
+            Dictionary with per-phase timings, time to loaded / ready and the startup error
+        """
+        return {
+            "phases": dict(sorted(self.phases.items(), key=lambda item: item[1]["start_s"])),
+            "loaded_s": self.loaded_s,
+            "ready_s": self.ready_s,
+            "error": self.error
+        }
@@ -0,0 +1,331 @@
+"""
+Pluggable vector search backends for the RAG proxy and benchmarks.
+
+Backends share ChromaDB's query interface so callers can swap them freely:
+    results = index.query(query_embeddings=[vector], n_results=5)
+    results['documents'][0], results['metadatas'][0], results['distances'][0]
+
+Available backends:
+- chroma: ChromaDB collection (HNSW index + SQLite for documents/metadata)
+- exact:  All embeddings, texts and metadata held in memory as a contiguous
+          matrix; exact top-k via one BLAS matrix-vector product + argpartition
+- mmap:   Same exact search over the embedding store file written by
+          setup/2_embed_and_store.py, opened zero-copy with np.memmap
+          (shared page cache across processes, cold start independent of size)
+
+At our corpus size (tens of thousands of chunks at most) exact search is
+faster and more predictable than HNSW, and it returns the true nearest
+neighbours. Distances use the collection's space ("l2" by default, i.e.
+squared L2), so scores match the Chroma backend.
+"""
+
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from .embedding_store import EmbeddingStore, store_path
+
+BACKENDS = ["chroma", "exact", "mmap"]
+
+# Rows fetched per collection.get() call when loading the exact index
+LOAD_PAGE_SIZE = 1000
+
+# Rows scored per block when the matrix is stored as float16
+# (NumPy has no fp16 BLAS, so blocks are upcast to float32)
+FP16_BLOCK_ROWS = 8192
+
+
+class _MatrixIndex:
+    """Exact nearest-neighbour search over an embedding matrix (shared by exact/mmap)"""
+
+    name: str
+    metadata: Dict
+    space: str
+    matrix: np.ndarray      # (n, dim) float32 or float16
+    sq_norms: np.ndarray    # (n,) float32 squared row norms
+    ids: Sequence[str]
+    documents: Sequence[str]
+    metadatas: Sequence[Dict]
+
+    def count(self) -> int:
+        return len(self.ids)
+
+    @property
+    def nbytes(self) -> int:
+        return self.matrix.nbytes
+
+    def _scores(self, query: np.ndarray) -> np.ndarray:
+        """Dot products of every row with the query"""
+        if self.matrix.dtype == np.float32:
+            return self.matrix @ query
+        return np.concatenate([
+            self.matrix[i:i + FP16_BLOCK_ROWS].astype(np.float32) @ query
+            for i in range(0, len(self.matrix), FP16_BLOCK_ROWS)
+        ])
+
+    def search(self, query: np.ndarray, top_k: int):
+        """
+        Exact top-k search for one query vector.
+
+        Returns:
+            (row indices, distances), both ordered best first
+        """
+        query = np.asarray(query, dtype=np.float32).ravel()
+        dots = self._scores(query)
+        if self.space == "l2":
+            distances = self.sq_norms - 2 * dots + float(query @ query)
+        elif self.space == "cosine":
+            row_norms = np.sqrt(np.maximum(self.sq_norms, 1e-24))
+            distances = 1.0 - dots / (row_norms * max(float(np.linalg.norm(query)), 1e-12))
+        else:
+            distances = 1.0 - dots
+
+        k = min(top_k, len(distances))
+        if k <= 0:
+            return np.array([], dtype=np.int64), np.array([], dtype=np.float32)
+        if k < len(distances):
+            top = np.argpartition(distances, k - 1)[:k]
+        else:
+            top = np.arange(len(distances))
+        top = top[np.argsort(distances[top], kind="stable")]
+        return top, distances[top]
+
+    def query(self, query_embeddings: Sequence, n_results: int = 5,
+              include: Optional[Sequence[str]] = None, **kwargs) -> Dict:
+        """ChromaDB-compatible query (nested lists, one entry per query)"""
+        with_embeddings = include is not None and "embeddings" in include
+        results = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        if with_embeddings:
+            results["embeddings"] = []
+        for query in query_embeddings:
+            rows, distances = self.search(query, n_results)
+            results["ids"].append([self.ids[i] for i in rows])
+            results["documents"].append([self.documents[i] for i in rows])
+            results["metadatas"].append([self.metadatas[i] for i in rows])
+            results["distances"].append([float(d) for d in distances])
+            if with_embeddings:
+                results["embeddings"].append(self.matrix[rows].astype(np.float32))
+        return results
+
+    def get(self, ids: Sequence[str], include: Optional[Sequence[str]] = None, **kwargs) -> Dict:
+        """ChromaDB-compatible get by id (flat lists; unknown ids are skipped)"""
+        if getattr(self, "_rows", None) is None:
+            self._rows = {chunk_id: row for row, chunk_id in enumerate(self.ids)}
+        rows = [self._rows[chunk_id] for chunk_id in ids if chunk_id in self._rows]
+        return {
+            "ids": [self.ids[i] for i in rows],
+            "documents": [self.documents[i] for i in rows],
+            "metadatas": [self.metadatas[i] for i in rows]
+        }
+
+
+class ExactIndex(_MatrixIndex):
+    """In-memory exact nearest-neighbour search over a contiguous embedding matrix"""
+
+    def __init__(self, name: str, ids: List[str], embeddings: np.ndarray,
+                 documents: List[str], metadatas: List[Dict],
+                 space: str = "l2", metadata: Optional[Dict] = None,
+                 dtype=np.float32):
+        """
+        Args:
+            name: Collection name
+            ids: Chunk ids (row order)
+            embeddings: (n, dim) embedding matrix
+            documents: Chunk texts (row order)
+            metadatas: Chunk metadata dicts (row order)
+            space: Distance space - "l2" (squared L2), "cosine" or "ip"
+            metadata: Collection-level metadata (version, fingerprint, ...)
+            dtype: Storage dtype for the matrix (float32 or float16)
+        """
+        if space not in ("l2", "cosine", "ip"):
+            raise ValueError(f"Unsupported distance space: {space}")
+
+        self.name = name
+        self.metadata = metadata or {}
+        self.space = space
+        self.ids = list(ids)
+        self.documents = list(documents)
+        self.metadatas = list(metadatas)
+
+        matrix = np.asarray(embeddings, dtype=np.float32)
+        if matrix.ndim != 2:
+            matrix = matrix.reshape(len(self.ids), -1)
+        self.matrix = np.ascontiguousarray(matrix, dtype=dtype)
+        self.sq_norms = (self.matrix.astype(np.float32) ** 2).sum(axis=1)
+
+    @classmethod
+    def from_collection(cls, collection, dtype=np.float32) -> "ExactIndex":
+        """
+        Load every embedding, document and metadata entry from a Chroma collection.
+
+        Args:
+            collection: ChromaDB collection
+            dtype: Storage dtype for the matrix
+
+        Returns:
+            ExactIndex holding the full collection in memory
+        """
+        total = collection.count()
+        ids, documents, metadatas, blocks = [], [], [], []
+        for offset in range(0, total, LOAD_PAGE_SIZE):
+            page = collection.get(
+                include=["embeddings", "documents", "metadatas"],
+                limit=LOAD_PAGE_SIZE,
+                offset=offset
+            )
+            ids.extend(page["ids"])
+            documents.extend(page["documents"])
+            metadatas.extend(page["metadatas"])
+            blocks.append(np.asarray(page["embeddings"], dtype=np.float32))
+
+        embeddings = np.vstack(blocks) if blocks else np.zeros((0, 0), dtype=np.float32)
+        metadata = dict(collection.metadata or {})
+        return cls(
+            collection.name, ids, embeddings, documents, metadatas,
+            space=metadata.get("hnsw:space", "l2"), metadata=metadata, dtype=dtype
+        )
+
+
+class MmapIndex(_MatrixIndex):
+    """Exact search over a memory-mapped embedding store file (zero-copy)"""
+
+    def __init__(self, path: Path):
+        """
+        Args:
+            path: Embedding store file written by setup/2_embed_and_store.py
+        """
+        self.store = EmbeddingStore(path)
+        self.path = self.store.path
+        self.name = self.store.name
+        self.metadata = self.store.metadata
+        self.space = self.store.space
+        self.matrix = self.store.matrix
+        self.sq_norms = self.store.sq_norms
+        self.ids = self.store.ids
+        self.documents = self.store.documents
+        self.metadatas = self.store.metadatas
+
+
+def load_index(collection, backend: str = "chroma", dtype: str = "float32",
+               store_dir: Optional[Path] = None):
+    """
+    Build the search backend for a Chroma collection.
+
+    Args:
+        collection: ChromaDB collection (source of truth)
+        backend: "chroma" (query the collection), "exact" (in-memory matrix)
+                 or "mmap" (memory-mapped embedding store file)
+        dtype: Matrix storage dtype for the exact backend
+        store_dir: Directory holding embedding store files (mmap backend)
+
+    Returns:
+        Object exposing query(query_embeddings, n_results), count() and name
+    """
+    if backend == "chroma":
+        return collection
+    if backend == "mmap":
+        path = store_path(store_dir, collection.name)
+        if not path.exists():
+            raise ValueError(f"Embedding store not found: {path}. Run setup/2_embed_and_store.py first.")
+        start = time.perf_counter()
+        index = MmapIndex(path)
+        elapsed = time.perf_counter() - start
+        # Store must come from the same build as the collection
+        expected = {k: (collection.metadata or {}).get(k) for k in ("generation", "created_at")}
+        found = {k: index.metadata.get(k) for k in ("generation", "created_at")}
+        if expected != found:
+            raise ValueError(f"Embedding store {path.name} is out of date (store {found}, "
+                             f"collection {expected}). Re-run setup/2_embed_and_store.py.")
+        print(f"[INDEX] Embedding store mapped: {index.count()} chunks, "
+              f"{index.nbytes / 1e6:.1f} MB ({index.matrix.dtype}) in {elapsed * 1000:.1f}ms")
+        return index
+    if backend == "exact":
+        start = time.perf_counter()
+        index = ExactIndex.from_collection(collection, dtype=np.dtype(dtype))
+        elapsed = time.perf_counter() - start
+        print(f"[INDEX] Exact index loaded: {index.count()} chunks, "
+              f"{index.nbytes / 1e6:.1f} MB ({dtype}) in {elapsed:.2f}s")
+        return index
+    raise ValueError(f"Unknown backend '{backend}' (choose from {BACKENDS})")
+
+
+def backend_name(index) -> str:
+    """Backend name of a search index returned by load_index()"""
+    if isinstance(index, MmapIndex):
+        return "mmap"
+    return "exact" if isinstance(index, ExactIndex) else "chroma"
+
+
+def fetch_by_ids(index, ids: Sequence[str]) -> Dict[str, tuple]:
+    """
+    Documents and metadata for chunk ids (any backend).
+
+    Returns:
+        {chunk id: (document, metadata)} for the ids that exist
+    """
+    if not ids:
+        return {}
+    page = index.get(ids=list(ids), include=["documents", "metadatas"])
+    return {
+        chunk_id: (document, metadata)
+        for chunk_id, document, metadata in zip(page["ids"], page["documents"], page["metadatas"])
+    }
+
+
+def normalized_distance(distance: float, space: str) -> float:
+    """
+    Distance on a common 1 - cosine scale, comparable across collections.
+
+    Assumes unit-norm embeddings (bge-large-en-v1.5 normalizes its output),
+    for which squared L2 = 2 - 2 * cosine.
+    """
+    return distance / 2 if space == "l2" else distance
+
+
+def merge_results(results_list: Sequence[Dict], spaces: Sequence[str], names: Sequence[str]) -> Dict:
+    """
+    Merge single-query results from several collections, best first.
+
+    Hits are ordered by normalized distance; hits without a distance (BM25-only
+    hybrid hits) follow in their collection's order. Ids are prefixed with the
+    collection name ("characters/chunk_12") since chunk ids repeat across collections.
+
+    Returns:
+        ChromaDB-style single-query result (ids/documents/metadatas/distances)
+    """
+    hits = []
+    for results, space, name in zip(results_list, spaces, names):
+        for i, distance in enumerate(results['distances'][0]):
+            score = normalized_distance(distance, space) if distance is not None else float("inf")
+            hits.append((score, len(hits), name, results, i))
+    hits.sort(key=lambda hit: hit[:2])
+
+    return {
+        "ids": [[f"{name}/{results['ids'][0][i]}" for _, _, name, results, i in hits]],
+        "documents": [[results['documents'][0][i] for _, _, _, results, i in hits]],
+        "metadatas": [[results['metadatas'][0][i] for _, _, _, results, i in hits]],
+        "distances": [[results['distances'][0][i] for _, _, _, results, i in hits]]
+    }
+
+
+def timed_query(index, query_embedding: np.ndarray, top_k: int, include_embeddings: bool = False):
+    """
+    Run one search and measure its latency.
+
+    Args:
+        include_embeddings: Also return the hits' embeddings (results["embeddings"])
+
+    Returns:
+        (results, elapsed milliseconds)
+    """
+    start = time.perf_counter()
+    if include_embeddings:
+        results = index.query(
+            query_embeddings=[query_embedding.tolist()], n_results=top_k,
+            include=["documents", "metadatas", "distances", "embeddings"]
+        )
+    else:
+        results = index.query(query_embeddings=[query_embedding.tolist()], n_results=top_k)
+    return results, (time.perf_counter() - start) * 1000
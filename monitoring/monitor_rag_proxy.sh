@@ -4,7 +4,7 @@ set -euo pipefail
 ################################################################################
 # Monitor RAG Proxy Server
 ################################################################################
-# Purpose: Watch RAG proxy logs and stats in real-time
+# Purpose: Watch RAG proxy health, stats and stage latency (/metrics) in real-time
 #
 # Usage: ./monitor_rag_proxy.sh
 ################################################################################
@@ -65,6 +65,31 @@ show_activity() {
     echo ""
 }
 
+# Mean of a Prometheus histogram (sum / count) in milliseconds
+metric_mean_ms() {
+    echo "$1" | awk -v name="$2" '
+        $1 == name "_sum" { sum = $2 }
+        $1 == name "_count" { count = $2 }
+        END { if (count > 0) printf "%.1f", sum / count * 1000; else printf "-" }'
+}
+
+# Function to show per-stage latency from /metrics
+show_metrics() {
+    echo -e "${BLUE}Stage Latency (mean since start):${NC}"
+    
+    METRICS=$(curl -s http://localhost:8001/metrics 2>/dev/null || true)
+    if [ -n "$METRICS" ]; then
+        echo "  Embed: $(metric_mean_ms "$METRICS" rag:embed_seconds) ms | Search: $(metric_mean_ms "$METRICS" rag:search_seconds) ms | Assembly: $(metric_mean_ms "$METRICS" rag:context_assembly_seconds) ms"
+        echo "  Upstream TTFT: $(metric_mean_ms "$METRICS" rag:upstream_ttft_seconds) ms | Upstream total: $(metric_mean_ms "$METRICS" rag:upstream_seconds) ms | Proxy overhead: $(metric_mean_ms "$METRICS" rag:proxy_overhead_seconds) ms"
+        ERRORS=$(echo "$METRICS" | awk '/^rag:errors_total/ { n += $2 } END { print int(n) }')
+        echo "  Errors: $ERRORS"
+    else
+        echo "  (Metrics endpoint unavailable)"
+    fi
+    
+    echo ""
+}
+
 # Initial check
 check_health
 
@@ -77,5 +102,6 @@ echo ""
 while true; do
     check_health
     show_activity
+    show_metrics
     sleep 10
 done
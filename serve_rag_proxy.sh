@@ -34,12 +34,12 @@ echo ""
 
 # Check if vLLM is running
 echo "[CHECK] Testing vLLM server..."
-if ! curl -s http://localhost:8000/health > /dev/null 2>&1; then
-    echo "[ERROR] vLLM server not responding on port 8000"
-    echo "   Start it with: ./serve_vllm.sh"
-    exit 1
+if curl -s http://localhost:8000/health > /dev/null 2>&1; then
+    echo "[OK] vLLM server is running"
+else
+    echo "[WARN] vLLM server not responding on port 8000 - starting anyway"
+    echo "   Requests get 503 until it is up (GET /ready); start it with: ./serve_vllm.sh"
 fi
-echo "[OK] vLLM server is running"
 echo ""
 
 # Check if RAG environment exists